@@ -0,0 +1,140 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+
+"""Decoding the interleaved XA ADPCM streams of VGS files."""
+
+import numpy
+
+# This decoder is based on VAG-Depack by bITmASTER
+
+# Prediction filter coefficients selected by the upper nibble of a block header
+FILTERS = numpy.array([[          0.0,          0.0],
+                       [  60.0 / 64.0,          0.0],
+                       [ 115.0 / 64.0, -52.0 / 64.0],
+                       [  98.0 / 64.0, -55.0 / 64.0],
+                       [ 122.0 / 64.0, -60.0 / 64.0],
+                       [          0.0,          0.0],
+                       [          0.0,          0.0],
+                       [          0.0,          0.0]])
+
+BLOCK_SIZE    = 16
+BLOCK_SAMPLES = 28
+MAX_STREAMS   = 8
+
+def _getResponses():
+  # The output of a block is linear in its samples and in the last two
+  # outputs of the previous block of the stream. Find the matrix mapping
+  # the samples to the output when the previous outputs are zero, and the
+  # output for each of the previous outputs alone.
+  responses = numpy.zeros((len(FILTERS), BLOCK_SAMPLES, BLOCK_SAMPLES))
+  carries   = numpy.zeros((len(FILTERS), BLOCK_SAMPLES, 2))
+  for n, (c1, c2) in enumerate(FILTERS):
+    impulse = numpy.zeros(BLOCK_SAMPLES)
+    s_1, s_2 = 0.0, 0.0
+    for i in range(BLOCK_SAMPLES):
+      impulse[i] = (i == 0) + c1 * s_1 + c2 * s_2
+      s_1, s_2 = impulse[i], s_1
+    for i in range(BLOCK_SAMPLES):
+      responses[n, i:, i] = impulse[:BLOCK_SAMPLES - i]
+    for k in range(2):
+      s_1, s_2 = float(k == 0), float(k == 1)
+      for i in range(BLOCK_SAMPLES):
+        carries[n, i, k] = c1 * s_1 + c2 * s_2
+        s_1, s_2 = carries[n, i, k], s_1
+  return responses, carries
+
+RESPONSES, CARRIES = _getResponses()
+
+def unpackBlocks(blocks):
+  """
+  Unpack the sample nibbles of XA ADPCM blocks.
+
+  @param blocks:  uint8 array with one 16 byte block per row
+  @return:        (float64 array of 28 samples per block before prediction,
+                   filter index of each block)
+  """
+  header  = blocks[:, 0]
+  data    = blocks[:, 2:].astype(numpy.uint16)
+  nibbles = numpy.empty((len(blocks), BLOCK_SAMPLES), numpy.uint16)
+  nibbles[:, 0::2] = data & 0xf
+  nibbles[:, 1::2] = data >> 4
+  shift   = (header & 0xf).astype(numpy.int16)[:, numpy.newaxis]
+  samples = (nibbles << 12).view(numpy.int16) >> shift
+  return samples.astype(numpy.float64), (header >> 4) & 7
+
+class XaDecoder(object):
+  """
+  Decoder for up to eight XA ADPCM streams interleaved block by block.
+
+  The prediction filter is applied to whole blocks with matrix products,
+  so only the last two outputs of each block are carried from one block
+  to the next in a loop.
+  """
+  def __init__(self):
+    self.state    = [(0.0, 0.0)] * MAX_STREAMS
+    self.finished = False
+
+  def decode(self, data):
+    """
+    Decode the next blocks of the streams. Decoding stops at the first
+    block marking the end of the streams.
+
+    @param data:  Bytes holding a whole number of blocks
+    @return:      List of (stream id, int16 sample array) pairs
+    """
+    if self.finished:
+      return []
+    blocks = numpy.frombuffer(data, numpy.uint8).reshape(-1, BLOCK_SIZE)
+    flags  = blocks[:, 1]
+    end    = numpy.flatnonzero((flags == 7) | (flags >= 0x80))
+    if len(end):
+      blocks = blocks[:end[0]]
+      self.finished = True
+
+    streamIds = flags[:len(blocks)] % MAX_STREAMS
+    results   = []
+    for streamId in numpy.unique(streamIds):
+      samples, filters = unpackBlocks(blocks[streamIds == streamId])
+      results.append((int(streamId), self._predict(int(streamId), samples, filters)))
+    return results
+
+  def _predict(self, streamId, samples, filters):
+    output = numpy.empty_like(samples)
+    for n in numpy.unique(filters):
+      mask = filters == n
+      output[mask] = samples[mask] @ RESPONSES[n].T
+
+    # Carry the last two outputs from block to block
+    last   = output[:, -1].tolist()
+    second = output[:, -2].tolist()
+    a = CARRIES[filters][:, [-1, -2]].reshape(-1, 4).tolist()
+    s_1, s_2 = self.state[streamId]
+    carried  = []
+    for i in range(len(last)):
+      carried.append((s_1, s_2))
+      a11, a12, a21, a22 = a[i]
+      s_1, s_2 = last[i] + a11 * s_1 + a12 * s_2, second[i] + a21 * s_1 + a22 * s_2
+    self.state[streamId] = (s_1, s_2)
+
+    carried = numpy.array(carried).reshape(-1, 2)
+    output += numpy.einsum("bik,bk->bi", CARRIES[filters], carried)
+    return numpy.clip(numpy.trunc(output + .5), -32768, 32767).astype(numpy.int16).reshape(-1)
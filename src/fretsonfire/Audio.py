@@ -21,12 +21,23 @@
 
 import pygame
 from . import Log
+from . import Config
+from . import Vorbis
 import sys
+import os
+import wave
+import queue
+import threading
+import numpy
 from .Task import Task
 
+Config.define("audio", "streamchunksize", int, 16384)
+Config.define("audio", "streamdepth",     int, 4)
+
 class Audio(Task):
   def __init__(self):
     Task.__init__(self)
+    self.bufferSize = None
 
   def pre_open(self, frequency = 22050, bits = 16, stereo = True, bufferSize = 1024):
     pygame.mixer.pre_init(frequency, -bits, stereo and 2 or 1, bufferSize)
@@ -44,9 +55,25 @@ class Audio(Task):
       Log.warn("Audio setup failed. Trying with default configuration.")
       pygame.mixer.init()
 
+    self.bufferSize = bufferSize
     Log.debug("Audio configuration: %s" % str(pygame.mixer.get_init()))
     return True
 
+  def getDeviceKey(self):
+    """
+    @return:  String identifying the output device and the mixer
+              configuration, which together determine the output latency
+    """
+    try:
+      from pygame._sdl2 import audio
+      devices = audio.get_audio_device_names(False)
+    except Exception:
+      devices = []
+    driver = os.environ.get("SDL_AUDIODRIVER", "default")
+    device = devices[0] if devices else "default"
+    frequency, bits, channels = pygame.mixer.get_init() or (0, 0, 0)
+    return "%s/%s/%d/%d/%d" % (driver, device, frequency, channels, self.bufferSize or 0)
+
   def getChannelCount(self):
     return pygame.mixer.get_num_channels()
 
@@ -116,8 +143,11 @@ class Channel(object):
     self.channel.fadeout(time)
 
 class Sound(object):
-  def __init__(self, fileName):
-    self.sound   = pygame.mixer.Sound(fileName)
+  def __init__(self, fileName = None, buffer = None):
+    if buffer is not None:
+      self.sound = pygame.mixer.Sound(buffer = buffer)
+    else:
+      self.sound = pygame.mixer.Sound(fileName)
 
   def play(self, loops = 0):
     self.sound.play(loops)
@@ -131,7 +161,237 @@ class Sound(object):
   def fadeout(self, time):
     self.sound.fadeout(time)
 
+class WaveFile(object):
+  """A 16 bit wave file read a piece at a time."""
+  def __init__(self, fileName):
+    self.file = wave.open(fileName, "rb")
+    if self.file.getsampwidth() != 2:
+      self.file.close()
+      raise IOError("Unsupported sample size in %s" % fileName)
+    self.channels  = self.file.getnchannels()
+    self.frequency = self.file.getframerate()
+
+  def getLength(self):
+    return self.file.getnframes()
+
+  def seek(self, sample):
+    self.file.setpos(sample)
+
+  def read(self, samples):
+    return numpy.frombuffer(self.file.readframes(samples), "<i2").reshape(-1, self.channels)
+
+  def close(self):
+    self.file.close()
+
+class DecodedFile(object):
+  """A sound file decoded completely by the mixer, for formats that can't be read a piece at a time."""
+  def __init__(self, fileName):
+    self.frequency, bits, self.channels = pygame.mixer.get_init()
+    samples = pygame.sndarray.array(pygame.mixer.Sound(fileName)).reshape(-1, self.channels)
+    if bits > 0:
+      samples = samples.astype(numpy.int32) - (1 << (bits - 1))
+    self.samples  = (samples.astype(numpy.int32) << (16 - abs(bits))).astype(numpy.int16)
+    self.position = 0
+
+  def getLength(self):
+    return len(self.samples)
+
+  def seek(self, sample):
+    self.position = sample
+
+  def read(self, samples):
+    data = self.samples[self.position:self.position + samples]
+    self.position += len(data)
+    return data
+
+  def close(self):
+    self.samples = None
+
+def openDecoder(fileName):
+  """
+  Open a sound file for decoding a piece at a time.
+
+  @param fileName:  Sound file name
+  @return:          Object with channels and frequency attributes and
+                    read(samples), seek(sample), getLength() and close() methods
+  """
+  extension = os.path.splitext(fileName)[1].lower()
+  if extension == ".ogg" and Vorbis.isAvailable():
+    return Vorbis.VorbisFile(fileName)
+  elif extension == ".wav":
+    try:
+      return WaveFile(fileName)
+    except (IOError, wave.Error):
+      pass
+  return DecodedFile(fileName)
+
+class Resampler(object):
+  """Linear interpolation between sample rates over consecutive pieces of a stream."""
+  def __init__(self, fromFrequency, toFrequency):
+    self.step     = float(fromFrequency) / toFrequency
+    self.position = 0.0
+    self.previous = None
+
+  def __call__(self, samples):
+    if self.previous is not None:
+      samples = numpy.concatenate([self.previous, samples])
+    if not len(samples):
+      return samples
+    # The last sample is kept for interpolating towards the next piece
+    last      = len(samples) - 1
+    positions = numpy.arange(self.position, last, self.step)
+    indices   = numpy.arange(len(samples))
+    result    = numpy.empty((len(positions), samples.shape[1]), numpy.int16)
+    for c in range(samples.shape[1]):
+      result[:, c] = numpy.round(numpy.interp(positions, indices, samples[:, c]))
+    self.position = (positions[-1] + self.step if len(positions) else self.position) - last
+    self.previous = samples[-1:]
+    return result
+
+def convertSamples(samples, format):
+  """
+  Convert 16 bit samples to the mixer format.
+
+  @param samples:   int16 array with one column per channel
+  @param format:    Mixer (frequency, format, channels) tuple
+  @return:          Array of samples ready for a mixer sound buffer
+  """
+  frequency, bits, channels = format
+  if samples.shape[1] != channels:
+    mono    = samples.mean(axis = 1, keepdims = True).astype(numpy.int16)
+    samples = numpy.repeat(mono, channels, axis = 1)
+  if abs(bits) == 8:
+    samples = samples >> 8
+    samples = (samples + 128).astype(numpy.uint8) if bits > 0 else samples.astype(numpy.int8)
+  elif bits > 0:
+    samples = (samples.astype(numpy.int32) + 32768).astype(numpy.uint16)
+  return numpy.ascontiguousarray(samples)
+
 class StreamingSound(Sound, Task):
-  def __init__(self, engine, channel, fileName):
-    Sound.__init__(self, fileName)
+  """
+  A sound decoded on a background thread while it is playing.
+
+  The decoding thread keeps a limited number of chunks ready in a queue
+  and L{run}, called by the engine once per frame, queues them on the
+  mixer channel, so only a few chunks of the sound are in memory at a time.
+  """
+  def __init__(self, engine, channel, fileName, chunkSize = None, depth = None):
+    """
+    @param engine:     Game engine
+    @param channel:    L{Channel} to play the sound on
+    @param fileName:   Sound file name
+    @param chunkSize:  Samples per channel in each chunk, or None to use the configured size
+    @param depth:      Number of chunks decoded ahead, or None to use the configured depth
+    """
+    Task.__init__(self)
+    self.engine     = engine
+    self.channel    = channel.channel
+    self.fileName   = fileName
+    self.chunkSize  = chunkSize or engine.config.get("audio", "streamchunksize")
+    self.depth      = depth     or engine.config.get("audio", "streamdepth")
+    self.volume     = 1.0
+    self.playing    = False
+    self.decoder    = openDecoder(fileName)
+    self.thread     = None
+    self.prepared   = False
+    self.firstChunk = None
+
+  def _startDecoding(self):
+    self.chunks   = queue.Queue(self.depth)
+    self.stopping = threading.Event()
+    self.thread   = threading.Thread(target = self._decode, args = (self.chunks, self.stopping))
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _stopDecoding(self):
+    if self.thread:
+      self.stopping.set()
+      self.thread.join()
+      self.thread = None
+
+  def _put(self, chunks, stopping, chunk):
+    while not stopping.is_set():
+      try:
+        chunks.put(chunk, timeout = .1)
+        return
+      except queue.Full:
+        pass
+
+  def _decode(self, chunks, stopping):
+    format    = pygame.mixer.get_init()
+    resampler = None
+    if self.decoder.frequency != format[0]:
+      resampler = Resampler(self.decoder.frequency, format[0])
+    try:
+      while not stopping.is_set():
+        samples = self.decoder.read(self.chunkSize)
+        if not len(samples):
+          break
+        if resampler:
+          samples = resampler(samples)
+        samples = convertSamples(samples, format)
+        self._put(chunks, stopping, pygame.mixer.Sound(buffer = samples.tobytes()))
+    except Exception as e:
+      Log.warn("Unable to decode %s: %s" % (self.fileName, e))
+    # Mark the end of the stream
+    self._put(chunks, stopping, None)
+
+  def prepare(self):
+    """
+    Start decoding from the beginning and wait for the first chunk, so
+    that a following L{play} starts without delay.
+    """
+    if self.playing or self.prepared:
+      return
+    self._stopDecoding()
+    self.decoder.seek(0)
+    self._startDecoding()
+    self.firstChunk = self.chunks.get()
+    self.prepared   = True
+
+  def play(self):
+    if self.playing:
+      return
+    self.prepare()
+    chunk = self.firstChunk
+    self.firstChunk = None
+    self.prepared   = False
+    if chunk is None:
+      return
+    self.channel.play(chunk)
+    self.channel.set_volume(self.volume)
+    self.playing = True
+    self.engine.addTask(self, synchronized = False)
+
+  def run(self, ticks):
+    if not self.playing or self.channel.get_queue() is not None:
+      return
+    try:
+      chunk = self.chunks.get_nowait()
+    except queue.Empty:
+      return
+    if chunk is None:
+      # The channel finishes the last chunk on its own
+      self._halt()
+      return
+    # An idle channel starts playing the queued chunk right away
+    self.channel.queue(chunk)
+
+  def _halt(self):
+    self.playing    = False
+    self.prepared   = False
+    self.firstChunk = None
+    self.engine.removeTask(self)
+    self._stopDecoding()
 
+  def stop(self):
+    self._halt()
+    self.channel.stop()
+
+  def setVolume(self, volume):
+    self.volume = volume
+    self.channel.set_volume(volume)
+
+  def fadeout(self, time):
+    self._halt()
+    self.channel.fadeout(time)
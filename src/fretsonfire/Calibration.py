@@ -0,0 +1,224 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+
+"""Measuring the audio and input latency by tapping along to a click track."""
+
+import os
+import json
+import time
+
+import numpy
+import pygame
+
+from . import Log
+from . import Audio
+from .Resource import getWritableResourcePath
+
+# Click track layout in milliseconds
+CLICK_COUNT  = 24
+CLICK_PERIOD = 750
+CLICK_START  = 1000
+CLICK_LENGTH = 40
+
+# Offsets further than this many deviations from the median are ignored
+OUTLIER_DEVIATIONS = 3.0
+# Offsets closer than this to the median in milliseconds are always kept
+OUTLIER_TOLERANCE  = 15.0
+# Fewest accepted key presses needed for an estimate
+MIN_PRESSES        = 8
+
+def makeClickTrack(format, count = CLICK_COUNT, period = CLICK_PERIOD, start = CLICK_START):
+  """
+  Synthesize a metronome click track. Every fourth click is accented.
+
+  @param format:  Mixer (frequency, format, channels) tuple
+  @param count:   Number of clicks
+  @param period:  Time between the clicks in milliseconds
+  @param start:   Time of the first click in milliseconds
+  @return:        (samples in the mixer format, list of click times in milliseconds)
+  """
+  frequency, bits, channels = format
+  clickTimes = [start + n * period for n in range(count)]
+  length     = (clickTimes[-1] + period) * frequency // 1000 if count else 0
+  samples    = numpy.zeros(length, numpy.float32)
+
+  t = numpy.arange(CLICK_LENGTH * frequency // 1000, dtype = numpy.float32) / frequency
+  envelope = numpy.exp(-t * 150.0)
+  for n, clickTime in enumerate(clickTimes):
+    pitch = 1500.0 if n % 4 == 0 else 1000.0
+    first = clickTime * frequency // 1000
+    click = numpy.sin(2 * numpy.pi * pitch * t) * envelope
+    samples[first:first + len(click)] = click[:length - first]
+
+  samples = (samples * 24000).astype(numpy.int16)[:, numpy.newaxis]
+  return Audio.convertSamples(samples, format), clickTimes
+
+def estimateLatency(clickTimes, pressTimes):
+  """
+  Estimate the combined output and input latency from the key presses of
+  a player tapping along to a click track.
+
+  Each press is paired with the click closest to it after accounting for
+  the typical offset, only the first press for each click is used, and
+  presses far from the typical offset are rejected as outliers.
+
+  @param clickTimes:  Sorted click times in milliseconds
+  @param pressTimes:  Key press times in milliseconds on the same clock
+  @return:            (latency, standard deviation, number of presses used)
+                      in milliseconds, or None if there are too few good presses
+  """
+  clicks  = numpy.asarray(clickTimes, numpy.float64)
+  presses = numpy.sort(numpy.asarray(pressTimes, numpy.float64))
+  if len(clicks) == 0 or len(presses) < MIN_PRESSES:
+    return None
+
+  # Pair again after the first guess so that latencies longer than half
+  # the click period don't get paired with the next click
+  shift = 0.0
+  for i in range(2):
+    shifted = presses - shift
+    after   = numpy.clip(numpy.searchsorted(clicks, shifted), 0, len(clicks) - 1)
+    before  = numpy.clip(after - 1, 0, len(clicks) - 1)
+    nearest = numpy.where(numpy.abs(shifted - clicks[before]) <= numpy.abs(shifted - clicks[after]), before, after)
+    nearest, first = numpy.unique(nearest, return_index = True)
+    offsets = presses[first] - clicks[nearest]
+    shift   = numpy.median(offsets)
+
+  deviation = 1.4826 * numpy.median(numpy.abs(offsets - shift))
+  offsets   = offsets[numpy.abs(offsets - shift) <= max(OUTLIER_DEVIATIONS * deviation, OUTLIER_TOLERANCE)]
+  if len(offsets) < MIN_PRESSES:
+    return None
+  return float(offsets.mean()), float(offsets.std()), len(offsets)
+
+class LatencyCalibration(object):
+  """Plays a click track and records the key presses of the player."""
+  def __init__(self, count = CLICK_COUNT, period = CLICK_PERIOD, clock = None):
+    """
+    @param count:   Number of clicks
+    @param period:  Time between the clicks in milliseconds
+    @param clock:   Function returning the current time in milliseconds
+    """
+    self.clock     = clock or (lambda: time.perf_counter() * 1000.0)
+    format         = pygame.mixer.get_init()
+    samples, self.clickTimes = makeClickTrack(format, count, period)
+    self.sound     = Audio.Sound(buffer = memoryview(samples).cast("B"))
+    self.length    = len(samples) * 1000.0 / format[0]
+    self.startTime = None
+    self.presses   = []
+
+  def start(self):
+    """Start playing the click track and forget earlier presses."""
+    self.presses   = []
+    self.sound.play()
+    self.startTime = self.clock()
+
+  def stop(self):
+    self.sound.stop()
+
+  def getTime(self):
+    """@return: Time since the start of the click track in milliseconds"""
+    if self.startTime is None:
+      return 0.0
+    return self.clock() - self.startTime
+
+  def isDone(self):
+    return self.startTime is not None and self.getTime() >= self.length
+
+  def press(self):
+    """Record a key press at the current time."""
+    if self.startTime is not None and not self.isDone():
+      self.presses.append(self.getTime())
+
+  def getLatency(self):
+    """@return: Result of L{estimateLatency} for the recorded presses"""
+    return estimateLatency(self.clickTimes, self.presses)
+
+def getLatencyFile():
+  """@return: Name of the file holding the calibrated latency of each device"""
+  return os.path.join(getWritableResourcePath(), "latency.json")
+
+def loadLatencies(fileName = None):
+  """@return: Dictionary of calibrated latencies in milliseconds keyed by device"""
+  fileName = fileName or getLatencyFile()
+  if not os.path.isfile(fileName):
+    return {}
+  try:
+    with open(fileName, encoding = "utf-8") as f:
+      return dict(json.load(f))
+  except (IOError, OSError, ValueError, TypeError) as e:
+    Log.warn("Unable to read latency file %s: %s" % (fileName, e))
+    return {}
+
+def getLatency(deviceKey, fileName = None):
+  """
+  @param deviceKey:  Device key from L{Audio.Audio.getDeviceKey}
+  @return:           Calibrated latency of the device in milliseconds, or None
+  """
+  return loadLatencies(fileName).get(deviceKey)
+
+def setLatency(deviceKey, latency, fileName = None):
+  """
+  Store the calibrated latency of a device.
+
+  @param deviceKey:  Device key from L{Audio.Audio.getDeviceKey}
+  @param latency:    Latency in milliseconds
+  """
+  fileName  = fileName or getLatencyFile()
+  latencies = loadLatencies(fileName)
+  latencies[deviceKey] = int(round(latency))
+  _saveLatencies(latencies, fileName)
+
+def clearLatency(deviceKey, fileName = None):
+  """
+  Forget the calibrated latency of a device.
+
+  @param deviceKey:  Device key from L{Audio.Audio.getDeviceKey}
+  """
+  fileName  = fileName or getLatencyFile()
+  latencies = loadLatencies(fileName)
+  if latencies.pop(deviceKey, None) is not None:
+    _saveLatencies(latencies, fileName)
+
+def _saveLatencies(latencies, fileName):
+  try:
+    if not os.path.isdir(os.path.dirname(fileName)):
+      os.makedirs(os.path.dirname(fileName))
+    with open(fileName + ".tmp", "w", encoding = "utf-8") as f:
+      json.dump(latencies, f, indent = 2, sort_keys = True)
+    os.replace(fileName + ".tmp", fileName)
+  except (IOError, OSError) as e:
+    Log.warn("Unable to write latency file %s: %s" % (fileName, e))
+
+def clampDelay(config, delay):
+  """@return: Delay rounded to one of the values of the audio delay option"""
+  options = sorted(config.prototype["audio"]["delay"].options)
+  return min(max(int(round(delay)), options[0]), options[-1])
+
+def getDelay(engine):
+  """
+  @return:  A/V delay in milliseconds for the current audio device: the
+            calibrated latency if there is one, otherwise the configured delay
+  """
+  latency = getLatency(engine.audio.getDeviceKey())
+  if latency is None:
+    return engine.config.get("audio", "delay")
+  return latency
@@ -25,6 +25,8 @@ from dataclasses import dataclass, field
 from typing import Dict, Iterator, List, Optional, Tuple
 from xml.etree import ElementTree as ET
 
+import numpy
+
 COLLADA_NS = "http://www.collada.org/2005/11/COLLADASchema"
 _NS = f"{{{COLLADA_NS}}}"
 
@@ -39,21 +41,34 @@ def _strip(tag: str) -> str:
   return tag
 
 
-def _floats(text: Optional[str]) -> List[float]:
+def _floats(text: Optional[str], dtype=numpy.float32) -> numpy.ndarray:
   if not text:
-    return []
-  return [float(value) for value in text.split()]
+    return numpy.zeros(0, dtype)
+  # A whitespace separator matches any run of whitespace
+  return numpy.fromstring(text, dtype=dtype, sep=" ")
 
 
-def _ints(text: Optional[str]) -> List[int]:
+def _ints(text: Optional[str]) -> numpy.ndarray:
   if not text:
-    return []
-  return [int(value) for value in text.split()]
+    return numpy.zeros(0, numpy.int32)
+  return numpy.fromstring(text, dtype=numpy.int32, sep=" ")
+
+
+def _intLists(texts: List[Optional[str]]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+  """Parse several index lists at once, returning them concatenated and their lengths."""
+  texts = [text for text in texts if text and text.strip()]
+  if not texts:
+    return numpy.zeros(0, numpy.int32), numpy.zeros(0, numpy.int32)
+  # Indices are never negative, so -1 can mark where each list ends
+  values = _ints(" -1 ".join(texts) + " -1")
+  ends = numpy.flatnonzero(values < 0)
+  lengths = numpy.diff(numpy.concatenate(([-1], ends))) - 1
+  return values[values >= 0], lengths.astype(numpy.int32)
 
 
 @dataclass
 class FloatArray:
-  data: List[float]
+  data: numpy.ndarray
 
 
 @dataclass
@@ -73,6 +88,19 @@ class DaeSource:
   source: FloatArray
   techniqueCommon: DaeTechniqueCommon
 
+  def GetArray(self, components: Optional[int] = None) -> numpy.ndarray:
+    """
+    Return the elements of the source as a (count, components) view of its data.
+    Raises ValueError if the elements have fewer than C{components} values.
+    """
+    accessor = self.techniqueCommon.accessor
+    stride = max(accessor.stride, 1)
+    if components and components > stride:
+      raise ValueError("Source %s has %d components per element, %d requested." % (self.id, stride, components))
+    data = self.source.data
+    count = min(accessor.count, len(data) // stride)
+    return data[:count * stride].reshape(count, stride)[:, :components or stride]
+
 
 @dataclass
 class DaeInput:
@@ -96,10 +124,45 @@ class DaeVertices:
 @dataclass
 class DaePrimitive:
   inputs: List[DaeInput]
-  polygons: List[List[int]] = field(default_factory=list)
-  triangles: List[int] = field(default_factory=list)
+  indices: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, numpy.int32))
+  # Number of vertices in each polygon, or None for triangles
+  vcount: Optional[numpy.ndarray] = None
   material: Optional[str] = None
 
+  @property
+  def stride(self) -> int:
+    return max((input_desc.offset for input_desc in self.inputs), default=0) + 1
+
+  @property
+  def polygons(self) -> List[numpy.ndarray]:
+    if self.vcount is None:
+      return []
+    return numpy.split(self.indices, numpy.cumsum(self.vcount * self.stride)[:-1])
+
+  @property
+  def triangles(self) -> numpy.ndarray:
+    if self.vcount is not None:
+      return numpy.zeros(0, numpy.int32)
+    return self.indices
+
+  def Triangulate(self) -> numpy.ndarray:
+    """
+    Return the vertex index tuples of the primitive as a (vertices, stride)
+    array with three rows per triangle. Polygons are split into triangle
+    fans around their first vertex.
+    """
+    stride = self.stride
+    if self.vcount is None:
+      return self.indices[:len(self.indices) // (3 * stride) * 3 * stride].reshape(-1, stride)
+
+    vertices = self.indices[:len(self.indices) // stride * stride].reshape(-1, stride)
+    sizes = self.vcount[numpy.cumsum(self.vcount) <= len(vertices)]
+    starts = numpy.cumsum(sizes) - sizes
+    fans = numpy.maximum(sizes - 2, 0)
+    first = numpy.repeat(starts, fans)
+    second = first + numpy.arange(fans.sum()) - numpy.repeat(numpy.cumsum(fans) - fans, fans) + 1
+    return vertices[numpy.stack([first, second, second + 1], axis=1).reshape(-1)]
+
 
 @dataclass
 class DaeMesh:
@@ -272,31 +335,21 @@ class DaeDocument:
   def _parse_primitive(self, prim_elem: ET.Element, prim_type: str) -> DaePrimitive:
     inputs = [self._parse_input(input_elem) for input_elem in prim_elem.findall(_tag("input"))]
     material = prim_elem.attrib.get("material")
+    indices, lengths = _intLists([p_elem.text for p_elem in prim_elem.findall(_tag("p"))])
     if prim_type == "triangles":
-      indices: List[int] = []
-      for p_elem in prim_elem.findall(_tag("p")):
-        indices.extend(_ints(p_elem.text))
-      return DaePrimitive(inputs=inputs, triangles=indices, material=material)
+      return DaePrimitive(inputs=inputs, indices=indices, material=material)
 
-    polygons = [_ints(p_elem.text) for p_elem in prim_elem.findall(_tag("p"))]
-    return DaePrimitive(inputs=inputs, polygons=polygons, material=material)
+    stride = max((input_desc.offset for input_desc in inputs), default=0) + 1
+    return DaePrimitive(inputs=inputs, indices=indices, vcount=lengths // stride, material=material)
 
   def _parse_polylist(self, polylist_elem: ET.Element) -> List[DaePrimitive]:
     inputs = [self._parse_input(input_elem) for input_elem in polylist_elem.findall(_tag("input"))]
     vcount = _ints(polylist_elem.findtext(_tag("vcount")))
     indices = _ints(polylist_elem.findtext(_tag("p")))
-    if not vcount:
+    if not len(vcount):
       return []
 
-    stride = max((input_desc.offset for input_desc in inputs), default=0) + 1
-    cursor = 0
-    polygons: List[List[int]] = []
-    for count in vcount:
-      size = count * stride
-      polygons.append(indices[cursor:cursor + size])
-      cursor += size
-
-    return [DaePrimitive(inputs=inputs, polygons=polygons, material=polylist_elem.attrib.get("material"))]
+    return [DaePrimitive(inputs=inputs, indices=indices, vcount=vcount, material=polylist_elem.attrib.get("material"))]
 
   def _parse_lights(self, library_elem: Optional[ET.Element]) -> None:
     self.lightsLibrary.clear()
@@ -317,7 +370,7 @@ class DaeDocument:
     for child in tc_elem:
       light_type = _strip(child.tag)
       color_elem = child.find(_tag("color"))
-      values = _floats(color_elem.text if color_elem is not None else None)
+      values = _floats(color_elem.text if color_elem is not None else None, numpy.float64).tolist()
       if len(values) == 3:
         values.append(1.0)
       elif not values:
@@ -344,7 +397,7 @@ class DaeDocument:
     transforms: List[Tuple[str, List[float]]] = []
     for tag in ("translate", "rotate", "scale", "matrix", "lookat"):
       for trans_elem in node_elem.findall(_tag(tag)):
-        transforms.append((tag, _floats(trans_elem.text)))
+        transforms.append((tag, _floats(trans_elem.text, numpy.float64).tolist()))
 
     i_geometries: List[DaeGeometryInstance] = []
     for inst_elem in node_elem.findall(_tag("instance_geometry")):
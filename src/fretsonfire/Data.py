@@ -19,15 +19,18 @@
 # MA  02110-1301, USA.                                              #
 #####################################################################
 
-from .Font import Font
+from .Font import Font, DISTANCE_FIELD_SIZE
 from .Texture import Texture
 from .Svg import SvgDrawing, SvgContext
 from .Texture import Texture
-from .Audio import Sound
+from .SoundBank import SoundBank
 from .Language import _
+from .Resource import getWritableResourcePath
 import random
+import os
 from . import Language
 from . import Config
+from . import Log
 
 # these constants define a few customized letters in the default font
 STAR1 = '\x10'
@@ -37,6 +40,12 @@ RIGHT = '\x13'
 BALL1 = '\x14'
 BALL2 = '\x15'
 
+# Sound effects decoded into the sound bank
+SELECT_SOUNDS   = ["crunch1.ogg", "crunch2.ogg", "crunch3.ogg"]
+SCREW_UP_SOUNDS = ["fiba%d.ogg" % i for i in range(1, 7)]
+TAUNT_SOUNDS    = ["jurgen%d.ogg" % i for i in range(1, 6)] + ["myhero.ogg"] + ["perfect%d.ogg" % i for i in range(1, 4)]
+SOUND_EFFECTS   = ["in.ogg", "out.ogg", "start.ogg"] + SELECT_SOUNDS + SCREW_UP_SOUNDS + TAUNT_SOUNDS
+
 class Data(object):
   """A collection of globally used data resources such as fonts and sound effects."""
   def __init__(self, resource, svg):
@@ -61,34 +70,43 @@ class Data(object):
     fontSize  = [22, 108]
     
     if asciiOnly:
-      font    = resource.fileName("default.ttf")
-      bigFont = resource.fileName("title.ttf")
+      font    = resource.dataSource("default.ttf")
+      bigFont = resource.dataSource("title.ttf")
     else:
-      font    = \
-      bigFont = resource.fileName("international.ttf")
+      font    = resource.dataSource("international.ttf")
+      bigFont = resource.dataSource("international.ttf")
 
     # load fonts
-    font1     = lambda: Font(font,    fontSize[0], scale = scale, reversed = reversed, systemFont = not asciiOnly)
-    font2     = lambda: Font(bigFont, fontSize[1], scale = scale, reversed = reversed, systemFont = not asciiOnly)
+    sdf       = Config.get("video", "sdffonts")
+    font1     = lambda: Font(font,    fontSize[0], scale = scale, reversed = reversed, systemFont = not asciiOnly,
+                             distanceField = sdf, distanceFieldCache = self.getDistanceFieldFile(font))
+    font2     = lambda: Font(bigFont, fontSize[1], scale = scale, reversed = reversed, systemFont = not asciiOnly,
+                             distanceField = sdf, distanceFieldCache = self.getDistanceFieldFile(bigFont))
     resource.load(self, "font",         font1, onLoad = self.customizeFont)
     resource.load(self, "bigFont",      font2, onLoad = self.customizeFont)
 
     # load sounds
-    resource.load(self, "screwUpSounds", self.loadScrewUpSounds)
-    self.loadSoundEffect(self, "acceptSound",  "in.ogg")
-    self.loadSoundEffect(self, "cancelSound",  "out.ogg")
-    self.loadSoundEffect(self, "selectSound1", "crunch1.ogg")
-    self.loadSoundEffect(self, "selectSound2", "crunch2.ogg")
-    self.loadSoundEffect(self, "selectSound3", "crunch3.ogg")
-    self.loadSoundEffect(self, "startSound",   "start.ogg")
-
-  def loadSoundEffect(self, target, name, fileName):
-    volume   = Config.get("audio", "guitarvol")
-    fileName = self.resource.fileName(fileName)
-    self.resource.load(target, name, lambda: Sound(fileName), onLoad = lambda s: s.setVolume(volume))
-
-  def loadScrewUpSounds(self):
-    return [Sound(self.resource.fileName("fiba%d.ogg" % i)) for i in range(1, 7)]
+    self.effectVolume = Config.get("audio", "guitarvol")
+    resource.load(self, "soundBank", self.loadSoundBank, onLoad = self.soundBankLoaded)
+
+  def loadSoundBank(self):
+    sources  = [(name, self.resource.dataSource(name)) for name in SOUND_EFFECTS]
+    fileName = os.path.join(getWritableResourcePath(), "soundcache", "effects")
+    return SoundBank(sources, fileName, budget = Config.get("audio", "soundbudget") * 1024 * 1024)
+
+  def soundBankLoaded(self, soundBank):
+    Log.notice("Sound effects use %.1f MB." % (soundBank.getMemoryUsage() / 1048576.0))
+
+  def getSoundEffect(self, name, volume = None):
+    """
+    @param name:    File name of a sound effect in L{SOUND_EFFECTS}
+    @param volume:  Volume to set or None to leave it unchanged
+    @return:        L{Audio.Sound} instance
+    """
+    sound = self.soundBank.get(name)
+    if volume is not None:
+      sound.setVolume(volume)
+    return sound
     
   def loadSvgDrawing(self, target, name, fileName, textureSize = None):
     """
@@ -101,7 +119,7 @@ class Data(object):
                         be rendered to an x by y texture
     @return:            L{SvgDrawing} instance
     """
-    fileName = self.resource.fileName(fileName)
+    fileName = self.resource.dataSource(fileName)
     drawing  = self.resource.load(target, name, lambda: SvgDrawing(self.svg, fileName), synch = True)
     if textureSize:
       drawing.convertToTexture(textureSize[0], textureSize[1])
@@ -116,19 +134,71 @@ class Data(object):
     font.setCustomGlyph(RIGHT, self.right.texture)
     font.setCustomGlyph(BALL1, self.ball1.texture)
     font.setCustomGlyph(BALL2, self.ball2.texture)
+    self.prewarmFont(font)
+
+  def getAcceptSound(self):
+    return self.getSoundEffect("in.ogg", self.effectVolume)
+
+  def getCancelSound(self):
+    return self.getSoundEffect("out.ogg", self.effectVolume)
+
+  def getStartSound(self):
+    return self.getSoundEffect("start.ogg", self.effectVolume)
 
   def getSelectSound(self):
     """@return: A randomly chosen selection sound."""
-    return random.choice([self.selectSound1, self.selectSound2, self.selectSound3])
-
-  selectSound = property(getSelectSound)
+    return self.getSoundEffect(random.choice(SELECT_SOUNDS), self.effectVolume)
 
   def getScrewUpSound(self):
     """@return: A randomly chosen screw-up sound."""
-    return random.choice(self.screwUpSounds)
+    return self.getSoundEffect(random.choice(SCREW_UP_SOUNDS))
 
+  acceptSound  = property(getAcceptSound)
+  cancelSound  = property(getCancelSound)
+  startSound   = property(getStartSound)
+  selectSound  = property(getSelectSound)
   screwUpSound = property(getScrewUpSound)
 
+  def getFontCharacterFile(self, font):
+    """@return: Name of the file listing the characters drawn with a font in the current language"""
+    name = "%s-%d-%s.txt" % (os.path.basename(str(font.fileName)), font.size, Language.language or "default")
+    return os.path.join(getWritableResourcePath(), "fontcache", name)
+
+  def getDistanceFieldFile(self, source):
+    """@return: Name of the file caching the distance field glyphs of a typeface"""
+    name = "%s-sdf%d.npz" % (os.path.basename(str(getattr(source, "name", source))), DISTANCE_FIELD_SIZE)
+    return os.path.join(getWritableResourcePath(), "fontcache", name)
+
+  def prewarmFont(self, font):
+    """
+    Upload the glyphs a font is likely to need: ASCII, the characters of
+    the active translation and the characters drawn in earlier sessions.
+    """
+    characters = "".join(map(chr, range(32, 127))) + Language.getCatalogCharacters()
+    try:
+      with open(self.getFontCharacterFile(font), encoding = "utf-8") as f:
+        characters += f.read()
+    except (IOError, OSError, ValueError):
+      pass
+    font.prewarm(characters)
+    font.prewarmed = font.getCharacters()
+
+  def saveFontCharacters(self):
+    """Remember the characters and distance fields of each font so they can be pre-warmed next time."""
+    for font in (self.font, self.bigFont):
+      if font:
+        font.saveDistanceFields()
+      if not font or font.getCharacters() == font.prewarmed:
+        continue
+      fileName = self.getFontCharacterFile(font)
+      try:
+        if not os.path.isdir(os.path.dirname(fileName)):
+          os.makedirs(os.path.dirname(fileName))
+        with open(fileName, "w", encoding = "utf-8") as f:
+          f.write(font.getCharacters())
+      except (IOError, OSError) as e:
+        Log.warn("Unable to save font character set %s: %s" % (fileName, e))
+
   def essentialResourcesLoaded(self):
     """return: True if essential resources such as the font have been loaded."""
     return bool(self.font and self.bigFont)
@@ -21,10 +21,12 @@
 
 from OpenGL.GL import *
 from .View import Layer
+from .Font import TextBatch
 
 import gc
 import threading
 from . import Log
+from . import GLResource
 
 class DebugLayer(Layer):
   """A layer for showing some debug information."""
@@ -37,6 +39,7 @@ class DebugLayer(Layer):
   
   def render(self, visibility, topMost):
     self.engine.view.setOrthogonalProjection(normalize = True)
+    batch = TextBatch().begin()
     
     try:
       font = self.engine.data.font
@@ -86,12 +89,25 @@ class DebugLayer(Layer):
       font.render("%.2f fps" % self.engine.timer.fpsEstimate, (x + .1, y), scale = scale)
       y += h
       font.render("%d sessions, server %s" % (len(self.engine.sessions), self.engine.server and "on" or "off"), (x + .1, y), scale = scale)
+      y += h
+      cache = font.stringCache
+      font.render("text cache %d hits, %d misses, %d kB" % (cache.hits, cache.misses, cache.used // 1024), (x + .1, y), scale = scale)
+
+      x, y = (.5, .7)
+      font.render("GL memory:", (x, y), scale = scale)
+      registry = GLResource.registry
+      font.render("%.1f MB total, %d pending deletion" % (registry.totalSize() / 1048576.0, registry.pendingCount()), (x + .1, y), scale = scale)
+      y += h
+      for owner, count, size in registry.usage():
+        font.render("%s: %d objects, %.1f MB" % (owner, count, size / 1048576.0), (x + .1, y), scale = scale)
+        y += h
       #y += h
       #font.render("%d gc objects" % len(gc.get_objects()), (x + .1, y), scale = scale)
       #y += h
       #font.render("%d collected" % gc.collect(), (x + .1, y), scale = scale)
 
     finally:
+      batch.end()
       self.engine.view.resetProjection()
 
   def gcDump(self):
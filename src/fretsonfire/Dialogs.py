@@ -32,15 +32,19 @@ from .View import Layer, BackgroundLayer
 from .Input import KeyListener
 from .Camera import Camera
 from .Mesh import Mesh
+from .Font import TextBatch
 from .Menu import Menu
 from .Language import _
-from .Texture import Texture
+from .LabelCache import LabelCache
+from .Preview import PreviewCache, getPreviewClip
+from .SongList import SongList, SearchIndex
 from . import Theme
 from . import Log
 from . import Song
 from . import Data
 from . import Player
 from . import Guitar
+from . import Calibration
 
 def wrapText(font, pos, text, rightMargin = 0.9, scale = 0.002, visibility = 0.0, hide = 0, hidestring = ""):
   """
@@ -54,27 +58,14 @@ def wrapText(font, pos, text, rightMargin = 0.9, scale = 0.002, visibility = 0.0
   @param hide:        Hide text instead of line wrap
   """
   x, y = pos
-  space = font.getStringSize(" ", scale = scale)[0]
-  hidew, hideh = font.getStringSize(hidestring, scale = scale)
-  rightMargin = rightMargin - hidew
-  for n, word in enumerate(text.split(" ")):
-    w, h = font.getStringSize(word, scale = scale)
-    if x + w > rightMargin and hide:
-      word = hidestring
-    if (x + w > rightMargin and not hide) or word == "\n":
-      x = pos[0]
-      y += h
-    if word == "\n":
-      continue
-    glPushMatrix()
-    glRotate(visibility * (n + 1) * -45, 0, 0, 1)
-    font.render(word, (x, y + visibility * n), scale = scale)
-    glPopMatrix()
-    if x + w > rightMargin and hide:
-      x += hidew + space
-      break
-    x += w + space
-  return (x - space, y)
+  layout = font.layoutText(text, rightMargin - x, scale = scale, hide = hide, hideString = hidestring)
+  with TextBatch():
+    for n, word, wx, wy in layout.words:
+      glPushMatrix()
+      glRotate(visibility * (n + 1) * -45, 0, 0, 1)
+      font.render(word, (x + wx, y + wy + visibility * n), scale = scale)
+      glPopMatrix()
+  return (x + layout.end[0], y + layout.end[1])
 
 def fadeScreen(v):
   """
@@ -333,8 +324,13 @@ class SongChooser(Layer, KeyListener):
     self.cassetteWidth  = 4.0
     self.libraryHeight  = 1.2
     self.libraryWidth   = 4.0
-    self.itemAngles     = None
-    self.itemLabels     = None
+    self.itemList       = SongList()
+    self.searchIndex    = SearchIndex([])
+    self.labelFiles     = {}
+    self.labelCache     = LabelCache(self.engine.config.get("opengl", "labelcachesize") * 1024 * 1024,
+                                     uploadsPerFrame = self.engine.config.get("opengl", "labeluploads"))
+    self.previewCache   = PreviewCache()
+    self.previewClips   = {}
     self.selectedOffset = 0.0
     self.cameraOffset   = 0.0
     self.selectedItem   = None
@@ -349,15 +345,16 @@ class SongChooser(Layer, KeyListener):
     self.cassetteShow   = not self.engine.config.get("game", "compactlist")
     self.autoPreview    = self.engine.config.get("game", "autopreview")
     self.artistSort     = self.engine.config.get("game", "artistsort")
+    self.sortOrder      = Song.SORT_BY_ARTIST if self.artistSort else Song.SORT_BY_NAME
     # Use the default library if this one doesn't exist
     if not self.library or not os.path.isdir(self.engine.resource.fileName(self.library)):
       self.library = Song.DEFAULT_LIBRARY
 
     self.loadCollection()
-    self.engine.resource.load(self, "cassette",     lambda: Mesh(self.engine.resource.fileName("cassette.dae")), synch = True)
-    self.engine.resource.load(self, "label",        lambda: Mesh(self.engine.resource.fileName("label.dae")), synch = True)
-    self.engine.resource.load(self, "libraryMesh",  lambda: Mesh(self.engine.resource.fileName("library.dae")), synch = True)
-    self.engine.resource.load(self, "libraryLabel", lambda: Mesh(self.engine.resource.fileName("library_label.dae")), synch = True)
+    self.engine.resource.load(self, "cassette",     lambda: Mesh(self.engine.resource.dataSource("cassette.dae")), synch = True)
+    self.engine.resource.load(self, "label",        lambda: Mesh(self.engine.resource.dataSource("label.dae")), synch = True)
+    self.engine.resource.load(self, "libraryMesh",  lambda: Mesh(self.engine.resource.dataSource("library.dae")), synch = True)
+    self.engine.resource.load(self, "libraryLabel", lambda: Mesh(self.engine.resource.dataSource("library_label.dae")), synch = True)
     
     self.engine.loadSvgDrawing(self, "background", "cassette.svg")
 
@@ -367,15 +364,17 @@ class SongChooser(Layer, KeyListener):
     showLoadingScreen(self.engine, lambda: self.loaded, text = _("Browsing Collection..."))
 
   def libraryListLoaded(self, libraries):
-    self.engine.resource.load(self, "songs",     lambda: Song.getAvailableSongs(self.engine, self.library), onLoad = self.songListLoaded)
+    self.engine.resource.load(self, "songOrders", lambda: Song.getSongOrders(self.engine, self.library), onLoad = self.songListLoaded)
 
-  def songListLoaded(self, songs):
+  def songListLoaded(self, songOrders):
     if self.songLoader:
       self.songLoader.cancel()
     self.selectedIndex = 0
+    self.songs         = songOrders.getSongs(self.sortOrder)
     self.items         = self.libraries + self.songs
-    self.itemAngles    = [0.0] * len(self.items)
-    self.itemLabels    = [None] * len(self.items)
+    self.updateItemList()
+    self.labelFiles    = {}
+    self.previewClips  = {}
     self.loaded        = True
     self.searchText    = ""
     if self.initialItem is not None:
@@ -387,9 +386,7 @@ class SongChooser(Layer, KeyListener):
           self.selectedIndex =  i
           break
     # Load labels for libraries right away
-    for i, item in enumerate(self.items):
-      if isinstance(item, Song.LibraryInfo):
-        self.loadItemLabel(i)
+    self.labelCache.prefetch([self.getItemLabelFile(item) for item in self.items if isinstance(item, Song.LibraryInfo)])
     self.updateSelection()
     
   def shown(self):
@@ -402,6 +399,8 @@ class SongChooser(Layer, KeyListener):
     if self.song:
       self.song.fadeout(1000)
       self.song = None
+    self.labelCache.close()
+    self.previewCache.close()
     self.engine.input.removeKeyListener(self)
     self.engine.input.disableKeyRepeat()
     
@@ -412,22 +411,63 @@ class SongChooser(Layer, KeyListener):
   def getSelectedLibrary(self):
     return self.library
 
-  def loadItemLabel(self, i):
-    # Load the item label if it isn't yet loaded
-    item = self.items[i]
-    if self.itemLabels[i] is None:
+  def getItemLabelFile(self, item):
+    # Resolving the file name probes the data paths, so remember the result
+    key = id(item)
+    if key not in self.labelFiles:
       if isinstance(item, Song.SongInfo):
         label = self.engine.resource.fileName(self.library, item.songName,    "label.png")
       else:
         assert isinstance(item, Song.LibraryInfo)
         label = self.engine.resource.fileName(item.libraryName, "label.png")
-      if os.path.exists(label):
-        self.itemLabels[i] = Texture(label)
+      self.labelFiles[key] = label
+    return self.labelFiles[key]
+
+  def getItemPreviewClip(self, item):
+    # Finding the tracks probes the data paths, so remember the result
+    key = id(item)
+    if key not in self.previewClips:
+      self.previewClips[key] = getPreviewClip(self.engine, item, self.library)
+    return self.previewClips[key]
+
+  def getItemLabel(self, i):
+    return self.labelCache.get(self.getItemLabelFile(self.items[i]))
+
+  def updateItemList(self):
+    """Lay out the items again after the list has changed."""
+    collapsed = [self.cassetteHeight if isinstance(item, Song.SongInfo) else self.libraryHeight for item in self.items]
+    expanded  = [self.cassetteWidth  if isinstance(item, Song.SongInfo) else self.libraryWidth  for item in self.items]
+    self.itemList.setItems(collapsed, expanded)
+    self.searchIndex = SearchIndex([[item.name, item.artist] if isinstance(item, Song.SongInfo) else [item.name] for item in self.items])
+    self.updateFilter()
+
+  def updateFilter(self):
+    """Show only the items matching the search text."""
+    self.itemList.setFilter(self.searchIndex.search(self.searchText))
+
+  def moveSelection(self, rows):
+    """Select the item the given number of rows away in the shown list."""
+    row = self.itemList.getRow(self.selectedIndex)
+    if row >= 0:
+      self.selectedIndex = int(self.itemList.indices[(row + rows) % len(self.itemList)])
+    self.updateSelection()
 
   def updateSelection(self):
     self.selectedItem  = self.items[self.selectedIndex]
     self.songCountdown = 1024
-    self.loadItemLabel(self.selectedIndex)
+    self.itemList.select(self.selectedIndex)
+
+    # Decode the labels around the selection before they scroll into view
+    neighbours = [self.items[(self.selectedIndex + d) % len(self.items)] for d in (0, 1, -1, 2, -2, 3, -3, 10, -10)]
+    files = [self.getItemLabelFile(item) for item in neighbours]
+    self.labelCache.cancel(keep = files)
+    self.labelCache.prefetch(files)
+
+    # Render the preview clips of the songs next to the selection too
+    if self.autoPreview:
+      clips = [self.getItemPreviewClip(item) for item in neighbours[:3] if isinstance(item, Song.SongInfo)]
+      self.previewCache.cancel(keep = clips)
+      self.previewCache.prefetch(clips)
     
   def keyPressed(self, key, unicode):
     if not self.items or self.accepted:
@@ -435,7 +475,7 @@ class SongChooser(Layer, KeyListener):
 
     c = self.engine.input.controls.getMapping(key)
     if c in [Player.KEY1] or key == pygame.K_RETURN:
-      if self.matchesSearch(self.selectedItem):
+      if self.matchesSearch(self.selectedIndex):
         if isinstance(self.selectedItem, Song.LibraryInfo):
           self.library     = self.selectedItem.libraryName
           self.initialItem = None
@@ -457,43 +497,24 @@ class SongChooser(Layer, KeyListener):
       if not self.song:
         self.engine.data.cancelSound.play()
     elif c in [Player.UP, Player.ACTION1]:
-      if self.matchesSearch(self.items[self.selectedIndex]):
-        while 1:
-          self.selectedIndex = (self.selectedIndex - 1) % len(self.items)
-          if self.matchesSearch(self.items[self.selectedIndex]):
-            break
-      self.updateSelection()
+      self.moveSelection(-1)
       if not self.song and self.autoPreview:
         self.engine.data.selectSound.play()
     elif c in [Player.DOWN, Player.ACTION2]:
-      if self.matchesSearch(self.items[self.selectedIndex]):
-        while 1:
-          self.selectedIndex = (self.selectedIndex + 1) % len(self.items)
-          if self.matchesSearch(self.items[self.selectedIndex]):
-            break
-      self.updateSelection()
+      self.moveSelection(1)
       if not self.song and self.autoPreview:
         self.engine.data.selectSound.play()
     elif key == pygame.K_PAGEUP:
-      if self.matchesSearch(self.items[self.selectedIndex]):
-        while 1:
-          self.selectedIndex = (self.selectedIndex - 10) % len(self.items)
-          if self.matchesSearch(self.items[self.selectedIndex]):
-            break
-      self.updateSelection()
+      self.moveSelection(-10)
       if not self.song and self.autoPreview:
         self.engine.data.selectSound.play()
     elif key == pygame.K_PAGEDOWN:
-      if self.matchesSearch(self.items[self.selectedIndex]):
-        while 1:
-          self.selectedIndex = (self.selectedIndex + 10) % len(self.items)
-          if self.matchesSearch(self.items[self.selectedIndex]):
-            break
-      self.updateSelection()
+      self.moveSelection(10)
       if not self.song and self.autoPreview:
        self.engine.data.selectSound.play()
     elif key == pygame.K_BACKSPACE and not self.accepted:
       self.searchText = self.searchText[:-1]
+      self.updateFilter()
       self.doSearch()
     elif key == pygame.K_SPACE:
       if self.playSongName == self.getSelectedSong():
@@ -502,49 +523,41 @@ class SongChooser(Layer, KeyListener):
       else:
         self.playSelectedSong(forceplay=1)
     elif key == pygame.K_HOME:
-      self.artistSort = (self.artistSort + 1) % 2
-      if self.artistSort:
-        self.items.sort(key=lambda l: (l.artist.lower() if isinstance(l, Song.SongInfo) else '0'))
-      else:
-        self.items.sort(key=lambda l: (l.name.lower()))
+      # Cycle through the precomputed song orders
+      self.sortOrder  = Song.SORT_ORDERS[(Song.SORT_ORDERS.index(self.sortOrder) + 1) % len(Song.SORT_ORDERS)]
+      self.artistSort = self.sortOrder == Song.SORT_BY_ARTIST
+      self.songs      = self.songOrders.getSongs(self.sortOrder)
+      self.items      = self.libraries + self.songs
+      self.selectedIndex = self.items.index(self.selectedItem)
+      self.updateItemList()
+      self.updateSelection()
     elif key == pygame.K_TAB:
       self.cassetteShow = not self.cassetteShow
     elif unicode and ord(unicode) > 31 and not self.accepted:
       self.searchText += str(unicode)
+      self.updateFilter()
       self.doSearch()
     return True
 
-  def matchesSearch(self, item):
-    if not self.searchText:
-      return True
-    if isinstance(item, Song.SongInfo):
-      if self.searchText.lower() in item.name.lower() or self.searchText.lower() in item.artist.lower():
-        return True
-    elif isinstance(item, Song.LibraryInfo):
-      if self.searchText.lower() in item.name.lower():
-        return True
-    return False
+  def matchesSearch(self, i):
+    """@return: True if the item at the given index is shown with the current search text"""
+    return self.itemList.getRow(i) >= 0
 
   def doSearch(self):
-    if not self.searchText:
+    if not self.searchText or not len(self.itemList):
       return
-      
-    for i, item in enumerate(self.items):
-      if self.matchesSearch(item):
-          self.selectedIndex =  i
-          self.updateSelection()
-          break
+
+    self.selectedIndex = int(self.itemList.indices[0])
+    self.updateSelection()
 
   def songLoaded(self, song):
     self.songLoader = None
 
     if self.song:
       self.song.stop()
-    
-    song.setGuitarVolume(self.engine.config.get("audio", "guitarvol"))
-    song.setBackgroundVolume(self.engine.config.get("audio", "songvol"))
-    song.setRhythmVolume(self.engine.config.get("audio", "rhythmvol"))
-    song.play()
+
+    # The track volumes are already mixed into the preview clip
+    song.play(-1)
     self.song = song
 
   def playSelectedSong(self, forceplay = 0):
@@ -564,7 +577,10 @@ class SongChooser(Layer, KeyListener):
       self.song.fadeout(1000)
       self.song = None
 
-    self.songLoader = self.engine.resource.load(self, None, lambda: Song.loadSong(self.engine, song, playbackOnly = True, library = self.library),
+    clip = self.getItemPreviewClip(self.selectedItem)
+    if not clip.tracks:
+      return
+    self.songLoader = self.engine.resource.load(self, None, lambda: self.previewCache.load(clip),
                                                 onLoad = self.songLoaded)
     self.playSongName = self.getSelectedSong()
     
@@ -578,12 +594,9 @@ class SongChooser(Layer, KeyListener):
 
     d = self.cameraOffset - self.selectedOffset
     self.cameraOffset -= d * ticks / 192.0
-    
-    for i in range(len(self.itemAngles)):
-      if i == self.selectedIndex:
-        self.itemAngles[i] = min(90, self.itemAngles[i] + ticks / 2.0)
-      else:
-        self.itemAngles[i] = max(0,  self.itemAngles[i] - ticks / 2.0)
+
+    self.labelCache.run()
+    self.itemList.run(ticks)
     
   def renderCassette(self, color, label):
     if not self.cassette:
@@ -593,9 +606,10 @@ class SongChooser(Layer, KeyListener):
       glColor3f(*color)
 
     glEnable(GL_COLOR_MATERIAL)
-    self.cassette.render("Mesh_001")
-    glColor3f(.1, .1, .1)
-    self.cassette.render("Mesh")
+    with self.cassette:
+      self.cassette.render("Mesh_001")
+      glColor3f(.1, .1, .1)
+      self.cassette.render("Mesh")
 
     # Draw the label if there is one
     if label is not None:
@@ -622,9 +636,10 @@ class SongChooser(Layer, KeyListener):
 
     glEnable(GL_NORMALIZE)
     glEnable(GL_COLOR_MATERIAL)
-    self.libraryMesh.render("Mesh_001")
-    glColor3f(.1, .1, .1)
-    self.libraryMesh.render("Mesh")
+    with self.libraryMesh:
+      self.libraryMesh.render("Mesh_001")
+      glColor3f(.1, .1, .1)
+      self.libraryMesh.render("Mesh")
 
     # Draw the label if there is one
     if label is not None:
@@ -676,22 +691,22 @@ class SongChooser(Layer, KeyListener):
         self.camera.target = (  0 + offset, -self.cameraOffset, 2.5 + offset)
         self.camera.apply()
       
-        y = 0.0
-        for i, item in enumerate(self.items):
-          if not self.matchesSearch(item):
-            continue
-        
-          c = math.sin(self.itemAngles[i] * math.pi / 180)
-        
-          if isinstance(item, Song.SongInfo):
-            h = c * self.cassetteWidth + (1 - c) * self.cassetteHeight
-          else:
-            h = c * self.libraryWidth + (1 - c) * self.libraryHeight
-        
-          d = (y + h * .5 + self.camera.origin[1]) / (4 * (self.camera.target[2] - self.camera.origin[2]))
+        if self.itemList.getRow(self.selectedIndex) >= 0:
+          self.selectedOffset = self.itemList.getCenter(self.selectedIndex)
+
+        # Only the items within this distance of the camera are drawn
+        depth = 4 * (self.camera.target[2] - self.camera.origin[2])
+        rows  = self.itemList.getVisibleRows(-self.camera.origin[1] - 1.2 * abs(depth), -self.camera.origin[1] + 1.2 * abs(depth))
+        y     = self.itemList.getOffset(rows.start) if len(rows) else 0.0
+        glTranslatef(0, -y, 0)
+
+        for row in rows:
+          i    = int(self.itemList.indices[row])
+          item = self.items[i]
+          h    = self.itemList.getHeight(i)
+          d    = (y + h * .5 + self.camera.origin[1]) / depth
 
           if i == self.selectedIndex:
-            self.selectedOffset = y + h / 2
             Theme.setSelectedColor()
           else:
             Theme.setBaseColor()
@@ -701,13 +716,13 @@ class SongChooser(Layer, KeyListener):
           glPushMatrix()
           if abs(d) < 1.2:
             if isinstance(item, Song.SongInfo):
-              glRotate(self.itemAngles[i], 0, 0, 1)
-              self.renderCassette(item.cassetteColor, self.itemLabels[i])
+              glRotate(self.itemList.getAngle(i), 0, 0, 1)
+              self.renderCassette(item.cassetteColor, self.getItemLabel(i))
             elif isinstance(item, Song.LibraryInfo):
-              glRotate(-self.itemAngles[i], 0, 0, 1)
+              glRotate(-self.itemList.getAngle(i), 0, 0, 1)
               if i == self.selectedIndex:
                 glRotate(self.time * 4, 1, 0, 0)
-              self.renderLibrary(item.color, self.itemLabels[i])
+              self.renderLibrary(item.color, self.getItemLabel(i))
           glPopMatrix()
         
           glTranslatef(0, -h / 2, 0)
@@ -745,50 +760,41 @@ class SongChooser(Layer, KeyListener):
         glVertex2f(.58, .02)
         glEnd()
 
-        length = 0
-        select = 0
-        it = 0
-        for i, item in enumerate(self.items):
-          if not self.matchesSearch(item):
-            continue
-          if isinstance(item, Song.SongInfo) or isinstance(item, Song.LibraryInfo):
-            length+=1
-            if self.selectedIndex == i:
-              select = length
+        length = len(self.itemList)
+        select = self.itemList.getRow(self.selectedIndex) + 1
 
         Theme.setSelectedColor(1 - v)
         scale = 0.0008
-        for i, item in enumerate(self.items):
-          if not self.matchesSearch(item):
-            continue
-          if isinstance(item, Song.SongInfo) or isinstance(item, Song.LibraryInfo):
-            it+=1
-            if it >= (select - 5) or it >= (select + 11):
-              if self.selectedIndex == i:
-                glBegin(GL_QUADS)
-                glColor4f(1,1,1, .1)
-              else:
-                glBegin(GL_QUADS)
-                if it % 2 == 0:
-                  glColor4f(0,0,0, .3)
-                else:
-                  glColor4f(0,0,0, .5)
-              glVertex2f(.045, n[1] + font.getHeight() * scale)
-              glVertex2f(.045, n[1] + 3*font.getHeight() * scale)
-              glVertex2f(.575, n[1] + 3*font.getHeight() * scale)
-              glVertex2f(.575, n[1] + font.getHeight() * scale)
-              glEnd()
-              Theme.setSelectedColor(1 - v)
-              if self.artistSort:
-                n = wrapText(font, (.05, n[1] + font.getHeight() * scale), item.artist if isinstance(item, Song.SongInfo) else _("Songs library"), 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "...")
-                Theme.setBaseColor(1 - v)
-                n = wrapText(font, (.07, n[1] + font.getHeight() * scale), item.name, 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "..." )
-              else:
-                n = wrapText(font, (.05, n[1] + font.getHeight() * scale), item.name, 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "...")
-                Theme.setBaseColor(1 - v)
-                n = wrapText(font, (.07, n[1] + font.getHeight() * scale), item.artist if isinstance(item, Song.SongInfo) else _("Songs library"), 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "..." )
-              if ((n[1] + 2*font.getHeight() * scale) >= .65):
-                break
+        # Start five rows above the selection
+        for row in range(max(0, select - 6), length):
+          i = int(self.itemList.indices[row])
+          item = self.items[i]
+          it = row + 1
+          if self.selectedIndex == i:
+            glBegin(GL_QUADS)
+            glColor4f(1,1,1, .1)
+          else:
+            glBegin(GL_QUADS)
+            if it % 2 == 0:
+              glColor4f(0,0,0, .3)
+            else:
+              glColor4f(0,0,0, .5)
+          glVertex2f(.045, n[1] + font.getHeight() * scale)
+          glVertex2f(.045, n[1] + 3*font.getHeight() * scale)
+          glVertex2f(.575, n[1] + 3*font.getHeight() * scale)
+          glVertex2f(.575, n[1] + font.getHeight() * scale)
+          glEnd()
+          Theme.setSelectedColor(1 - v)
+          if self.artistSort:
+            n = wrapText(font, (.05, n[1] + font.getHeight() * scale), item.artist if isinstance(item, Song.SongInfo) else _("Songs library"), 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "...")
+            Theme.setBaseColor(1 - v)
+            n = wrapText(font, (.07, n[1] + font.getHeight() * scale), item.name, 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "..." )
+          else:
+            n = wrapText(font, (.05, n[1] + font.getHeight() * scale), item.name, 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "...")
+            Theme.setBaseColor(1 - v)
+            n = wrapText(font, (.07, n[1] + font.getHeight() * scale), item.artist if isinstance(item, Song.SongInfo) else _("Songs library"), 0.57, visibility = 0.0, scale = scale, hide = 1, hidestring = "..." )
+          if ((n[1] + 2*font.getHeight() * scale) >= .65):
+            break
 
         # draw the scrollbar
         perc = float(select - 1)/float(length - 1) if length > 1 else 0
@@ -817,7 +823,7 @@ class SongChooser(Layer, KeyListener):
 
       if self.searchText:
         text = _("Filter: %s") % (self.searchText) + "|"
-        if not self.matchesSearch(self.items[self.selectedIndex]):
+        if not self.matchesSearch(self.selectedIndex):
           text += " (%s)" % _("Not found")
         font.render(text, (.05, .7 + v), scale = 0.001)
       elif self.songLoader:
@@ -833,8 +839,8 @@ class SongChooser(Layer, KeyListener):
       
       item  = self.items[self.selectedIndex]
 
-      if self.matchesSearch(item):
-        angle = self.itemAngles[self.selectedIndex]
+      if self.matchesSearch(self.selectedIndex):
+        angle = self.itemList.getAngle(self.selectedIndex)
         f = ((90.0 - angle) / 90.0) ** 2
         pos = wrapText(font, (x, y), item.name, visibility = f, scale = 0.0016)
 
@@ -1105,6 +1111,61 @@ class BpmEstimator(Layer, KeyListener):
     finally:
       self.engine.view.resetProjection()
       
+class LatencyCalibrator(Layer, KeyListener):
+  """A/V delay calibration layer."""
+  def __init__(self, engine, prompt = ""):
+    self.prompt         = prompt
+    self.engine         = engine
+    self.accepted       = False
+    self.latency        = None
+    self.calibration    = Calibration.LatencyCalibration()
+
+  def shown(self):
+    self.engine.input.addKeyListener(self, priority = True)
+    self.calibration.start()
+
+  def hidden(self):
+    self.engine.input.removeKeyListener(self)
+    self.calibration.stop()
+
+  def keyPressed(self, key, unicode):
+    if self.accepted:
+      return True
+
+    c = self.engine.input.controls.getMapping(key)
+    if c in [Player.CANCEL]:
+      self.engine.view.popLayer(self)
+      self.accepted = True
+    elif c in Guitar.KEYS + [Player.ACTION1, Player.ACTION2] or key == pygame.K_SPACE:
+      self.calibration.press()
+    return True
+
+  def run(self, ticks):
+    if self.calibration.isDone() and not self.accepted:
+      self.latency  = self.calibration.getLatency()
+      self.accepted = True
+      self.engine.view.popLayer(self)
+
+  def render(self, visibility, topMost):
+    v = (1 - visibility) ** 2
+
+    self.engine.view.setOrthogonalProjection(normalize = True)
+    font = self.engine.data.font
+
+    fadeScreen(v)
+
+    try:
+      glEnable(GL_BLEND)
+      glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+      glEnable(GL_COLOR_MATERIAL)
+      Theme.setBaseColor(1 - v)
+      wrapText(font, (.1, .2 - v), self.prompt)
+
+      Theme.setSelectedColor(1 - v)
+      wrapText(font, (.1, .5 + v), _("%d key presses") % len(self.calibration.presses))
+    finally:
+      self.engine.view.resetProjection()
+
 class KeyTester(Layer, KeyListener):
   """Keyboard configuration testing layer."""
   def __init__(self, engine, prompt = ""):
@@ -1255,6 +1316,30 @@ def testKeys(engine, prompt = _("Play with the keys and press Escape when you're
   d = KeyTester(engine, prompt = prompt)
   _runDialog(engine, d)
   
+def calibrateLatency(engine, prompt = _("Press a fret key in time with each click you hear. Press Escape to cancel.")):
+  """
+  Measure the A/V delay of the current audio device by having the user
+  tap along to a click track, and store it for later games.
+
+  @param engine:  Game engine
+  @param prompt:  Prompt shown to the user
+  @return:        Measured delay in milliseconds or None if the measurement failed
+  """
+  d = LatencyCalibrator(engine, prompt = prompt)
+  _runDialog(engine, d)
+  if d.calibration.isDone():
+    if d.latency is None:
+      showMessage(engine, _("Too few key presses were in time with the clicks. Please try again."))
+      return None
+    latency, deviation, presses = d.latency
+    # The configured delay follows the latest calibration, so that the
+    # settings menu shows it and other devices start from it
+    Calibration.setLatency(engine.audio.getDeviceKey(), latency)
+    engine.config.set("audio", "delay", Calibration.clampDelay(engine.config, latency))
+    showMessage(engine, _("A/V delay set to %d ms.") % int(round(latency)))
+    return latency
+  return None
+
 def showLoadingScreen(engine, condition, text = _("Loading..."), allowCancel = False):
   """
   Show a loading screen until a condition is met.
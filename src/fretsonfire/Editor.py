@@ -37,7 +37,8 @@ from . import Dialogs
 from . import Player
 from . import Theme
 from . import Log
-import shutil, os, struct, wave, tempfile
+from . import Adpcm
+import shutil, os, wave, tempfile
 from struct import unpack
 
 class Editor(Layer, KeyListener):
@@ -493,72 +494,26 @@ class GHImporter(Layer):
   def decodeVgsStreams(self, vgsFile, length):
     Log.notice("Decompressing %d byte VGS file." % (length))
 
-    # This decompressor is based on VAG-Depack by bITmASTER
-    f = vgsFile
-
-    c = [[           0.0,          0.0 ],
-         [   60.0 / 64.0,          0.0 ],
-         [  115.0 / 64.0, -52.0 / 64.0 ],
-         [   98.0 / 64.0, -55.0 / 64.0 ],
-         [  122.0 / 64.0, -60.0 / 64.0 ],
-         [           0.0,          0.0 ],
-         [           0.0,          0.0 ],
-         [           0.0,          0.0 ]]
-
-    class StreamDecoder:
-      """XA ADPCM decoder"""
-      def __init__(self):
-        self.s_1     = 0.0
-        self.s_2     = 0.0
-        self.samples = [0.0] * 28
-
-      def decode(self, block, predict_nr, shift_factor):
-        for i in range(0, 28, 2):
-          d = block[i >> 1]
-          s = (d & 0xf) << 12
-          if s & 0x8000:
-            s = (s & 0xffff) - 0x10000
-          self.samples[i] = float(s >> shift_factor)
-          s = (d & 0xf0) << 8
-          if s & 0x8000:
-            s = (s & 0xffff) - 0x10000
-          self.samples[i + 1] = float(s >> shift_factor)
-
-        for i in range(28):
-          self.samples[i] += self.s_1 * c[predict_nr][0] + self.s_2 * c[predict_nr][1]
-          self.s_2 = self.s_1
-          self.s_1 = self.samples[i]
-
-        return self.samples
-
-    maxStreams = 8
-    streams    = [StreamDecoder() for i in range(maxStreams)]
-
-    def byte(d):
-      if len(d):
-        return struct.unpack("b", d)[0]
-      return 0
-
-    startPos = f.tell()
+    f         = vgsFile
+    decoder   = Adpcm.XaDecoder()
+    chunkSize = Adpcm.BLOCK_SIZE * 65536
+    startPos  = f.tell()
 
-    while True:
+    while not decoder.finished:
       self.stageProgress = float(f.tell() - startPos) / length
 
-      d = f.read(1)
-      if not d:
+      data = f.read(chunkSize)
+      if not data:
         break
-      predict_nr   = byte(d)
-      shift_factor = predict_nr & 0xf
-      predict_nr >>= 4
-      flags        = byte(f.read(1))
+      # A partial block at the end of the file is padded with zeros
+      if len(data) % Adpcm.BLOCK_SIZE:
+        data += b"\0" * (Adpcm.BLOCK_SIZE - len(data) % Adpcm.BLOCK_SIZE)
 
-      if flags == 7 or flags < 0:
-        break
+      for streamId, samples in decoder.decode(data):
+        yield (streamId, samples.tobytes())
 
-      streamId     = flags % maxStreams
-      block        = [byte(f.read(1)) for i in range(14)]
-      samples      = streams[streamId].decode(block, predict_nr, shift_factor)
-      yield (streamId, struct.pack("28h", *[max(min(int(d + .5), 32767), -32768) for d in samples]))
+      if len(data) < chunkSize:
+        break
 
     f.close()
 
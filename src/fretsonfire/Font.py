@@ -23,23 +23,306 @@ import pygame
 import numpy
 from OpenGL.GL import *
 import sys
+import io
+import os
+import ctypes
+import threading
+from collections import OrderedDict
 
 from .Texture import Texture, TextureAtlas, TextureAtlasFullException
+from . import GLResource
+from . import Config
+from . import Log
+
+Config.define("video", "sdffonts", bool, False)
+
+# Initial and maximum size of a glyph atlas page
+GLYPH_ATLAS_SIZE     = 512
+GLYPH_ATLAS_MAX_SIZE = 4096
+
+# Memory reserved for the string geometry cache of each font, in bytes
+STRING_CACHE_SIZE    = 512 * 1024
+
+# Strings made of these characters change often (scores, timers) and are
+# laid out from cached per-character geometry instead of the string cache
+NUMERIC_CHARACTERS   = frozenset("0123456789.,:;+-%/()x ")
+
+# Number of wrapped paragraph layouts remembered by each font
+LAYOUT_CACHE_SIZE    = 256
+
+# Characters whose advances are looked up from a precomputed array, and the
+# string length above which summing them with numpy beats a Python loop
+METRIC_CHARACTERS    = 256
+VECTORIZED_LENGTH    = 16
+
+class GeometryArena(object):
+  """
+  A fixed size block of glyph vertices (x, y, u, v) with first fit
+  suballocation, so cached strings don't each need their own arrays.
+  """
+  def __init__(self, capacity):
+    self.capacity = capacity
+    self.vertices = numpy.zeros((capacity, 4), numpy.float32)
+    self.free     = [[0, capacity]]
+
+  def allocate(self, count):
+    """@return: Offset of count free vertices or None if there is no room"""
+    for i, (offset, size) in enumerate(self.free):
+      if size >= count:
+        if size == count:
+          del self.free[i]
+        else:
+          self.free[i] = [offset + count, size - count]
+        return offset
+    return None
+
+  def release(self, offset, count):
+    """Return a range of vertices to the free list."""
+    i = 0
+    while i < len(self.free) and self.free[i][0] < offset:
+      i += 1
+    self.free.insert(i, [offset, count])
+    # Merge with the following and preceding free ranges
+    if i + 1 < len(self.free) and offset + count == self.free[i + 1][0]:
+      self.free[i][1] += self.free[i + 1][1]
+      del self.free[i + 1]
+    if i > 0 and self.free[i - 1][0] + self.free[i - 1][1] == offset:
+      self.free[i - 1][1] += self.free[i][1]
+      del self.free[i]
+
+class StringCache(object):
+  """Least recently used cache of laid out strings stored in a L{GeometryArena}."""
+  def __init__(self, size = STRING_CACHE_SIZE):
+    """@param size:  Memory budget in bytes"""
+    self.arena   = GeometryArena(size // 16)
+    self.entries = OrderedDict()
+    self.used    = 0
+    self.hits    = 0
+    self.misses  = 0
+
+  def get(self, key):
+    """@return: List of (texture, vertexCount, vertices, texCoords) tuples or None"""
+    entry = self.entries.get(key)
+    if entry is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self.entries.move_to_end(key)
+    return entry[1]
+
+  def put(self, key, runs):
+    """
+    Store the geometry of a string.
+
+    @param key:   Cache key
+    @param runs:  List of (texture, vertexCount, vertices, texCoords) tuples
+    @return:      The same geometry, backed by the arena if it could be stored
+    """
+    count = sum(run[1] for run in runs)
+    if count > self.arena.capacity:
+      return runs
+    offset = self.arena.allocate(count)
+    while offset is None and self.entries:
+      self._evict()
+      offset = self.arena.allocate(count)
+
+    stored = []
+    o = offset
+    for texture, vertexCount, vertices, texCoords in runs:
+      block = self.arena.vertices[o:o + vertexCount]
+      block[:, 0:2] = vertices
+      block[:, 2:4] = texCoords
+      stored.append((texture, vertexCount, block[:, 0:2], block[:, 2:4]))
+      o += vertexCount
+    self.entries[key] = ((offset, count), stored)
+    self.used += count * 16
+    return stored
+
+  def _evict(self):
+    key, ((offset, count), stored) = self.entries.popitem(last = False)
+    self.arena.release(offset, count)
+    self.used -= count * 16
+
+  def clear(self):
+    self.entries.clear()
+    self.arena.free = [[0, self.arena.capacity]]
+    self.used = 0
+
+# Size at which distance field glyphs are rendered and how far, in pixels
+# of that size, the distance field extends outside the glyph outlines
+DISTANCE_FIELD_SIZE   = 64
+DISTANCE_FIELD_SPREAD = 8
+
+def distanceField(coverage, spread = DISTANCE_FIELD_SPREAD):
+  """
+  Compute a signed distance field from a glyph coverage image.
+
+  @param coverage:  (height, width) array of coverage values between 0 and 1
+  @param spread:    Maximum distance in pixels stored in the field
+  @return:          (height + 2 * spread, width + 2 * spread) uint8 array where
+                    128 lies on the outline and larger values are inside
+  """
+  inside  = numpy.pad(coverage >= .5, spread)
+  h, w    = inside.shape
+  shifted = numpy.pad(inside, spread)
+  far     = numpy.float32(spread + 1)
+  distIn  = numpy.full((h, w), far, numpy.float32)
+  distOut = numpy.full((h, w), far, numpy.float32)
+
+  # Visit the neighbourhood once per offset, processing the whole image at a time
+  for dy in range(-spread, spread + 1):
+    for dx in range(-spread, spread + 1):
+      d = numpy.float32((dx * dx + dy * dy) ** .5)
+      if d == 0 or d > spread:
+        continue
+      neighbour = shifted[spread + dy:spread + dy + h, spread + dx:spread + dx + w]
+      numpy.minimum(distOut, numpy.where(neighbour, d, far), out = distOut)
+      numpy.minimum(distIn,  numpy.where(neighbour, far, d), out = distIn)
+
+  signed = numpy.where(inside, distIn - .5, .5 - distOut)
+
+  # Pixels on the outline know their distance more precisely from their coverage
+  c    = numpy.pad(coverage, spread)
+  edge = (c > 0) & (c < 1)
+  signed[edge] = c[edge] - .5
+
+  return numpy.clip(128 + signed * (127.0 / spread), 0, 255).astype(numpy.uint8)
+
+class DistanceFieldFace(object):
+  """
+  Distance field glyphs of one typeface, shared by all the L{Font}
+  instances using it regardless of their size.
+  """
+  def __init__(self, font, cacheFileName = None):
+    """
+    @param font:           pygame font of the typeface at L{DISTANCE_FIELD_SIZE}
+    @param cacheFileName:  File for keeping the generated fields between sessions
+    """
+    self.font          = font
+    self.cacheFileName = cacheFileName
+    self.atlases       = []
+    self.glyphCache    = {}
+    self.glyphSizes    = {}
+    self.fields        = {}
+    self.modified      = False
+
+    if cacheFileName and os.path.isfile(cacheFileName):
+      try:
+        with numpy.load(cacheFileName) as cache:
+          for key in cache.files:
+            self.fields[chr(int(key, 16))] = cache[key]
+      except Exception as e:
+        Log.warn("Unable to read distance field cache %s: %s" % (cacheFileName, e))
+
+  def renderGlyph(self, ch):
+    """@return: ((width, height), RGBA pixels) of the distance field of a character"""
+    try:
+      field = self.fields[ch]
+    except KeyError:
+      s = self.font.render(ch, True, (255, 255, 255))
+      w, h = s.get_size()
+      alpha = numpy.frombuffer(pygame.image.tobytes(s, "RGBA", True), numpy.uint8).reshape(h, w, 4)[..., 3]
+      field = self.fields[ch] = distanceField(alpha / 255.0)
+      self.modified = True
+    h, w = field.shape
+    self.glyphSizes[ch] = (w - 2 * DISTANCE_FIELD_SPREAD, h - 2 * DISTANCE_FIELD_SPREAD)
+    pixels = numpy.empty((h, w, 4), numpy.uint8)
+    pixels[..., 0:3] = 255
+    pixels[..., 3]   = field
+    return (w, h), pixels.tobytes()
+
+  def save(self):
+    """Write newly generated fields to the cache file."""
+    if not self.cacheFileName or not self.modified:
+      return
+    try:
+      if not os.path.isdir(os.path.dirname(self.cacheFileName)):
+        os.makedirs(os.path.dirname(self.cacheFileName))
+      with open(self.cacheFileName, "wb") as f:
+        numpy.savez(f, **dict(("%x" % ord(ch), field) for ch, field in self.fields.items()))
+      self.modified = False
+    except (IOError, OSError) as e:
+      Log.warn("Unable to save distance field cache %s: %s" % (self.cacheFileName, e))
+
+class TextLayout(object):
+  """
+  Word wrapped layout of a paragraph, relative to its top left corner.
+
+  Words are separated by single spaces and a lone "\\n" word forces a line
+  break, as in L{Dialogs.wrapText}.
+  """
+  def __init__(self, font, text, width, scale = 0.002, hide = False, hideString = ""):
+    """
+    @param font:        L{Font} used for measuring
+    @param text:        Text to lay out
+    @param width:       Width available for the text
+    @param scale:       Text scale
+    @param hide:        Replace the first word that doesn't fit with hideString and stop
+    @param hideString:  Text shown in place of the hidden words
+    """
+    space       = font.getStringSize(" ", scale = scale)[0]
+    hideWidth   = font.getStringSize(hideString, scale = scale)[0]
+    width      -= hideWidth
+    words       = text.split(" ")
+    sizes       = font.getWordSizes(words, scale = scale)
+
+    # List of (word index, word, x, y) and (width, height) of each line
+    self.words  = []
+    self.lines  = []
+    x, y        = 0.0, 0.0
+    lineHeight  = 0.0
+    for n, word in enumerate(words):
+      w, h = sizes[n]
+      overflow = x + w > width
+      if overflow and hide:
+        word = hideString
+      if (overflow and not hide) or word == "\n":
+        self.lines.append((max(0.0, x - space), lineHeight))
+        x  = 0.0
+        y += h
+        lineHeight = 0.0
+      if word == "\n":
+        continue
+      self.words.append((n, word, x, y))
+      lineHeight = max(lineHeight, h)
+      if overflow and hide:
+        x += hideWidth + space
+        break
+      x += w + space
+    self.lines.append((max(0.0, x - space), lineHeight))
+
+    # Position following the last word, as returned by L{Dialogs.wrapText}
+    self.end    = (x - space, y)
 
 class Font:
   """A texture-mapped font."""
+
+  # Atlas pages shared by the glyphs and custom images of all fonts
+  glyphAtlases = []
+
+  # Distance field glyphs of each typeface
+  distanceFieldFaces = {}
+  distanceFieldLock  = threading.Lock()
+
   def __init__(self, fileName, size, bold = False, italic = False, underline = False, outline = True,
-               scale = 1.0, reversed = False, systemFont = False):
+               scale = 1.0, reversed = False, systemFont = False, distanceField = False, distanceFieldCache = None):
     pygame.font.init()
+    self.fileName         = getattr(fileName, "name", fileName)
+    self.face             = None
     self.size             = size
     self.scale            = scale
     self.glyphCache       = {}
     self.glyphSizeCache   = {}
+    self.advances         = None
+    self.heights          = None
+    self.layoutCache      = OrderedDict()
+    self.customGlyphs     = set()
+    self.prewarmed        = None
     self.outline          = outline
-    self.glyphTextures    = []
     self.reversed         = reversed
-    self.stringCache      = {}
-    self.stringCacheLimit = 256
+    self.stringCache      = StringCache()
+    self.glyphQuads       = {}
+    self.atlasGeneration  = TextureAtlas.generation
     # Try loading a system font first if one was requested
     self.font           = None
     if systemFont and sys.platform != "win32":
@@ -53,6 +336,47 @@ class Font:
     self.font.set_italic(italic)
     self.font.set_underline(underline)
 
+    if distanceField:
+      self.face       = self._getDistanceFieldFace(fileName, bold, italic, systemFont, distanceFieldCache)
+      self.glyphCache = self.face.glyphCache
+
+  def _getDistanceFieldFace(self, fileName, bold, italic, systemFont, cacheFileName):
+    key = (str(self.fileName), bold, italic, systemFont and self.font.get_height())
+    with Font.distanceFieldLock:
+      if key not in Font.distanceFieldFaces:
+        if systemFont and sys.platform != "win32" and not hasattr(fileName, "read"):
+          font = pygame.font.SysFont(None, DISTANCE_FIELD_SIZE)
+        elif hasattr(fileName, "getbuffer"):
+          # The original stream belongs to the other pygame font
+          font = pygame.font.Font(io.BytesIO(fileName.getbuffer()), DISTANCE_FIELD_SIZE)
+        else:
+          font = pygame.font.Font(fileName, DISTANCE_FIELD_SIZE)
+        font.set_bold(bold)
+        font.set_italic(italic)
+        Font.distanceFieldFaces[key] = DistanceFieldFace(font, cacheFileName)
+      return Font.distanceFieldFaces[key]
+
+  def _getMetrics(self):
+    if self.advances is None:
+      sizes = [self._getCharacterSize(chr(i)) for i in range(METRIC_CHARACTERS)]
+      self.advances = numpy.array([size[0] for size in sizes], numpy.float64)
+      self.heights  = numpy.array([size[1] for size in sizes], numpy.float64)
+    return self.advances, self.heights
+
+  def _getCharacterSize(self, ch):
+    try:
+      return self.glyphSizeCache[ch]
+    except KeyError:
+      size = self.glyphSizeCache[ch] = self.font.size(ch)
+      return size
+
+  def _getCharacterCodes(self, s):
+    """@return: Array of character codes if all are in the precomputed range, otherwise None"""
+    try:
+      return numpy.frombuffer(s.encode("latin-1"), numpy.uint8)
+    except UnicodeEncodeError:
+      return None
+
   def getStringSize(self, s, scale = 0.002):
     """
     Get the dimensions of a string when rendered with this font.
@@ -61,18 +385,66 @@ class Font:
     @param scale:   Scale factor
     @return:        (width, height) tuple
     """
+    scale *= self.scale
+    codes = self._getCharacterCodes(s) if len(s) > VECTORIZED_LENGTH else None
+    if codes is not None:
+      advances, heights = self._getMetrics()
+      return (float(advances[codes].sum()) * scale, float(heights[codes].max()) * scale)
+
     w = 0
     h = 0
-    scale *= self.scale
     for ch in s:
-      try:
-        s = self.glyphSizeCache[ch]
-      except:
-        s = self.glyphSizeCache[ch] = self.font.size(ch)
-      w += s[0]
-      h = max(s[1], h)
+      size = self._getCharacterSize(ch)
+      w += size[0]
+      h = max(size[1], h)
     return (w * scale, h * scale)
 
+  def getWordSizes(self, words, scale = 0.002):
+    """
+    Get the dimensions of each word of a space separated string.
+
+    @param words:   List of words
+    @param scale:   Scale factor
+    @return:        List of (width, height) tuples
+    """
+    text  = " ".join(words)
+    codes = self._getCharacterCodes(text)
+    if codes is None:
+      return [self.getStringSize(word, scale = scale) for word in words]
+
+    # Sum the advances of all the words at once, with the separating spaces
+    # counting as nothing and a sentinel for a trailing empty word
+    advances, heights = self._getMetrics()
+    spaces = codes == 32
+    w = numpy.append(numpy.where(spaces, 0, advances[codes]), 0)
+    h = numpy.append(numpy.where(spaces, 0, heights[codes]), 0)
+    starts = numpy.concatenate(([0], numpy.flatnonzero(spaces) + 1))
+    scale *= self.scale
+    return [(float(a) * scale, float(b) * scale) for a, b in zip(numpy.add.reduceat(w, starts), numpy.maximum.reduceat(h, starts))]
+
+  def layoutText(self, text, width, scale = 0.002, hide = False, hideString = ""):
+    """
+    Wrap a paragraph into lines, reusing a previous layout when possible.
+
+    @param text:        Text to lay out
+    @param width:       Width available for the text
+    @param scale:       Text scale
+    @param hide:        Cut the text at the first word that doesn't fit
+    @param hideString:  Text shown in place of the cut words
+    @return:            L{TextLayout} instance
+    """
+    key = (text, width, scale, hide, hideString)
+    try:
+      layout = self.layoutCache[key]
+      self.layoutCache.move_to_end(key)
+      return layout
+    except KeyError:
+      pass
+    layout = self.layoutCache[key] = TextLayout(self, text, width, scale, hide, hideString)
+    if len(self.layoutCache) > LAYOUT_CACHE_SIZE:
+      self.layoutCache.popitem(last = False)
+    return layout
+
   def getHeight(self):
     """@return: The height of this font"""
     return self.font.get_height() * self.scale
@@ -88,109 +460,224 @@ class Font:
     @param character:   Character to replace
     @param texture:     L{Texture} instance
     """
-    texture.setFilter(GL_LINEAR, GL_LINEAR)
-    texture.setRepeat(GL_CLAMP, GL_CLAMP)
-    self.glyphCache[character]     = (texture, (0.0, 0.0, texture.size[0], texture.size[1]))
+    self.glyphCache[character]     = self._addImageToAtlas(texture)
+    self.customGlyphs.add(character)
     s = .75 * self.getHeight() / float(texture.pixelSize[0])
     self.glyphSizeCache[character] = (texture.pixelSize[0] * s, texture.pixelSize[1] * s)
+    self.advances = self.heights   = None
+    self.layoutCache.clear()
 
-  def _renderString(self, text, pos, direction, scale):
-    if not text:
-      return
+  def _addImageToAtlas(self, texture):
+    # Copy the image next to the glyphs so that strings containing it can
+    # be drawn without switching textures
+    if texture.size == (1.0, 1.0) and texture.pixelSize[0] <= GLYPH_ATLAS_SIZE // 4:
+      texture.bind()
+      glPixelStorei(GL_PACK_ALIGNMENT, 1)
+      pixels = glGetTexImage(texture.glTarget, 0, GL_RGBA, GL_UNSIGNED_BYTE)
+      for attempt in range(2):
+        atlas = self.glyphAtlases and self.glyphAtlases[-1] or self._allocateGlyphTexture()
+        try:
+          return (atlas, atlas.addRaw(texture.pixelSize, pixels, margin = 1))
+        except TextureAtlasFullException:
+          self._allocateGlyphTexture()
+    texture.setFilter(GL_LINEAR, GL_LINEAR)
+    texture.setRepeat(GL_CLAMP, GL_CLAMP)
+    return (texture, (0.0, 0.0, texture.size[0], texture.size[1]))
 
-    if not (text, scale) in self.stringCache:
-      currentTexture = None
-      #x, y           = pos[0], pos[1]
-      x, y           = 0.0, 0.0
-      vertices       = numpy.empty((4 * len(text), 2), numpy.float32)
-      texCoords      = numpy.empty((4 * len(text), 2), numpy.float32)
-      vertexCount    = 0
-      cacheEntry     = []
-
-      for i, ch in enumerate(text):
-        g, coordinates     = self.getGlyph(ch)
-        w, h               = self.getStringSize(ch, scale = scale)
-        tx1, ty1, tx2, ty2 = coordinates
-
-        # Set the initial texture
-        if currentTexture is None:
-          currentTexture = g
-
-        # If the texture changed, flush the geometry
-        if currentTexture != g:
-          cacheEntry.append((currentTexture, vertexCount, numpy.array(vertices[:vertexCount]), numpy.array(texCoords[:vertexCount])))
-          currentTexture = g
-          vertexCount = 0
-
-        vertices[vertexCount + 0]  = (x,     y)
-        vertices[vertexCount + 1]  = (x + w, y)
-        vertices[vertexCount + 2]  = (x + w, y + h)
-        vertices[vertexCount + 3]  = (x,     y + h)
-        texCoords[vertexCount + 0] = (tx1, ty2)
-        texCoords[vertexCount + 1] = (tx2, ty2)
-        texCoords[vertexCount + 2] = (tx2, ty1)
-        texCoords[vertexCount + 3] = (tx1, ty1)
-        vertexCount += 4
-
-        x += w * direction[0]
-        y += w * direction[1]
-      cacheEntry.append((currentTexture, vertexCount, vertices[:vertexCount], texCoords[:vertexCount]))
-
-      # Don't store very short strings
-      if len(text) > 5:
-        # Limit the cache size
-        if len(self.stringCache) > self.stringCacheLimit:
-          del self.stringCache[list(self.stringCache.keys())[0]]
-        self.stringCache[(text, scale)] = cacheEntry
-    else:
-      cacheEntry = self.stringCache[(text, scale)]
+  def _layoutString(self, text, direction, scale):
+    """
+    Get the geometry of a string relative to its origin.
+
+    @return:  List of (texture, vertexCount, vertices, texCoords) tuples,
+              one for each run of characters sharing a texture
+    """
+    # Cached texture coordinates are stale if an atlas page has grown
+    if self.atlasGeneration != TextureAtlas.generation:
+      self.atlasGeneration = TextureAtlas.generation
+      self.stringCache.clear()
+      self.glyphQuads.clear()
+
+    # Numbers change too often to be worth caching
+    if NUMERIC_CHARACTERS.issuperset(text):
+      return self._buildGeometry(text, direction, scale)
+
+    key = (text, scale, tuple(direction))
+    cacheEntry = self.stringCache.get(key)
+    if cacheEntry is None:
+      cacheEntry = self.stringCache.put(key, self._buildGeometry(text, direction, scale))
+    return cacheEntry
+
+  def _getGlyphQuad(self, ch, scale):
+    """@return: (texture, rectangle, texCoords, advance) of a single character"""
+    key = (ch, scale)
+    try:
+      return self.glyphQuads[key]
+    except KeyError:
+      texture, (tx1, ty1, tx2, ty2) = self.getGlyph(ch)
+      w, h = self.getStringSize(ch, scale = scale)
+      if getattr(texture, "distanceField", False):
+        # Distance field glyphs are drawn at their own size and extend past the outline
+        k = scale * self.scale * self.size / float(DISTANCE_FIELD_SIZE)
+        p = DISTANCE_FIELD_SPREAD * k
+        gw, gh = self.face.glyphSizes[ch]
+        rect = (-p, -p, gw * k + p, gh * k + p)
+      else:
+        rect = (0.0, 0.0, w, h)
+      quad = self.glyphQuads[key] = (texture, rect, (tx1, ty2, tx2, ty2, tx2, ty1, tx1, ty1), w)
+      return quad
 
+  def _buildGeometry(self, text, direction, scale):
+    # Place the cached quad of each character
+    vertices       = []
+    texCoords      = []
+    textures       = []
+    x, y           = 0.0, 0.0
+    for ch in text:
+      texture, (x1, y1, x2, y2), quadTexCoords, advance = self._getGlyphQuad(ch, scale)
+      textures.append(texture)
+      vertices.extend((x + x1, y + y1, x + x2, y + y1, x + x2, y + y2, x + x1, y + y2))
+      texCoords.extend(quadTexCoords)
+      x += advance * direction[0]
+      y += advance * direction[1]
+    vertices  = numpy.array(vertices,  numpy.float32).reshape(-1, 2)
+    texCoords = numpy.array(texCoords, numpy.float32).reshape(-1, 2)
+
+    # Split the quads into runs sharing a texture
+    cacheEntry = []
+    start      = 0
+    for i in range(1, len(text) + 1):
+      if i == len(text) or textures[i] != textures[start]:
+        cacheEntry.append((textures[start], 4 * (i - start), vertices[4 * start:4 * i], texCoords[4 * start:4 * i]))
+        start = i
+    return cacheEntry
+
+  def _renderString(self, text, pos, direction, scale):
     glPushMatrix()
     glTranslatef(pos[0], pos[1], 0)
-    for texture, vertexCount, vertices, texCoords in cacheEntry:
+    for texture, vertexCount, vertices, texCoords in self._layoutString(text, direction, scale):
       texture.bind()
       glVertexPointer(2, GL_FLOAT, 0, vertices)
       glTexCoordPointer(2, GL_FLOAT, 0, texCoords)
-      glDrawArrays(GL_QUADS, 0, vertexCount)
+      if getattr(texture, "distanceField", False):
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT)
+        TextBatch._beginDistanceField()
+        glDrawArrays(GL_QUADS, 0, vertexCount)
+        TextBatch._endDistanceField()
+        glPopAttrib()
+      else:
+        glDrawArrays(GL_QUADS, 0, vertexCount)
     glPopMatrix()
 
   def render(self, text, pos = (0, 0), direction = (1, 0), scale = 0.002):
     """
-    Draw some text.
+    Draw some text. If a L{TextBatch} is active, the text is queued and
+    drawn when the batch ends, otherwise it is drawn right away.
 
     @param text:      Text to draw
     @param pos:       Text coordinate tuple (x, y)
     @param direction: Text direction vector (x, y, z)
     @param scale:     Scale factor
     """
+    if not text:
+      return
+
+    if self.reversed:
+      text = "".join(reversed(text))
+
+    if TextBatch.stack:
+      color = glGetFloatv(GL_CURRENT_COLOR)
+      TextBatch.stack[-1].add(self, text, pos, direction, scale * self.scale, color,
+                              outlineColor = self.outline and (0, 0, 0, color[3]) or None)
+      return
+
+    # A single string is cheaper to draw straight from the cached arrays
+    # than through the vertex buffer of a batch
     glEnable(GL_TEXTURE_2D)
     glEnableClientState(GL_VERTEX_ARRAY)
     glEnableClientState(GL_TEXTURE_COORD_ARRAY)
 
     scale *= self.scale
-
-    if self.reversed:
-      text = "".join(reversed(text))
-
     if self.outline:
       glPushAttrib(GL_CURRENT_BIT)
       glColor4f(0, 0, 0, glGetFloatv(GL_CURRENT_COLOR)[3])
-      self._renderString(text, (pos[0] + 0.003, pos[1] + 0.003), direction, scale)
+      self._renderString(text, (pos[0] + OUTLINE_OFFSET[0], pos[1] + OUTLINE_OFFSET[1]), direction, scale)
       glPopAttrib()
-
     self._renderString(text, pos, direction, scale)
-    
+
     glDisableClientState(GL_VERTEX_ARRAY)
     glDisableClientState(GL_TEXTURE_COORD_ARRAY)
     glDisable(GL_TEXTURE_2D)
 
-  def _allocateGlyphTexture(self):
-    t = TextureAtlas(size = glGetInteger(GL_MAX_TEXTURE_SIZE))
-    t.texture.setFilter(GL_LINEAR, GL_LINEAR)
-    t.texture.setRepeat(GL_CLAMP, GL_CLAMP)
-    self.glyphTextures.append(t)
+  def getCharacters(self):
+    """@return: String of the characters rendered so far, excluding custom glyphs"""
+    return "".join(sorted(ch for ch in self.glyphCache if ch not in self.customGlyphs))
+
+  def prewarm(self, characters):
+    """
+    Render a set of characters ahead of time. The glyphs are composed
+    into one image per atlas page and uploaded together instead of one
+    character at a time when they are first drawn.
+
+    @param characters:  String of characters to render
+    @return:            Number of glyphs added
+    """
+    images = []
+    for ch in sorted(set(characters)):
+      if ch in self.glyphCache or not ch.isprintable():
+        continue
+      try:
+        size, pixels = self._renderGlyph(ch)
+      except pygame.error:
+        # Characters without any width can't be rendered
+        continue
+      images.append((ch, size, pixels))
+
+    remaining = images
+    while remaining:
+      atlas  = self._getGlyphAtlas()
+      placed = atlas.addImages([(size, pixels) for ch, size, pixels in remaining], margin = 1)
+      if not placed:
+        if atlas.packer.rectCount == 0:
+          raise ValueError("Glyph is too big to fit into atlas.")
+        self._allocateGlyphTexture(distanceField = self.face is not None)
+        continue
+      for (ch, size, pixels), coordinates in zip(remaining, placed):
+        self.glyphCache[ch] = (atlas, coordinates)
+      remaining = remaining[len(placed):]
+    return len(images)
+
+  def _allocateGlyphTexture(self, distanceField = False):
+    maxSize = min(glGetInteger(GL_MAX_TEXTURE_SIZE), GLYPH_ATLAS_MAX_SIZE)
+    t = TextureAtlas(size = min(GLYPH_ATLAS_SIZE, maxSize), owner = "Font", maxSize = maxSize)
+    t.distanceField = distanceField
+    if distanceField:
+      self.face.atlases.append(t)
+    else:
+      self.glyphAtlases.append(t)
     return t
 
+  def _getGlyphAtlas(self):
+    """@return: The atlas page new glyphs of this font go to"""
+    if self.face:
+      atlases = self.face.atlases
+    else:
+      atlases = self.glyphAtlases
+    if atlases:
+      return atlases[-1]
+    return self._allocateGlyphTexture(distanceField = self.face is not None)
+
+  def _renderGlyph(self, ch):
+    """@return: ((width, height), RGBA pixels) of a character, bottom row first"""
+    if self.face:
+      return self.face.renderGlyph(ch)
+    s = self.font.render(ch, True, (255, 255, 255))
+    return s.get_size(), pygame.image.tobytes(s, "RGBA", True)
+
+  def saveDistanceFields(self):
+    """Store the distance fields generated for this font's typeface on disk."""
+    if self.face:
+      self.face.save()
+
   def getGlyph(self, ch):
     """
     Get a (L{Texture}, coordinate tuple) pair for a given character.
@@ -201,39 +688,185 @@ class Font:
     try:
       return self.glyphCache[ch]
     except KeyError:
-      s = self.font.render(ch, True, (255, 255, 255))
-
-      # Draw outlines
-      """
-      from PIL import Image, ImageFilter
-      srcImg = Image.fromstring("RGBA", s.get_size(), pygame.image.tostring(s, "RGBA"))
-      img    = Image.fromstring("RGBA", s.get_size(), pygame.image.tostring(s, "RGBA"))
-      for y in xrange(img.size[1]):
-        for x in xrange(img.size[0]):
-          a = 0
-          ns = 3
-          n = 0
-          for ny in range(max(0, y - ns), min(img.size[1], y + ns)):
-            for nx in range(max(0, x - ns), min(img.size[0], x + ns)):
-              a += srcImg.getpixel((nx, ny))[3]
-              n += 1
-          if a and srcImg.getpixel((x, y))[3] == 0:
-            img.putpixel((x, y), (0, 0, 0, a / n))
-      s = pygame.image.fromstring(img.tostring(), s.get_size(), "RGBA")
-      """
-
-      if not self.glyphTextures:
-        texture = self._allocateGlyphTexture()
-      else:
-        texture = self.glyphTextures[-1]
+      size, pixels = self._renderGlyph(ch)
+      texture      = self._getGlyphAtlas()
 
       # Insert the texture into the glyph cache
       try:
-        coordinates = texture.add(s)
+        coordinates = texture.addRaw(size, pixels, margin = 1)
       except TextureAtlasFullException:
         # Try again with a fresh atlas
-        texture = self._allocateGlyphTexture()
+        self._allocateGlyphTexture(distanceField = self.face is not None)
         return self.getGlyph(ch)
 
       self.glyphCache[ch] = (texture, coordinates)
       return (texture, coordinates)
+
+# Offset of the outline from the text it surrounds
+OUTLINE_OFFSET = (0.003, 0.003)
+
+DISTANCE_FIELD_VERTEX_SHADER = """
+void main()
+{
+  gl_Position    = ftransform();
+  gl_TexCoord[0] = gl_MultiTexCoord0;
+  gl_FrontColor  = gl_Color;
+}
+"""
+
+# Turns the distance into an antialiased edge about one pixel wide
+DISTANCE_FIELD_FRAGMENT_SHADER = """
+uniform sampler2D glyphs;
+
+void main()
+{
+  float d = texture2D(glyphs, gl_TexCoord[0].st).a;
+  float w = fwidth(d) * 0.7;
+  gl_FragColor = vec4(gl_Color.rgb, gl_Color.a * smoothstep(0.5 - w, 0.5 + w, d));
+}
+"""
+
+class TextBatch(object):
+  """
+  Collects strings drawn with L{Font.render} and draws them with one call
+  per atlas page. Each string is transformed with the modelview matrix
+  that is current when it is queued; the projection must stay the same
+  until the batch ends.
+
+  Usage::
+
+    with TextBatch():
+      font.render("Hello", (.1, .1))
+      font.render("World", (.1, .2))
+  """
+
+  # Batches that are currently collecting text, innermost last
+  stack = []
+
+  # Vertex buffer shared by all batches
+  buffer = 0
+
+  # Shader program for distance field glyphs; 0 if shaders aren't available
+  distanceFieldProgram = None
+
+  # Interleaved vertex layout: x, y, z, u, v, r, g, b, a
+  VERTEX_SIZE = 9
+
+  def __init__(self):
+    self.pages = {}
+
+  def begin(self):
+    TextBatch.stack.append(self)
+    return self
+
+  def end(self):
+    assert TextBatch.stack and TextBatch.stack[-1] is self
+    TextBatch.stack.pop()
+    self.flush()
+
+  __enter__ = begin
+
+  def __exit__(self, type, value, traceback):
+    self.end()
+
+  def add(self, font, text, pos, direction, scale, color, outlineColor = None, outlineOffset = OUTLINE_OFFSET):
+    """
+    Queue a string.
+
+    @param font:          L{Font} to draw with
+    @param text:          Text to draw
+    @param pos:           Text coordinate tuple (x, y)
+    @param direction:     Text direction vector (x, y)
+    @param scale:         Final scale factor including the font scale
+    @param color:         (r, g, b, a) color of the text
+    @param outlineColor:  (r, g, b, a) color of the outline or None for no outline
+    @param outlineOffset: Offset of the outline from the text
+    """
+    modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+    for texture, vertexCount, vertices, texCoords in font._layoutString(text, direction, scale):
+      if outlineColor is not None:
+        self._addQuads(texture, vertices, texCoords, (pos[0] + outlineOffset[0], pos[1] + outlineOffset[1]), outlineColor, modelview)
+      self._addQuads(texture, vertices, texCoords, pos, color, modelview)
+
+  def _addQuads(self, texture, vertices, texCoords, pos, color, modelview):
+    data = numpy.empty((len(vertices), self.VERTEX_SIZE), numpy.float32)
+    # Apply the modelview matrix to the points (x, y, 0, 1)
+    origin = numpy.dot(pos, modelview[0:2, 0:3]) + modelview[3, 0:3]
+    data[:, 0:3] = numpy.dot(vertices, modelview[0:2, 0:3]) + origin
+    data[:, 3:5] = texCoords
+    data[:, 5:9] = color
+    self.pages.setdefault(texture, []).append(data)
+
+  def flush(self):
+    """Draw all the queued text and empty the batch."""
+    if not self.pages:
+      return
+
+    ranges = []
+    first  = 0
+    for texture, chunks in self.pages.items():
+      count = sum(len(c) for c in chunks)
+      ranges.append((texture, first, count))
+      first += count
+    data = numpy.concatenate([c for chunks in self.pages.values() for c in chunks])
+    self.pages = {}
+
+    if not TextBatch.buffer:
+      TextBatch.buffer = glGenBuffers(1)
+      GLResource.registry.register(GLResource.BUFFER, TextBatch.buffer, "Text")
+    glBindBuffer(GL_ARRAY_BUFFER, TextBatch.buffer)
+    glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+    GLResource.registry.resize(GLResource.BUFFER, TextBatch.buffer, data.nbytes)
+
+    stride = self.VERTEX_SIZE * 4
+    glPushAttrib(GL_CURRENT_BIT | GL_ENABLE_BIT)
+    glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    try:
+      glLoadIdentity()
+      glEnable(GL_TEXTURE_2D)
+      glEnableClientState(GL_VERTEX_ARRAY)
+      glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+      glEnableClientState(GL_COLOR_ARRAY)
+      glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+      glTexCoordPointer(2, GL_FLOAT, stride, ctypes.c_void_p(3 * 4))
+      glColorPointer(4, GL_FLOAT, stride, ctypes.c_void_p(5 * 4))
+      for texture, first, count in ranges:
+        texture.bind()
+        if getattr(texture, "distanceField", False):
+          self._beginDistanceField()
+          glDrawArrays(GL_QUADS, first, count)
+          self._endDistanceField()
+        else:
+          glDrawArrays(GL_QUADS, first, count)
+    finally:
+      glPopMatrix()
+      glPopClientAttrib()
+      glPopAttrib()
+      glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  @staticmethod
+  def _beginDistanceField():
+    if TextBatch.distanceFieldProgram is None:
+      try:
+        from OpenGL.GL import shaders
+        TextBatch.distanceFieldProgram = shaders.compileProgram(
+          shaders.compileShader(DISTANCE_FIELD_VERTEX_SHADER, GL_VERTEX_SHADER),
+          shaders.compileShader(DISTANCE_FIELD_FRAGMENT_SHADER, GL_FRAGMENT_SHADER))
+      except Exception as e:
+        Log.warn("Distance field shader unavailable, falling back to alpha testing: %s" % e)
+        TextBatch.distanceFieldProgram = 0
+
+    if TextBatch.distanceFieldProgram:
+      glUseProgram(TextBatch.distanceFieldProgram)
+    else:
+      glEnable(GL_ALPHA_TEST)
+      glAlphaFunc(GL_GEQUAL, .5)
+
+  @staticmethod
+  def _endDistanceField():
+    if TextBatch.distanceFieldProgram:
+      glUseProgram(0)
+    else:
+      glDisable(GL_ALPHA_TEST)
@@ -0,0 +1,158 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+"""Bookkeeping for OpenGL object lifetimes.
+
+OpenGL handles may only be deleted in the thread that owns the context,
+but Python objects holding them can be collected anywhere. Objects
+register their handles here when they are created and release them from
+C{__del__}; the engine then deletes the released handles once per frame.
+"""
+
+import threading
+from collections import deque
+
+from OpenGL.GL import (
+  glDeleteBuffers,
+  glDeleteLists,
+  glDeleteTextures,
+)
+from OpenGL.GL.EXT.framebuffer_object import (
+  glDeleteFramebuffersEXT,
+  glDeleteRenderbuffersEXT,
+)
+
+from . import Log
+from . import Config
+
+Config.define("opengl", "deletebudget", int, 64)
+
+TEXTURE      = "texture"
+LIST         = "list"
+BUFFER       = "buffer"
+FRAMEBUFFER  = "framebuffer"
+RENDERBUFFER = "renderbuffer"
+
+def _deleteTexture(handle):
+  glDeleteTextures([handle])
+
+def _deleteList(handle):
+  glDeleteLists(handle, 1)
+
+def _deleteBuffer(handle):
+  glDeleteBuffers(1, [handle])
+
+def _deleteFramebuffer(handle):
+  glDeleteFramebuffersEXT(1, [handle])
+
+def _deleteRenderbuffer(handle):
+  glDeleteRenderbuffersEXT(1, [handle])
+
+DELETERS = {
+  TEXTURE:      _deleteTexture,
+  LIST:         _deleteList,
+  BUFFER:       _deleteBuffer,
+  FRAMEBUFFER:  _deleteFramebuffer,
+  RENDERBUFFER: _deleteRenderbuffer,
+}
+
+class GLResourceRegistry(object):
+  """Tracks live OpenGL objects and deletes released ones in the GL thread."""
+  def __init__(self, deleters = DELETERS):
+    self.deleters = deleters
+    self.live     = {}
+    self.pending  = deque()
+    self.lock     = threading.Lock()
+    self.deleted  = 0
+
+  def register(self, kind, handle, owner, size = 0):
+    """
+    Start tracking an OpenGL object.
+
+    @param kind:    Object type, e.g. L{TEXTURE} or L{LIST}
+    @param handle:  OpenGL name of the object
+    @param owner:   Name under which the memory use is reported
+    @param size:    Estimated size of the object in bytes
+    """
+    handle = int(handle)
+    with self.lock:
+      self.live[(kind, handle)] = [owner, size]
+
+  def resize(self, kind, handle, size):
+    """Update the estimated size of a live object after its storage changes."""
+    with self.lock:
+      entry = self.live.get((kind, int(handle)))
+      if entry is not None:
+        entry[1] = size
+
+  def release(self, kind, handle):
+    """
+    Mark an object for deletion. Safe to call from any thread, including
+    from C{__del__}; the object is deleted by the next L{drain} call.
+    """
+    handle = int(handle)
+    with self.lock:
+      if self.live.pop((kind, handle), None) is None:
+        return
+    self.pending.append((kind, handle))
+
+  def drain(self, budget = None):
+    """
+    Delete released objects. Must be called in the thread that owns the
+    OpenGL context.
+
+    @param budget:  Maximum number of objects to delete, or None for all
+    @return:        Number of objects deleted
+    """
+    count = 0
+    while self.pending and (budget is None or count < budget):
+      kind, handle = self.pending.popleft()
+      try:
+        self.deleters[kind](handle)
+      except Exception as e:
+        Log.warn("Unable to delete OpenGL %s %d: %s" % (kind, handle, e))
+      count += 1
+    self.deleted += count
+    return count
+
+  def pendingCount(self):
+    return len(self.pending)
+
+  def totalSize(self):
+    with self.lock:
+      return sum(size for owner, size in self.live.values())
+
+  def usage(self):
+    """
+    Summarize the live objects per owner.
+
+    @return:  List of (owner, object count, bytes) tuples, largest first
+    """
+    owners = {}
+    with self.lock:
+      for owner, size in self.live.values():
+        count, total = owners.get(owner, (0, 0))
+        owners[owner] = (count + 1, total + size)
+    return sorted([(owner, count, total) for owner, (count, total) in owners.items()],
+                  key = lambda u: (-u[2], u[0]))
+
+# The registry shared by all OpenGL objects in the process
+registry = GLResourceRegistry()
@@ -30,11 +30,11 @@ from .Video import Video
 from .Audio import Audio
 from .View import View
 from .Input import Input, KeyListener, SystemEventListener
-from .Resource import Resource
+from .Resource import Resource, getWritableResourcePath
 from .Data import Data
 from .Server import Server
 from .Session import ClientSession
-from .Svg import SvgContext, SvgDrawing, LOW_QUALITY, NORMAL_QUALITY, HIGH_QUALITY
+from .Svg import SvgContext, SvgDrawing, SvgCache, LOW_QUALITY, NORMAL_QUALITY, HIGH_QUALITY
 from .Debug import DebugLayer
 from .Language import _
 from . import Network
@@ -44,6 +44,7 @@ from . import Dialogs
 from . import Theme
 from . import Version
 from . import Mod
+from . import GLResource
 
 # define configuration keys
 Config.define("engine", "tickrate",     float, 1.0)
@@ -171,6 +172,8 @@ class GameEngine(Engine):
     geometry = (0, 0, w, h)
     self.svg = SvgContext(geometry)
     self.svg.setRenderingQuality(self.config.get("opengl", "svgquality"))
+    if self.config.get("opengl", "svgcache"):
+      self.svg.setCache(SvgCache(os.path.join(getWritableResourcePath(), "svgcache")))
     glViewport(int(viewport[0]), int(viewport[1]), int(viewport[2]), int(viewport[3]))
 
     self.input     = Input()
@@ -256,6 +259,7 @@ class GameEngine(Engine):
     
   def quit(self):
     self.shuttingDown = True
+    self.data.saveFontCharacters()
     self.audio.close()
     Engine.quit(self)
 
@@ -338,8 +342,13 @@ class GameEngine(Engine):
         self.mainloop = self.main
       self.view.render()
     self.video.flip()
+    self.deleteReleasedResources()
     return done
 
+  def deleteReleasedResources(self):
+    """Delete a bounded number of OpenGL objects released since the last frame."""
+    GLResource.registry.drain(self.config.get("opengl", "deletebudget"))
+
   def clearScreen(self):
     self.svg.clear(*Theme.backgroundColor)
 
@@ -358,6 +367,7 @@ class GameEngine(Engine):
     if self.debugLayer:
       self.debugLayer.render(1.0, True)
     self.video.flip()
+    self.deleteReleasedResources()
     return done
 
   def run(self):
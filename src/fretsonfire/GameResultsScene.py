@@ -22,7 +22,7 @@
 from .Scene import SceneServer, SceneClient
 from .Menu import Menu
 from . import Player, Dialogs, Song, Data, Theme
-from .Audio import Sound
+from .Font import TextBatch
 from .Language import _
 
 import pygame
@@ -127,7 +127,7 @@ class GameResultsSceneClient(GameResultsScene, SceneClient):
         taunt = random.choice(["perfect1.ogg", "perfect2.ogg", "perfect3.ogg"])
         
       if taunt:
-        self.engine.resource.load(self, "taunt", lambda: Sound(self.engine.resource.fileName(taunt)))
+        self.taunt = self.engine.data.getSoundEffect(taunt)
 
   def run(self, ticks):
     SceneClient.run(self, ticks)
@@ -155,6 +155,7 @@ class GameResultsSceneClient(GameResultsScene, SceneClient):
     glEnable(GL_COLOR_MATERIAL)
 
     self.engine.view.setOrthogonalProjection(normalize = True)
+    batch = TextBatch().begin()
     try:
       t = self.time / 100
       w, h, = self.engine.view.geometry[2:4]
@@ -230,4 +231,5 @@ class GameResultsSceneClient(GameResultsScene, SceneClient):
         w, h = font.getStringSize(text)
         font.render(text, (.5 - w / 2, .55 + h + v))
     finally:
+      batch.end()
       self.engine.view.resetProjection()
@@ -56,8 +56,8 @@ class Guitar:
     self.vertexCache    = numpy.empty((8 * 4096, 3), numpy.float32)
     self.colorCache     = numpy.empty((8 * 4096, 4), numpy.float32)
 
-    engine.resource.load(self,  "noteMesh", lambda: Mesh(engine.resource.fileName("note.dae")))
-    engine.resource.load(self,  "keyMesh",  lambda: Mesh(engine.resource.fileName("key.dae")))
+    engine.resource.load(self,  "noteMesh", lambda: Mesh(engine.resource.dataSource("note.dae")))
+    engine.resource.load(self,  "keyMesh",  lambda: Mesh(engine.resource.dataSource("key.dae")))
     engine.loadSvgDrawing(self, "glowDrawing", "glow.png")
     engine.loadSvgDrawing(self, "neckDrawing", "neck.png")
     engine.loadSvgDrawing(self, "stringDrawing", "string.png")
@@ -264,13 +264,14 @@ class Guitar:
     if color[3] > .9:
       glDisable(GL_BLEND)
     glShadeModel(GL_SMOOTH)
-    self.noteMesh.render("Mesh_001")
-    if isTappable:
-      self.noteMesh.render("Mesh_003")
-    glColor4f(.75 * color[0], .75 * color[1], .75 * color[2], color[3])
-    self.noteMesh.render("Mesh")
-    glColor4f(.25 * color[0], .25 * color[1], .25 * color[2], color[3])
-    self.noteMesh.render("Mesh_002")
+    with self.noteMesh:
+      self.noteMesh.render("Mesh_001")
+      if isTappable:
+        self.noteMesh.render("Mesh_003")
+      glColor4f(.75 * color[0], .75 * color[1], .75 * color[2], color[3])
+      self.noteMesh.render("Mesh")
+      glColor4f(.25 * color[0], .25 * color[1], .25 * color[2], color[3])
+      self.noteMesh.render("Mesh_002")
     glDepthMask(0)
     glPopMatrix()
     glEnable(GL_BLEND)
@@ -24,7 +24,7 @@ from .Song import Note, TextEvent, PictureEvent, loadSong
 from .Menu import Menu
 from .Guitar import Guitar, KEYS
 from .Language import _
-from . import Player, Dialogs, Data, Theme, View, Audio, Stage, Settings
+from . import Player, Dialogs, Data, Theme, View, Audio, Stage, Settings, Calibration
 
 import math
 import pygame
@@ -102,7 +102,7 @@ class GuitarSceneClient(GuitarScene, SceneClient):
     self.engine.view.popLayer(self.menu)
 
   def loadSettings(self):
-    self.delay            = self.engine.config.get("audio", "delay")
+    self.delay            = Calibration.getDelay(self.engine)
     self.screwUpVolume    = self.engine.config.get("audio", "screwupvol")
     self.guitarVolume     = self.engine.config.get("audio", "guitarvol")
     self.songVolume       = self.engine.config.get("audio", "songvol")
@@ -0,0 +1,150 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import Log
+from . import Config
+
+Config.define("opengl", "labelcachesize", int, 32)
+Config.define("opengl", "labeluploads",   int, 2)
+
+# Marker for label files that don't exist or can't be decoded
+MISSING = object()
+
+def _decodeLabel(fileName):
+  from .Texture import decodeImage
+  if not os.path.isfile(fileName):
+    return None
+  return decodeImage(fileName)
+
+def _uploadLabel(decoded):
+  from .Texture import Texture
+  texture = Texture(owner = "Song labels")
+  texture.loadRaw(*decoded)
+  return texture
+
+class LabelCache(object):
+  """
+  Least recently used cache of label textures with a byte budget.
+
+  Label images are decoded on worker threads and uploaded to OpenGL from
+  L{run}, which must be called in the main thread once per frame.
+  """
+  def __init__(self, budget, uploadsPerFrame = 2, workers = 2, decode = _decodeLabel, upload = _uploadLabel):
+    """
+    @param budget:           Maximum estimated texture memory in bytes
+    @param uploadsPerFrame:  Maximum number of textures created per L{run} call
+    @param workers:          Number of decoding threads
+    @param decode:           Function returning the raw image of a file name or None
+    @param upload:           Function turning a raw image into a texture
+    """
+    self.budget          = budget
+    self.uploadsPerFrame = uploadsPerFrame
+    self.decode          = decode
+    self.upload          = upload
+    self.entries         = OrderedDict()
+    self.size            = 0
+    self.pending         = {}
+    self.decoded         = deque()
+    self.workers         = workers
+    self.executor        = None
+
+  def _request(self, fileName):
+    if fileName in self.entries or fileName in self.pending:
+      return
+    if not self.executor:
+      self.executor = ThreadPoolExecutor(max_workers = self.workers)
+    future = self.executor.submit(self.decode, fileName)
+    future.add_done_callback(lambda f: self.decoded.append((fileName, f)))
+    self.pending[fileName] = future
+
+  def get(self, fileName):
+    """
+    Return the texture for a label file, or None if it is not available
+    yet. Missing labels are requested for decoding.
+    """
+    entry = self.entries.get(fileName)
+    if entry is None:
+      self._request(fileName)
+      return None
+    self.entries.move_to_end(fileName)
+    texture, size = entry
+    if texture is MISSING:
+      return None
+    return texture
+
+  def prefetch(self, fileNames):
+    """Start decoding the given label files if they aren't cached already."""
+    for fileName in fileNames:
+      self._request(fileName)
+
+  def cancel(self, keep = ()):
+    """Drop pending decode requests that haven't started, except those listed in keep."""
+    keep = set(keep)
+    for fileName, future in list(self.pending.items()):
+      if fileName not in keep and future.cancel():
+        del self.pending[fileName]
+
+  def run(self):
+    """Upload decoded labels to textures and evict old ones over the budget."""
+    uploads = 0
+    while self.decoded and uploads < self.uploadsPerFrame:
+      fileName, future = self.decoded.popleft()
+      if self.pending.get(fileName) is not future or future.cancelled():
+        continue
+      del self.pending[fileName]
+      try:
+        decoded = future.result()
+      except Exception as e:
+        Log.warn("Unable to load label %s: %s" % (fileName, e))
+        decoded = None
+      if decoded is None:
+        self._insert(fileName, MISSING, 0)
+        continue
+      (w, h), string, format, components = decoded
+      self._insert(fileName, self.upload(decoded), w * h * components * 4 // 3)
+      uploads += 1
+    self._evict()
+
+  def _insert(self, fileName, texture, size):
+    self.entries[fileName] = (texture, size)
+    self.size += size
+
+  def _evict(self):
+    # Always keep the most recently used label
+    while self.size > self.budget and len(self.entries) > 1:
+      fileName, (texture, size) = self.entries.popitem(last = False)
+      self.size -= size
+
+  def clear(self):
+    self.cancel()
+    self.entries.clear()
+    self.size = 0
+
+  def close(self):
+    """Release all textures and stop the decoding threads."""
+    self.clear()
+    if self.executor:
+      self.executor.shutdown(wait = False)
+      self.executor = None
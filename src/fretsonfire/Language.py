@@ -53,3 +53,14 @@ langOptions = {"": "English"}
 for lang in getAvailableLanguages():
   langOptions[lang] = _(lang)
 Config.define("game", "language", str, "", _("Language"), langOptions)
+
+def getCatalogCharacters():
+  """@return: String of the characters used by the active translation catalog"""
+  if not language:
+    return ""
+  characters = set()
+  for key, message in catalog._catalog.items():
+    # The empty message id holds the catalog metadata
+    if key:
+      characters.update(message)
+  return "".join(sorted(characters))
@@ -46,7 +46,7 @@ class MainMenu(BackgroundLayer):
     self.engine.loadSvgDrawing(self, "background", "keyboard.svg")
     self.engine.loadSvgDrawing(self, "guy",        "pose.svg")
     self.engine.loadSvgDrawing(self, "logo",       "logo.svg")
-    self.song = Audio.Sound(self.engine.resource.fileName("menu.ogg"))
+    self.song = Audio.Sound(self.engine.resource.dataSource("menu.ogg"))
     self.song.setVolume(self.engine.config.get("audio", "songvol"))
     self.song.play(-1)
 
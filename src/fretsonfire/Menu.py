@@ -25,6 +25,7 @@ import math
 
 from .View import Layer
 from .Input import KeyListener
+from .Font import TextBatch
 from . import Data
 from . import Theme
 from . import Dialogs
@@ -161,6 +162,7 @@ class Menu(Layer, KeyListener):
       return
 
     self.engine.view.setOrthogonalProjection(normalize = True)
+    batch = TextBatch().begin()
     try:
       v = (1 - visibility) ** 2
       font = self.engine.data.font
@@ -208,4 +210,5 @@ class Menu(Layer, KeyListener):
         y += h
         glPopMatrix()
     finally:
+      batch.end()
       self.engine.view.resetProjection()
@@ -20,136 +20,399 @@
 #####################################################################
 
 from OpenGL.GL import *
+import os
+import io
+import json
+import glob
+import hashlib
+import ctypes
+import math
+import numpy
 
 from . import Collada
+from . import GLResource
+from . import Log
+from .Resource import getWritableResourcePath
+
+# Floats in one interleaved vertex: texture coordinate, normal and position
+# as in the GL_T2F_N3F_V3F format
+VERTEX_COMPONENTS = 8
+VERTEX_SIZE       = VERTEX_COMPONENTS * 4
+
+NO_LIGHT = (GLfloat * 4)(0.0, 0.0, 0.0, 0.0)
+
+# Bump this whenever the layout of the mesh cache files changes
+MESH_CACHE_VERSION = 1
+
+def compileGeometry(geom):
+  """
+  Flatten the indexed primitives of a COLLADA geometry into vertex arrays
+  drawn as triangles.
+
+  @param geom:    L{Collada.DaeGeometry} instance
+  @return:        (vertices, normals, texcoords) float32 arrays; normals and
+                  texcoords may be None
+  """
+  vertices, normals, texcoords = [], [], []
+  mesh = geom.data
+  for prim in mesh.primitives:
+    vertexOffset = normalOffset = texcoordOffset = None
+    for input in prim.inputs:
+      if input.semantic == "VERTEX":
+        vertexOffset = input.offset
+        positionSource = mesh.FindSource(mesh.vertices.FindInput("POSITION"))
+      elif input.semantic == "NORMAL":
+        normalOffset = input.offset
+        normalSource = mesh.FindSource(input)
+      elif input.semantic == "TEXCOORD":
+        texcoordOffset = input.offset
+        texcoordSource = mesh.FindSource(input)
+    if vertexOffset is None:
+      continue
+
+    # Normals may also be given per position
+    if normalOffset is None:
+      normalSource = mesh.FindSource(mesh.vertices.FindInput("NORMAL"))
+      if normalSource is not None:
+        normalOffset = vertexOffset
+
+    indices = prim.Triangulate()
+    vertices.append(positionSource.GetArray(3)[indices[:, vertexOffset]])
+    normals.append(normalSource.GetArray(3)[indices[:, normalOffset]] if normalOffset is not None else None)
+    texcoords.append(texcoordSource.GetArray(2)[indices[:, texcoordOffset]] if texcoordOffset is not None else None)
+
+  def join(arrays, components):
+    if all(a is None for a in arrays):
+      return None
+    return numpy.concatenate([a if a is not None else numpy.zeros((len(v), components), numpy.float32)
+                              for a, v in zip(arrays, vertices)]).astype(numpy.float32)
+
+  if not vertices:
+    return numpy.zeros((0, 3), numpy.float32), None, None
+  return join(vertices, 3), join(normals, 3), join(texcoords, 2)
+
+class MeshData(object):
+  """
+  The parts of a COLLADA document needed for drawing it: flattened vertex
+  arrays for each geometry, the top level scene nodes and their lights.
+  """
+  def __init__(self, geometries, nodes, lights):
+    """
+    @param geometries:  Dictionary of geometry names to (vertices, normals, texcoords) arrays
+    @param nodes:       List of (node name, transformations, geometry names) tuples
+    @param lights:      List of (light number, position, color) tuples
+    """
+    self.geometries = geometries
+    self.nodes      = nodes
+    self.lights     = lights
+
+  @classmethod
+  def fromDocument(cls, doc):
+    """
+    Compile a parsed COLLADA document.
+
+    @param doc:   L{Collada.DaeDocument} instance
+    @return:      L{MeshData} instance
+    """
+    geometries = {}
+    for geom in doc.geometriesLibrary.items:
+      if geom.data is not None:
+        geometries[geom.name] = compileGeometry(geom)
+
+    nodes  = []
+    lights = []
+    for scene in doc.visualScenesLibrary.items:
+      for node in scene.nodes:
+        for n, light in enumerate(node.iLights):
+          if light.object:
+            # TODO: hierarchical node transformation, other types of lights
+            pos = [0.0, 0.0, 0.0, 1.0]
+            for t in node.transforms:
+              if t[0] == "translate":
+                pos = t[1]
+            lights.append((n, [float(v) for v in pos], [float(v) for v in light.object.techniqueCommon.color]))
+        names = [geom.object.name for geom in node.iGeometries if geom.object]
+        nodes.append((node.name, [(t[0], [float(v) for v in t[1]]) for t in node.transforms], names))
+    return cls(geometries, nodes, lights)
+
+  def save(self, fileName):
+    """
+    Write the mesh into a pair of files: a raw float array named fileName
+    plus ".npy" and a description of its contents named fileName plus ".json".
+    """
+    arrays = []
+    offset = 0
+    geometries = []
+    for name, (vertices, normals, texcoords) in self.geometries.items():
+      entry = {"name": name, "offset": offset, "count": len(vertices),
+               "normals": normals is not None, "texcoords": texcoords is not None}
+      for array in (vertices, normals, texcoords):
+        if array is not None:
+          arrays.append(numpy.ascontiguousarray(array, numpy.float32).reshape(-1))
+          offset += arrays[-1].size
+      geometries.append(entry)
+    info = {"version": MESH_CACHE_VERSION, "geometries": geometries, "nodes": self.nodes, "lights": self.lights}
+
+    # The description is written last so that it only exists for complete files
+    for suffix, write in ((".npy",  lambda f: numpy.save(f, numpy.concatenate(arrays) if arrays else numpy.zeros(0, numpy.float32))),
+                          (".json", lambda f: f.write(json.dumps(info).encode("utf-8")))):
+      with open(fileName + suffix + ".tmp", "wb") as f:
+        write(f)
+      os.replace(fileName + suffix + ".tmp", fileName + suffix)
+
+  @classmethod
+  def load(cls, fileName):
+    """
+    Load a mesh written by L{save}. The vertex data is memory mapped.
+
+    @return:    L{MeshData} instance or None if the files don't exist
+    """
+    if not os.path.isfile(fileName + ".json"):
+      return None
+    with open(fileName + ".json", "rb") as f:
+      info = json.loads(f.read().decode("utf-8"))
+    if info.get("version") != MESH_CACHE_VERSION:
+      return None
+    data = numpy.load(fileName + ".npy", mmap_mode = "r")
+
+    geometries = {}
+    for entry in info["geometries"]:
+      offset, count = entry["offset"], entry["count"]
+      arrays = []
+      for present, components in ((True, 3), (entry["normals"], 3), (entry["texcoords"], 2)):
+        if present:
+          arrays.append(data[offset:offset + count * components].reshape(count, components))
+          offset += count * components
+        else:
+          arrays.append(None)
+      geometries[entry["name"]] = tuple(arrays)
+    nodes  = [(name, [tuple(t) for t in transforms], geoms) for name, transforms, geoms in info["nodes"]]
+    lights = [tuple(light) for light in info["lights"]]
+    return cls(geometries, nodes, lights)
+
+def getMeshCacheFile(fileName, contents):
+  """@return: Name, without a suffix, of the cache files of a mesh with the given contents"""
+  if hasattr(fileName, "read"):
+    # Files in data archives are told apart by the archive they are in
+    source = os.path.join(getattr(fileName, "archiveFileName", "") or "", str(getattr(fileName, "name", "")))
+  else:
+    source = os.path.abspath(fileName)
+  # Name the files after the source directory too, so that meshes with the
+  # same name in different directories don't remove each other's files
+  sourceDir = os.path.dirname(source)
+  name = "%s_%s-%s" % (os.path.basename(source), hashlib.sha1(sourceDir.encode("utf-8")).hexdigest()[:8],
+                       hashlib.sha1(contents).hexdigest()[:16])
+  return os.path.join(getWritableResourcePath(), "meshcache", name)
+
+def _removeStaleMeshCaches(cacheFileName):
+  # Forget compiled copies of earlier versions of the same file
+  prefix = cacheFileName.rsplit("-", 1)[0]
+  for stale in glob.glob(glob.escape(prefix) + "-*.npy") + glob.glob(glob.escape(prefix) + "-*.json"):
+    if not os.path.basename(stale).startswith(os.path.basename(cacheFileName) + "."):
+      os.unlink(stale)
+
+def loadMeshData(fileName, cacheFileName = None):
+  """
+  Load a COLLADA file, preferably from a compiled copy of an earlier load.
+
+  @param fileName:       File name or file object of a COLLADA document
+  @param cacheFileName:  Cache file name without a suffix, or None to use
+                         L{getMeshCacheFile}
+  @return:               L{MeshData} instance
+  """
+  if hasattr(fileName, "read"):
+    contents = fileName.read()
+  else:
+    with open(fileName, "rb") as f:
+      contents = f.read()
+  defaultCache = cacheFileName is None
+  if defaultCache:
+    cacheFileName = getMeshCacheFile(fileName, contents)
+
+  try:
+    data = MeshData.load(cacheFileName)
+    if data:
+      return data
+  except Exception as e:
+    Log.warn("Unable to read mesh cache %s: %s" % (cacheFileName, e))
+
+  doc = Collada.DaeDocument()
+  doc.LoadDocumentFromFile(io.BytesIO(contents))
+  data = MeshData.fromDocument(doc)
+
+  try:
+    directory = os.path.dirname(cacheFileName)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    if defaultCache:
+      _removeStaleMeshCaches(cacheFileName)
+    data.save(cacheFileName)
+  except (IOError, OSError) as e:
+    Log.warn("Unable to write mesh cache %s: %s" % (cacheFileName, e))
+  return data
+
+def transformMatrix(transforms):
+  """
+  Combine COLLADA node transformations into a single matrix.
+
+  @param transforms:  List of (type, values) tuples; translate, rotate and
+                      scale are supported
+  @return:            4x4 matrix in column major order for glMultMatrixf, or
+                      None if the transformations cancel out
+  """
+  m = numpy.identity(4)
+  for kind, values in transforms:
+    t = numpy.identity(4)
+    if kind == "translate":
+      t[0:3, 3] = values[0:3]
+    elif kind == "rotate":
+      # Same as glRotate: an angle in degrees around a normalized axis
+      axis = numpy.array(values[0:3], numpy.float64)
+      length = numpy.sqrt((axis ** 2).sum())
+      if length == 0:
+        continue
+      x, y, z = axis / length
+      a = math.radians(values[3])
+      c, s = math.cos(a), math.sin(a)
+      t[0:3, 0:3] = [[x * x * (1 - c) + c,     x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+                     [y * x * (1 - c) + z * s, y * y * (1 - c) + c,     y * z * (1 - c) - x * s],
+                     [x * z * (1 - c) - y * s, y * z * (1 - c) + x * s, z * z * (1 - c) + c]]
+    elif kind == "scale":
+      t[0, 0], t[1, 1], t[2, 2] = values[0:3]
+    else:
+      continue
+    m = m.dot(t)
+  if numpy.allclose(m, numpy.identity(4)):
+    return None
+  return (GLfloat * 16)(*m.T.ravel())
 
 class Mesh:
-  def __init__(self, fileName):
-    self.doc = Collada.DaeDocument()
-    self.doc.LoadDocumentFromFile(fileName)
-    self.geoms = {}
-    self.fullGeoms = {}
-    
-  def _unflatten(self, array, stride):
-    return [tuple(array[i * stride : (i + 1) * stride]) for i in range(len(array) // stride)]
-
-  def setupLight(self, light, n, pos):
-    l = light.techniqueCommon
+  def __init__(self, fileName, cacheFileName = None):
+    """
+    @param fileName:       File name or file object of a COLLADA document
+    @param cacheFileName:  Compiled mesh cache file name without a suffix,
+                           see L{loadMeshData}
+    """
+    self.data   = loadMeshData(fileName, cacheFileName)
+    self.buffer = None
+    self.ranges = {}
+    self.depth  = 0
+    self.arrays = {}
+    self.nodes  = [(name, transformMatrix(transforms), geoms) for name, transforms, geoms in self.data.nodes]
+    # Array parameters are converted once; plain sequences are much slower to pass to OpenGL
+    self.lights = [(n, (GLfloat * 4)(pos[0], pos[1], pos[2], 0.0), (GLfloat * 4)(color[0], color[1], color[2], 0.0))
+                   for n, pos, color in self.data.lights]
+
+  def __del__(self):
+    try:
+      if self.buffer is not None:
+        GLResource.registry.release(GLResource.BUFFER, self.buffer)
+    except (NameError, AttributeError):
+      pass
+
+  def setupLight(self, color, n, pos):
+    """
+    @param color:   Diffuse color of the light as an RGBA array
+    @param n:       Light number
+    @param pos:     Direction of the light as an XYZW array
+    """
     glEnable(GL_LIGHTING)
     glEnable(GL_LIGHT0 + n)
-    glLightfv(GL_LIGHT0 + n, GL_POSITION, (pos[0], pos[1], pos[2], 0.0))
-    glLightfv(GL_LIGHT0 + n, GL_DIFFUSE, (l.color[0], l.color[1], l.color[2], 0.0))
-    glLightfv(GL_LIGHT0 + n, GL_AMBIENT, (0.0, 0.0, 0.0, 0.0))
+    glLightfv(GL_LIGHT0 + n, GL_POSITION, pos)
+    glLightfv(GL_LIGHT0 + n, GL_DIFFUSE, color)
+    glLightfv(GL_LIGHT0 + n, GL_AMBIENT, NO_LIGHT)
 
   def setupMaterial(self, material):
     # Material data is not parsed by the lightweight COLLADA loader yet.
     return
 
+  def _upload(self):
+    """Interleave the vertices of all geometries into one buffer object."""
+    total = sum(len(vertices) for vertices, normals, texcoords in self.data.geometries.values())
+    data = numpy.zeros((total, VERTEX_COMPONENTS), numpy.float32)
+    first = 0
+    for name, (vertices, normals, texcoords) in self.data.geometries.items():
+      count = len(vertices)
+      data[first:first + count, 5:8] = vertices
+      if normals is not None:
+        data[first:first + count, 2:5] = normals
+      if texcoords is not None:
+        data[first:first + count, 0:2] = texcoords
+      self.ranges[name] = (first, count, normals is not None, texcoords is not None)
+      first += count
+
+    self.buffer = glGenBuffers(1)
+    GLResource.registry.register(GLResource.BUFFER, self.buffer, "Mesh", data.nbytes)
+    glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+    glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+  def begin(self):
+    """
+    Set up the vertex buffer and lights of this mesh. Consecutive L{render}
+    calls between L{begin} and L{end} share the setup, which is much cheaper
+    than setting it up for each call. No other vertex arrays may be drawn
+    in between.
+    """
+    self.depth += 1
+    if self.depth > 1:
+      return
+    if self.buffer is None:
+      self._upload()
+
+    # setup lights
+    for n, pos, color in self.lights:
+      self.setupLight(color, n, pos)
+
+    # The buffer binding is part of the client state and restored in end()
+    glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+    glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+    glInterleavedArrays(GL_T2F_N3F_V3F, 0, ctypes.c_void_p(0))
+    self.arrays = {GL_NORMAL_ARRAY: True, GL_TEXTURE_COORD_ARRAY: True}
+
+  def end(self):
+    """Undo the setup done in L{begin}."""
+    self.depth -= 1
+    if self.depth > 0:
+      return
+    glPopClientAttrib()
+    glDisable(GL_LIGHTING)
+    for n, pos, color in self.lights:
+      glDisable(GL_LIGHT0 + n)
+
+  def __enter__(self):
+    self.begin()
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.end()
+
   def render(self, geomName = None):
-    if geomName in self.fullGeoms:
-      glCallList(self.fullGeoms[geomName])
+    """
+    Draw the geometry of one scene node, or the whole scene.
+
+    @param geomName:  Node name or None for all nodes
+    """
+    self.begin()
+    try:
+      for name, matrix, geoms in self.nodes:
+        if geomName is not None and name != geomName:
+          continue
+        for geom in geoms:
+          if geom in self.ranges:
+            self._draw(matrix, *self.ranges[geom])
+    finally:
+      self.end()
+
+  def _draw(self, matrix, first, count, hasNormals, hasTexcoords):
+    for array, enabled in ((GL_NORMAL_ARRAY, hasNormals), (GL_TEXTURE_COORD_ARRAY, hasTexcoords)):
+      if self.arrays[array] != enabled:
+        (glEnableClientState if enabled else glDisableClientState)(array)
+        self.arrays[array] = enabled
+    if matrix is None:
+      glDrawArrays(GL_TRIANGLES, first, count)
       return
-      
-    # Prepare a new list for all the geometry
-    if not self.geoms:
-      for geom in self.doc.geometriesLibrary.items:
-        self.geoms[geom.name] = glGenLists(1)
-        glNewList(self.geoms[geom.name], GL_COMPILE)
-  
-        for prim in geom.data.primitives:
-          maxOffset = vertexOffset = normalOffset = 0
-          vertexOffset = None
-          normalOffset = None
-          texcoordOffset = None
-          vertices = None
-          normals = None
-          texcoords = None
-  
-          for input in prim.inputs:
-            maxOffset = max(maxOffset, input.offset)
-            if input.semantic == "VERTEX":
-              vertexOffset = input.offset
-              vertices = geom.data.FindSource(geom.data.vertices.FindInput("POSITION"))
-              assert vertices.techniqueCommon.accessor.stride == 3
-              vertices = self._unflatten(vertices.source.data, vertices.techniqueCommon.accessor.stride)
-            elif input.semantic == "NORMAL":
-              normalOffset = input.offset
-              normals = geom.data.FindSource(input)
-              normals = self._unflatten(normals.source.data, 3)
-            elif input.semantic == "TEXCOORD":
-              texcoordOffset = input.offset
-              texcoords = geom.data.FindSource(input)
-              texcoords = self._unflatten(texcoords.source.data, 2)
-  
-          if normalOffset is None:
-            normals = geom.data.FindSource(geom.data.vertices.FindInput("NORMAL"))
-            normals = self._unflatten(normals.source.data, 3)
-            normalOffset = vertexOffset
-  
-          def drawElement(indices, offset, array, func):
-            if offset is not None:
-              func(*array[indices[offset]])
-          
-          if hasattr(prim, "polygons"):
-            for poly in prim.polygons:
-              glBegin(GL_POLYGON)
-              for indices in self._unflatten(poly, maxOffset + 1):
-                drawElement(indices, normalOffset,   normals,   glNormal3f)
-                drawElement(indices, texcoordOffset, texcoords, glTexCoord2f)
-                drawElement(indices, vertexOffset,   vertices,  glVertex3f)
-              glEnd()
-          elif hasattr(prim, "triangles"):
-           glBegin(GL_TRIANGLES)
-           for indices in self._unflatten(prim.triangles, maxOffset + 1):
-              drawElement(indices, normalOffset,   normals,   glNormal3f)
-              drawElement(indices, texcoordOffset, texcoords, glTexCoord2f)
-              drawElement(indices, vertexOffset,   vertices,  glVertex3f)
-           glEnd()
-            
-        glEndList()
-      
-    # Prepare a new display list for this particular geometry
-    self.fullGeoms[geomName] = glGenLists(1)
-    glNewList(self.fullGeoms[geomName], GL_COMPILE)
-    
-    if self.geoms:
-      # setup lights
-      for scene in self.doc.visualScenesLibrary.items:
-        for node in scene.nodes:
-          for n, light in enumerate(node.iLights):
-            if light.object:
-              # TODO: hierarchical node transformation, other types of lights
-              pos = [0.0, 0.0, 0.0, 1.0]
-              for t in node.transforms:
-                if t[0] == "translate":
-                  pos = t[1]
-              self.setupLight(light.object, n, pos)
-              
-      # render geometry
-      for scene in self.doc.visualScenesLibrary.items:
-        for node in scene.nodes:
-          if geomName is not None and node.name != geomName:
-            continue
-          for geom in node.iGeometries:
-            if geom.object:
-              #for mat in geom.bindMaterials:
-              #  self.setupMaterial(mat)
-                
-              glPushMatrix()
-              for t in node.transforms:
-                if t[0] == "translate":
-                  glTranslatef(*t[1])
-                elif t[0] == "rotate":
-                  glRotatef(t[1][3], t[1][0], t[1][1], t[1][2])
-                elif t[0] == "scale":
-                  glScalef(*t[1])
-              if geom.object.name in self.geoms:
-                glCallList(self.geoms[geom.object.name])
-              glPopMatrix()
-      glDisable(GL_LIGHTING)
-      for n in range(8):
-        glDisable(GL_LIGHT0 + n)
-    glEndList()
-      
-    # Render the new list
-    self.render(geomName)
+    glPushMatrix()
+    glMultMatrixf(matrix)
+    glDrawArrays(GL_TRIANGLES, first, count)
+    glPopMatrix()
@@ -0,0 +1,169 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+"""Mixing the audio tracks of a song into a single wave file."""
+
+import os
+import glob
+import wave
+import hashlib
+
+import numpy
+import pygame
+
+from . import Log
+from .Resource import getWritableResourcePath
+
+# Song tracks and the options setting their volumes
+TRACKS = [
+  ("song.ogg",   "songvol"),
+  ("guitar.ogg", "guitarvol"),
+  ("rhythm.ogg", "rhythmvol"),
+]
+
+def getSongTracks(engine, library, songName):
+  """
+  Find the audio tracks of a song.
+
+  @param engine:    Game engine
+  @param library:   Library of the song
+  @param songName:  Name of the song directory
+  @return:          List of (file name, volume) pairs
+  """
+  tracks = []
+  for trackName, volume in TRACKS:
+    fileName = engine.resource.fileName(library, songName, trackName)
+    if os.path.isfile(fileName):
+      tracks.append((fileName, engine.config.get("audio", volume)))
+  return tracks
+
+def getCacheFile(directory, tracks, key):
+  """
+  Name a file derived from audio tracks.
+
+  @param directory:  Cache directory under the writable resource path
+  @param tracks:     List of (file name, volume) pairs
+  @param key:        Other values the contents of the file depend on
+  @return:           Name of a wave file that changes with the tracks and key
+  """
+  key = list(key)
+  for fileName, volume in tracks:
+    try:
+      key.append((fileName, os.stat(fileName).st_mtime_ns, volume))
+    except OSError:
+      key.append((fileName, 0, volume))
+  # Name the file after the song directory so that stale files can be found
+  songDir = os.path.dirname(tracks[0][0]) if tracks else ""
+  name    = "%s_%s" % (os.path.basename(songDir), hashlib.sha1(songDir.encode("utf-8")).hexdigest()[:8])
+  return os.path.join(getWritableResourcePath(), directory,
+                      "%s-%s.wav" % (name, hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]))
+
+def removeStaleFiles(fileName):
+  """Remove the files made by L{getCacheFile} from earlier versions of the same tracks."""
+  prefix = fileName.rsplit("-", 1)[0]
+  for stale in glob.glob(glob.escape(prefix) + "-*.wav"):
+    if stale != fileName:
+      os.unlink(stale)
+
+def decodeTrack(fileName, format):
+  """
+  Decode an audio file with the mixer.
+
+  @param fileName:  Audio file name
+  @param format:    Mixer (frequency, format, channels) tuple
+  @return:          Array of samples with one column per channel
+  """
+  frequency, bits, channels = format
+  return pygame.sndarray.array(pygame.mixer.Sound(fileName)).reshape(-1, channels)
+
+def mixTracks(stems, volumes, format, first = 0, length = None):
+  """
+  Mix decoded tracks together.
+
+  @param stems:    List of sample arrays from L{decodeTrack}
+  @param volumes:  Volume of each stem
+  @param format:   Mixer (frequency, format, channels) tuple of the stems
+  @param first:    First sample to mix
+  @param length:   Number of samples to mix, or None to mix to the end of the longest stem
+  @return:         float32 array of signed 16 bit samples
+  """
+  frequency, bits, channels = format
+  if length is None:
+    length = max([len(samples) for samples in stems] + [first]) - first
+  mix   = numpy.zeros((length, channels), numpy.float32)
+  scale = 1 << (16 - abs(bits))
+  for samples, volume in zip(stems, volumes):
+    samples = samples[first:first + length].astype(numpy.float32)
+    if bits > 0:
+      samples -= 1 << (bits - 1)
+    mix[:len(samples)] += samples * numpy.float32(volume * scale)
+  return mix
+
+def writeWave(fileName, mix, frequency):
+  """
+  Write mixed samples into a 16 bit wave file.
+
+  @param fileName:   Output file name
+  @param mix:        Array of samples from L{mixTracks}
+  @param frequency:  Sample rate
+  """
+  pcm = numpy.clip(mix, -32768, 32767).astype("<i2")
+  if not os.path.isdir(os.path.dirname(fileName)):
+    os.makedirs(os.path.dirname(fileName))
+  tmpFileName = fileName + ".tmp"
+  f = wave.open(tmpFileName, "wb")
+  try:
+    f.setnchannels(pcm.shape[1])
+    f.setsampwidth(2)
+    f.setframerate(frequency)
+    f.writeframes(pcm.tobytes())
+  finally:
+    f.close()
+  os.replace(tmpFileName, fileName)
+
+def getMixdown(tracks, format = None):
+  """
+  Mix the tracks of a song into a seekable wave file, reusing the file
+  made by an earlier call if the tracks haven't changed.
+
+  @param tracks:  List of (file name, volume) pairs
+  @param format:  Mixer (frequency, format, channels) tuple, or None to
+                  use the current mixer format
+  @return:        Name of the mixed file
+  """
+  format   = format or pygame.mixer.get_init()
+  fileName = getCacheFile("mixcache", tracks, [format])
+  if os.path.isfile(fileName):
+    return fileName
+
+  Log.notice("Mixing %d tracks into %s." % (len(tracks), fileName))
+  frequency, bits, channels = format
+  mix = None
+  # Decode one stem at a time to keep only one of them in memory
+  for trackName, volume in tracks:
+    stem = mixTracks([decodeTrack(trackName, format)], [volume], format)
+    if mix is None or len(stem) > len(mix):
+      stem, mix = mix, stem
+    if stem is not None:
+      mix[:len(stem)] += stem
+  writeWave(fileName, mix, frequency)
+  removeStaleFiles(fileName)
+  return fileName
@@ -36,6 +36,10 @@ def init(engine):
     activateMod(engine, m)
 
 def getAvailableMods(engine):
+  overlay = engine.resource.overlay
+  if overlay.isdir("mods"):
+    return [m for m in overlay.listdir("mods") if overlay.isdir("mods", m) and not m.startswith(".")]
+
   modPath = _getModPath(engine)
   try:
     dirList = os.listdir(modPath)
@@ -0,0 +1,195 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pygame
+
+from . import Log
+from . import Config
+from . import Audio
+from . import Mixdown
+
+Config.define("audio", "preview_start",  int, 30000)
+Config.define("audio", "preview_length", int, 15000)
+
+# Length of the fades at the ends of a clip in milliseconds
+PREVIEW_FADE_IN  = 250
+PREVIEW_FADE_OUT = 1000
+
+class PreviewClip(object):
+  """Description of the preview clip of a song."""
+  def __init__(self, tracks, start, length):
+    """
+    @param tracks:   List of (audio file name, volume) pairs to mix
+    @param start:    Start of the clip in the song in milliseconds
+    @param length:   Length of the clip in milliseconds
+    """
+    self.tracks = tracks
+    self.start  = start
+    self.length = length
+
+  def getCacheFile(self, format):
+    """
+    @param format:  Mixer (frequency, format, channels) tuple
+    @return:        Name of the file holding the rendered clip
+    """
+    return Mixdown.getCacheFile("previewcache", self.tracks, [format, self.start, self.length])
+
+def getPreviewClip(engine, info, library):
+  """
+  Describe the preview clip of a song using the current audio settings.
+
+  @param engine:   Game engine
+  @param info:     L{Song.SongInfo} of the song
+  @param library:  Library of the song
+  @return:         L{PreviewClip} instance
+  """
+  start = info.previewStart
+  if start is None:
+    start = engine.config.get("audio", "preview_start")
+  return PreviewClip(Mixdown.getSongTracks(engine, library, info.songName), start,
+                     engine.config.get("audio", "preview_length"))
+
+def _readClip(decoder, format, first, length):
+  """
+  Decode a window of a track in the mixer sample rate.
+
+  @param decoder:  Decoder from L{Audio.openDecoder}
+  @param format:   Mixer (frequency, format, channels) tuple
+  @param first:    First sample of the window at the mixer sample rate
+  @param length:   Number of samples in the window at the mixer sample rate
+  @return:         int16 array with one column per mixer channel
+  """
+  frequency, bits, channels = format
+  rate = decoder.frequency
+  decoder.seek(first * rate // frequency)
+  # One extra sample lets the resampler interpolate up to the end of the window
+  samples = decoder.read(length * rate // frequency + 2)
+  if rate != frequency:
+    samples = Audio.Resampler(rate, frequency)(samples)
+  return Audio.convertSamples(samples[:length], (frequency, -16, channels))
+
+def renderPreview(clip, fileName, format):
+  """
+  Mix the tracks of a preview clip into a wave file.
+
+  Only the clip window of each track is decoded.
+
+  @param clip:      L{PreviewClip} to render
+  @param fileName:  Output file name
+  @param format:    Mixer (frequency, format, channels) tuple; the clip
+                    always has 16 bit samples
+  """
+  frequency, bits, channels = format
+  first    = clip.start  * frequency // 1000
+  length   = clip.length * frequency // 1000
+  decoders = [Audio.openDecoder(trackName) for trackName, volume in clip.tracks]
+  try:
+    # Songs shorter than the preview start are previewed from the beginning
+    if decoders and first >= max(d.getLength() * frequency // d.frequency for d in decoders):
+      first = 0
+    stems = [_readClip(decoder, format, first, length) for decoder in decoders]
+  finally:
+    for decoder in decoders:
+      decoder.close()
+  mix = Mixdown.mixTracks(stems, [volume for trackName, volume in clip.tracks], (frequency, -16, channels), 0, length)
+
+  fadeIn  = min(length, PREVIEW_FADE_IN  * frequency // 1000)
+  fadeOut = min(length, PREVIEW_FADE_OUT * frequency // 1000)
+  mix[:fadeIn]           *= numpy.linspace(0, 1, fadeIn,  dtype = numpy.float32)[:, numpy.newaxis]
+  mix[length - fadeOut:] *= numpy.linspace(1, 0, fadeOut, dtype = numpy.float32)[:, numpy.newaxis]
+  Mixdown.writeWave(fileName, mix, frequency)
+  Mixdown.removeStaleFiles(fileName)
+
+class PreviewCache(object):
+  """
+  Renders preview clips in the background and keeps them on disk, so
+  that previewing a song only needs to load a few seconds of audio.
+  """
+  def __init__(self, workers = 1, render = renderPreview):
+    """
+    @param workers:  Number of rendering threads
+    @param render:   Function rendering a clip into a file
+    """
+    self.render   = render
+    self.workers  = workers
+    self.pending  = {}
+    self.executor = None
+
+  def _getFormat(self):
+    return pygame.mixer.get_init()
+
+  def _render(self, clip, fileName, format):
+    if not os.path.isfile(fileName):
+      self.render(clip, fileName, format)
+
+  def _request(self, clip):
+    format   = self._getFormat()
+    fileName = clip.getCacheFile(format)
+    future   = self.pending.get(fileName)
+    if future is None:
+      if not self.executor:
+        self.executor = ThreadPoolExecutor(max_workers = self.workers)
+      future = self.executor.submit(self._render, clip, fileName, format)
+      self.pending[fileName] = future
+      future.add_done_callback(lambda f: self.pending.pop(fileName, None))
+    return fileName, future
+
+  def prefetch(self, clips):
+    """Start rendering the given clips if they aren't on disk already."""
+    for clip in clips:
+      if clip.tracks and not os.path.isfile(clip.getCacheFile(self._getFormat())):
+        self._request(clip)
+
+  def cancel(self, keep = ()):
+    """Drop pending renders that haven't started, except for the clips listed in keep."""
+    format = self._getFormat()
+    keep = set(clip.getCacheFile(format) for clip in keep)
+    for fileName, future in list(self.pending.items()):
+      if fileName not in keep and future.cancel():
+        self.pending.pop(fileName, None)
+
+  def load(self, clip):
+    """
+    Render a clip if needed and load it. May be called from any thread.
+
+    @return:  L{Audio.Sound} instance
+    """
+    fileName = clip.getCacheFile(self._getFormat())
+    if os.path.isfile(fileName):
+      return Audio.Sound(fileName)
+    fileName, future = self._request(clip)
+    try:
+      future.result()
+    except Exception as e:
+      Log.warn("Unable to render preview clip %s: %s" % (fileName, e))
+      raise
+    return Audio.Sound(fileName)
+
+  def close(self):
+    """Stop the rendering threads."""
+    self.cancel()
+    if self.executor:
+      self.executor.shutdown(wait = False)
+      self.executor = None
@@ -25,6 +25,11 @@ from threading import Thread, BoundedSemaphore
 import time
 import shutil
 import stat
+import json
+import io
+import mmap
+import struct
+import fnmatch
 
 from .Task import Task
 from . import Log
@@ -95,23 +100,459 @@ class Loader(Thread):
     """Backwards-compat wrapper for Python 2-era Thread API."""
     return self.is_alive()
 
+def _overlayKey(name):
+  """
+  Convert a sequence of path components into an overlay index key.
+
+  @param name:    Path components relative to a data root
+  @return:        Normalized relative path using forward slashes
+  """
+  key = os.path.normpath(os.path.join(*name)) if name else ""
+  if key == ".":
+    return ""
+  return key.replace(os.sep, "/")
+
+class DataOverlay(object):
+  """
+  A merged index of the files in a list of data roots.
+
+  Each root is walked once and the resulting file lists are cached in a
+  manifest in the writable resource directory. The cached listing of a root
+  is reused as long as the modification times of its directories are
+  unchanged. Lookups map a relative path to the physical file in the first
+  root that contains it, just like the linear search in L{Resource.fileName}.
+  """
+  MANIFEST_VERSION = 1
+
+  def __init__(self, roots = [], manifestFileName = None):
+    """
+    @param roots:             Data root directories, highest priority first
+    @param manifestFileName:  File for caching the root indices or None
+    """
+    self.manifestFileName = manifestFileName
+    self.rootIndices      = {}
+    self.roots            = []
+    self.paths            = {}
+    self.files            = set()
+    self.dirs             = {}
+    self._loadManifest()
+    self.setRoots(roots)
+
+  def _loadManifest(self):
+    if not self.manifestFileName or not os.path.isfile(self.manifestFileName):
+      return
+    try:
+      with open(self.manifestFileName, "r", encoding = "utf-8") as f:
+        manifest = json.load(f)
+      if manifest.get("version") == self.MANIFEST_VERSION:
+        self.rootIndices = manifest["roots"]
+    except Exception as e:
+      Log.warn("Unable to read data overlay manifest: %s" % e)
+      self.rootIndices = {}
+
+  def _saveManifest(self):
+    if not self.manifestFileName:
+      return
+    try:
+      tmpFileName = self.manifestFileName + ".tmp"
+      with open(tmpFileName, "w", encoding = "utf-8") as f:
+        json.dump({"version": self.MANIFEST_VERSION, "roots": self.rootIndices}, f)
+      os.replace(tmpFileName, self.manifestFileName)
+    except Exception as e:
+      Log.warn("Unable to write data overlay manifest: %s" % e)
+
+  def _isRootIndexValid(self, root, index):
+    try:
+      for relDir, mtime in index["dirs"].items():
+        if os.stat(os.path.join(root, relDir)).st_mtime_ns != mtime:
+          return False
+    except OSError:
+      return False
+    return True
+
+  def _scanRoot(self, root):
+    Log.debug("Indexing data root '%s'." % root)
+    dirs  = {}
+    files = []
+    for dirPath, dirNames, fileNames in os.walk(root, followlinks = True):
+      relDir = os.path.relpath(dirPath, root)
+      relDir = "" if relDir == "." else relDir.replace(os.sep, "/")
+      dirs[relDir] = os.stat(dirPath).st_mtime_ns
+      prefix = relDir + "/" if relDir else ""
+      files.extend(prefix + fileName for fileName in fileNames)
+    return {"dirs": dirs, "files": files}
+
+  def setRoots(self, roots):
+    """
+    Set the data roots and rebuild the merged index.
+
+    Roots whose cached index is still valid are not rescanned.
+
+    @param roots:   Data root directories, highest priority first
+    """
+    self.roots = [os.path.abspath(root) for root in roots]
+    dirty = False
+    for root in self.roots:
+      if not os.path.isdir(root):
+        continue
+      index = self.rootIndices.get(root)
+      if index is None or not self._isRootIndexValid(root, index):
+        self.rootIndices[root] = self._scanRoot(root)
+        dirty = True
+    if dirty:
+      # Forget roots that have been removed from the disk
+      for root in list(self.rootIndices.keys()):
+        if not os.path.isdir(root):
+          del self.rootIndices[root]
+      self._saveManifest()
+
+    # Merge the roots so that the first one providing a path wins
+    self.paths = {}
+    self.files = set()
+    self.dirs  = {}
+    for root in reversed(self.roots):
+      index = self.rootIndices.get(root)
+      if index is None or not os.path.isdir(root):
+        continue
+      for relDir in index["dirs"]:
+        self.paths[relDir] = os.path.join(root, relDir) if relDir else root
+        self.files.discard(relDir)
+        self.dirs.setdefault(relDir, set())
+        if relDir:
+          parent, _, child = relDir.rpartition("/")
+          self.dirs.setdefault(parent, set()).add(child)
+      for relPath in index["files"]:
+        self.paths[relPath] = os.path.join(root, relPath)
+        self.files.add(relPath)
+        self.dirs.pop(relPath, None)
+        parent, _, child = relPath.rpartition("/")
+        self.dirs.setdefault(parent, set()).add(child)
+
+  def refresh(self):
+    """Rescan any roots that have changed since they were indexed."""
+    self.setRoots(self.roots)
+
+  def find(self, *name):
+    """
+    Find the physical file or directory that provides a data path.
+
+    @param name:    Path components relative to the data roots
+    @return:        Physical path or None if no root has the path
+    """
+    return self.paths.get(_overlayKey(name))
+
+  def isfile(self, *name):
+    return _overlayKey(name) in self.files
+
+  def isdir(self, *name):
+    return _overlayKey(name) in self.dirs
+
+  def exists(self, *name):
+    return _overlayKey(name) in self.paths
+
+  def listdir(self, *name):
+    """
+    List a directory merged over all the data roots.
+
+    @param name:    Path components relative to the data roots
+    @return:        Sorted list of entry names
+    """
+    try:
+      return sorted(self.dirs[_overlayKey(name)])
+    except KeyError:
+      raise FileNotFoundError("No such data directory: '%s'" % "/".join(name))
+
+  def stat(self, *name):
+    fileName = self.find(*name)
+    if fileName is None:
+      raise FileNotFoundError("No such data file: '%s'" % "/".join(name))
+    return os.stat(fileName)
+
+  def open(self, *name, mode = "rb"):
+    fileName = self.find(*name) if self.isfile(*name) else None
+    if fileName is None:
+      raise FileNotFoundError("No such data file: '%s'" % "/".join(name))
+    return open(fileName, mode)
+
+#
+# Packed data archive
+#
+ARCHIVE_FILE_NAME = "data.pak"
+ARCHIVE_MAGIC     = b"FOFPAK\x00\x01"
+ARCHIVE_HEADER    = struct.Struct("<8sQQ")
+ARCHIVE_ALIGNMENT = 16
+
+# Asset types packed by default. Configuration files and translations are
+# read before the resource loader exists, so they are left loose.
+ARCHIVE_PATTERNS  = ["*.svg", "*.png", "*.ogg", "*.ttf", "*.dae"]
+
+# Directories that hold user content and are never packed
+ARCHIVE_EXCLUDES  = ["songs", "mods"]
+
+class ArchiveException(Exception):
+  pass
+
+class ArchiveMember(io.RawIOBase):
+  """A read-only file object for a single file stored in a L{DataArchive}."""
+  def __init__(self, name, buffer, archiveFileName = None):
+    io.RawIOBase.__init__(self)
+    self.name     = name
+    self.buffer   = buffer
+    self.position = 0
+    self.archiveFileName = archiveFileName
+
+  def readable(self):
+    return True
+
+  def seekable(self):
+    return True
+
+  def readinto(self, b):
+    data = self.buffer[self.position:self.position + len(b)]
+    n = len(data)
+    b[:n] = data
+    self.position += n
+    return n
+
+  def seek(self, offset, whence = io.SEEK_SET):
+    if whence == io.SEEK_SET:
+      self.position = offset
+    elif whence == io.SEEK_CUR:
+      self.position += offset
+    elif whence == io.SEEK_END:
+      self.position = len(self.buffer) + offset
+    self.position = max(0, self.position)
+    return self.position
+
+  def tell(self):
+    return self.position
+
+  def getbuffer(self):
+    """@return: A zero-copy memoryview of the whole file"""
+    return self.buffer
+
+class DataArchive(object):
+  """
+  A packed, memory-mapped collection of data files.
+
+  The archive consists of a fixed header, the file contents aligned to
+  L{ARCHIVE_ALIGNMENT} bytes and a JSON index mapping relative paths to
+  (offset, length) pairs.
+  """
+  def __init__(self, fileName):
+    self.fileName = fileName
+    with open(fileName, "rb") as f:
+      self.map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    self.view = memoryview(self.map)
+
+    if len(self.map) < ARCHIVE_HEADER.size:
+      raise ArchiveException("Truncated data archive '%s'." % fileName)
+    magic, indexOffset, indexLength = ARCHIVE_HEADER.unpack_from(self.map, 0)
+    if magic != ARCHIVE_MAGIC:
+      raise ArchiveException("'%s' is not a data archive." % fileName)
+    self.index = json.loads(bytes(self.view[indexOffset:indexOffset + indexLength]).decode("utf-8"))
+    Log.debug("Data archive %s contains %d files." % (fileName, len(self.index)))
+
+  def __contains__(self, name):
+    return name in self.index
+
+  def names(self):
+    return list(self.index.keys())
+
+  def getBuffer(self, name):
+    """
+    @param name:  Relative path of the file
+    @return:      Zero-copy memoryview of the file contents
+    """
+    offset, length = self.index[name]
+    return self.view[offset:offset + length]
+
+  def open(self, name):
+    """
+    @param name:  Relative path of the file
+    @return:      L{ArchiveMember} file object
+    """
+    return ArchiveMember(name, self.getBuffer(name), self.fileName)
+
+def createDataArchive(root, archiveFileName, patterns = ARCHIVE_PATTERNS, excludes = ARCHIVE_EXCLUDES):
+  """
+  Pack the matching files under a data directory into an archive.
+
+  @param root:            Data directory
+  @param archiveFileName: Archive file to create
+  @param patterns:        File name patterns to include
+  @param excludes:        Top level directories to skip
+  @return:                Number of files packed
+  """
+  index = {}
+  with open(archiveFileName, "wb") as out:
+    out.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, 0, 0))
+    for dirPath, dirNames, fileNames in os.walk(root):
+      relDir = os.path.relpath(dirPath, root)
+      relDir = "" if relDir == "." else relDir.replace(os.sep, "/")
+      if not relDir:
+        dirNames[:] = [d for d in dirNames if d not in excludes]
+      dirNames.sort()
+      for fileName in sorted(fileNames):
+        if not any(fnmatch.fnmatch(fileName.lower(), p) for p in patterns):
+          continue
+        padding = -out.tell() % ARCHIVE_ALIGNMENT
+        out.write(b"\x00" * padding)
+        with open(os.path.join(dirPath, fileName), "rb") as f:
+          data = f.read()
+        index[(relDir + "/" if relDir else "") + fileName] = (out.tell(), len(data))
+        out.write(data)
+
+    indexData   = json.dumps(index).encode("utf-8")
+    indexOffset = out.tell()
+    out.write(indexData)
+    out.seek(0)
+    out.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, indexOffset, len(indexData)))
+  Log.notice("Packed %d files into '%s'." % (len(index), archiveFileName))
+  return len(index)
+
 class Resource(Task):
   def __init__(self, dataPath = os.path.join("..", "data")):
     self.resultQueue = Queue()
     self.dataPaths = [dataPath]
     self.loaderSemaphore = BoundedSemaphore(value = 1)
     self.loaders = []
+    self._overlay = None
+    self._archives = None
 
   def addDataPath(self, path):
     if not path in self.dataPaths:
       self.dataPaths = [path] + self.dataPaths
+      self._updateOverlay()
 
   def removeDataPath(self, path):
     if path in self.dataPaths:
       self.dataPaths.remove(path)
+      self._updateOverlay()
+
+  def _updateOverlay(self):
+    if self._overlay is not None:
+      self._overlay.setRoots(self.dataPaths)
+    self._archives = None
+
+  def getArchives(self):
+    """@return: List of L{DataArchive} instances found in the data paths, highest priority first"""
+    return [archive for dataPath, archive in self._getPathArchives() if archive]
+
+  archives = property(getArchives)
+
+  def _getPathArchives(self):
+    # List of (data path, archive or None) pairs in priority order
+    if self._archives is None:
+      self._archives = []
+      for dataPath in self.dataPaths:
+        archive = None
+        archiveFileName = os.path.join(dataPath, ARCHIVE_FILE_NAME)
+        if os.path.isfile(archiveFileName):
+          try:
+            archive = DataArchive(archiveFileName)
+          except Exception as e:
+            Log.warn("Unable to open data archive '%s': %s" % (archiveFileName, e))
+        self._archives.append((dataPath, archive))
+    return self._archives
+
+  def _findArchive(self, name):
+    """
+    Find the archive that provides a data file.
+
+    An archive provides the files it contains in place of the loose files
+    next to it, so packing a data directory doesn't require removing the
+    packed files. Loose files in data paths of higher priority, such as
+    mods, still override the archive.
+
+    @param name:    Path components of the file
+    @return:        (L{DataArchive} or None, archive key)
+    """
+    key   = _overlayKey(name)
+    loose = self._findLoose(*name) if self.overlay.isfile(*name) else None
+    if loose is not None:
+      loose = os.path.normpath(loose)
+    for dataPath, archive in self._getPathArchives():
+      if archive and key in archive:
+        return archive, key
+      # Stop at the data path providing the loose file
+      if loose is not None and os.path.normpath(os.path.join(os.path.abspath(dataPath), *name)) == loose:
+        break
+    return None, key
+
+  def dataSource(self, *name):
+    """
+    Locate a data file that may be stored loose or in a packed archive.
+
+    @param name:    Path components of the file
+    @return:        A file name for loose files or a L{ArchiveMember}
+                    file object for packed files. Both are accepted by
+                    pygame, PIL, ElementTree and L{SvgDrawing}.
+    """
+    archive, key = self._findArchive(name)
+    if archive:
+      return archive.open(key)
+    return self.fileName(*name)
+
+  def getData(self, *name):
+    """
+    Read the contents of a data file.
+
+    @param name:    Path components of the file
+    @return:        A zero-copy memoryview for packed files, bytes for loose files
+    """
+    archive, key = self._findArchive(name)
+    if archive:
+      return archive.getBuffer(key)
+    with open(self.fileName(*name), "rb") as f:
+      return f.read()
+
+  def getOverlay(self):
+    """
+    @return: L{DataOverlay} indexing the current data paths. The overlay is
+             built on first use.
+    """
+    if self._overlay is None:
+      manifest = os.path.join(getWritableResourcePath(), "overlay.json")
+      self._overlay = DataOverlay(self.dataPaths, manifest)
+    return self._overlay
+
+  overlay = property(getOverlay)
+
+  def _findLoose(self, *name):
+    """
+    Find a loose data file through the overlay index, rescanning the data
+    paths if the indexed file has been removed since.
+
+    @param name:    Path components of the file
+    @return:        Physical path or None if no data path has the file
+    """
+    candidate = self.overlay.find(*name)
+    if candidate is not None and not os.path.exists(candidate):
+      self.overlay.refresh()
+      candidate = self.overlay.find(*name)
+      if candidate is not None and not os.path.exists(candidate):
+        return None
+    return candidate
+
+  def listdir(self, *name):
+    """
+    List a data directory merged over all the data paths.
+
+    @param name:    Path components of the directory
+    @return:        List of entry names or an empty list if the directory is missing
+    """
+    try:
+      return self.overlay.listdir(*name)
+    except FileNotFoundError:
+      return []
 
   def fileName(self, *name, **args):
     if not args.get("writable", False):
+      # Files that existed when the data paths were indexed resolve instantly
+      candidate = self._findLoose(*name)
+      if candidate is not None:
+        return candidate
       readWritePath = os.path.join(getWritableResourcePath(), *name)
       for dataPath in self.dataPaths:
         candidate = os.path.join(dataPath, *name)
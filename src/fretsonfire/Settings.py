@@ -25,6 +25,7 @@ from . import Dialogs
 from . import Config
 from . import Mod
 from . import Audio
+from . import Calibration
 
 import pygame
 
@@ -85,6 +86,30 @@ class VolumeConfigChoice(ConfigChoice):
     sound.setVolume(self.value)
     sound.play()
 
+class DelayConfigChoice(ConfigChoice):
+  """
+  A/V delay choice showing the delay in effect for the current audio
+  device. Choosing a delay by hand replaces the calibrated one.
+  """
+  def __init__(self, engine, config, section, option, autoApply = False):
+    ConfigChoice.__init__(self, config, section, option, autoApply)
+    self.engine = engine
+    self.setDelay(Calibration.getDelay(engine))
+
+  def setDelay(self, delay):
+    self.valueIndex = self.values.index(Calibration.clampDelay(self.config, delay))
+    self.changed    = False
+
+  def calibrate(self):
+    latency = Dialogs.calibrateLatency(self.engine)
+    if latency is not None:
+      self.setDelay(latency)
+
+  def apply(self):
+    if self.changed:
+      ConfigChoice.apply(self)
+      Calibration.clearLatency(self.engine.audio.getDeviceKey())
+
 class KeyConfigChoice(Menu.Choice):
   def __init__(self, engine, config, section, option):
     self.engine  = engine
@@ -184,9 +209,11 @@ class SettingsMenu(Menu.Menu):
     ]
     volumeSettingsMenu = Menu.Menu(engine, volumeSettings + applyItem)
 
+    delayChoice = DelayConfigChoice(engine, engine.config, "audio",  "delay")
     audioSettings = [
       (_("Volume Settings"), volumeSettingsMenu),
-      ConfigChoice(engine.config, "audio",  "delay"),
+      delayChoice,
+      (_("Calibrate A/V Delay"), delayChoice.calibrate),
       ConfigChoice(engine.config, "audio",  "frequency"),
       ConfigChoice(engine.config, "audio",  "bits"),
       ConfigChoice(engine.config, "audio",  "buffersize"),
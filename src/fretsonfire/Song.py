@@ -22,6 +22,7 @@
 from . import midi
 from . import Log
 from . import Audio
+from . import Mixdown
 from configparser import ConfigParser
 import os
 import re
@@ -29,11 +30,13 @@ import shutil
 from . import Config
 import hashlib
 import binascii
+import json
 from . import Cerealizer
 from urllib.parse import urlencode
 from urllib.request import urlopen
 from . import Version
 from . import Theme
+from .Resource import getWritableResourcePath
 from .Language import _
 
 DEFAULT_LIBRARY         = "songs"
@@ -43,6 +46,15 @@ MEDIUM_DIFFICULTY       = 1
 EASY_DIFFICULTY         = 2
 SUPAEASY_DIFFICULTY     = 3
 
+SORT_BY_NAME            = 0
+SORT_BY_ARTIST          = 1
+SORT_BY_DIFFICULTIES    = 2
+SORT_BY_RECENT          = 3
+SORT_ORDERS             = [SORT_BY_NAME, SORT_BY_ARTIST, SORT_BY_DIFFICULTIES, SORT_BY_RECENT]
+
+# Increment this when the song order file format changes
+SONG_ORDER_VERSION      = 1
+
 class Difficulty:
   def __init__(self, id, text):
     self.id   = id
@@ -67,6 +79,8 @@ class SongInfo(object):
     self.fileName      = infoFileName
     self.info          = ConfigParser()
     self._difficulties = None
+    self._values       = {}
+    self.record        = None
 
     try:
       self.info.read(infoFileName, encoding=Config.encoding)
@@ -96,6 +110,7 @@ class SongInfo(object):
       self.info.add_section("song")
     value = str(value)
     self.info.set("song", attr, value)
+    self._values[attr] = value
     
   def getObfuscatedScores(self):
     s = {}
@@ -111,9 +126,17 @@ class SongInfo(object):
     f.close()
     
   def _get(self, attr, type = None, default = ""):
+    # Values are looked up from the parser only once, since the sort keys
+    # of the song list are read many times
     try:
-      v = self.info.get("song", attr)
-    except:
+      v = self._values[attr]
+    except KeyError:
+      try:
+        v = self.info.get("song", attr)
+      except:
+        v = None
+      self._values[attr] = v
+    if v is None:
       v = default
     if v is not None and type:
       v = type(v)
@@ -211,6 +234,22 @@ class SongInfo(object):
 
   def isTutorial(self):
     return self._get("tutorial", int, 0) == 1
+
+  def getLastPlayed(self):
+    return self._get("lastplayed", int, 0)
+
+  def setLastPlayed(self, value):
+    self._set("lastplayed", int(value))
+
+  def getPreviewStart(self):
+    return self._get("preview_start", int, None)
+
+  def setPreviewStart(self, value):
+    self._set("preview_start", int(value))
+
+  def getRecord(self):
+    """@return: L{SongRecord} with the sort keys of this song"""
+    return SongRecord(self.name, self.artist, [d.id for d in self.difficulties], self.lastPlayed)
     
   name          = property(getName, setName)
   artist        = property(getArtist, setArtist)
@@ -218,6 +257,118 @@ class SongInfo(object):
   tutorial      = property(isTutorial)
   difficulties  = property(getDifficulties)
   cassetteColor = property(getCassetteColor, setCassetteColor)
+  lastPlayed    = property(getLastPlayed, setLastPlayed)
+  previewStart  = property(getPreviewStart, setPreviewStart)
+
+class SongRecord(object):
+  """Sort keys of a song, read from its info and note files."""
+  __slots__ = ["name", "artist", "difficulties", "lastPlayed"]
+
+  def __init__(self, name, artist, difficulties, lastPlayed):
+    """
+    @param name:          Song name
+    @param artist:        Artist name
+    @param difficulties:  List of available difficulty ids
+    @param lastPlayed:    Time the song was last played in seconds since the epoch, or 0
+    """
+    self.name         = name
+    self.artist       = artist
+    self.difficulties = difficulties
+    self.lastPlayed   = lastPlayed
+
+  def getSortKey(self, order):
+    """@return: Key ordering songs by one of the SORT_BY_* orders"""
+    name = self.name.lower()
+    if order == SORT_BY_ARTIST:
+      return (self.artist.lower(), name)
+    elif order == SORT_BY_DIFFICULTIES:
+      return (-len(self.difficulties), name)
+    elif order == SORT_BY_RECENT:
+      return (-self.lastPlayed, name)
+    return (name, )
+
+  def toList(self):
+    return [self.name, self.artist, self.difficulties, self.lastPlayed]
+
+class SongOrders(object):
+  """
+  Orderings of a list of songs by each of the SORT_BY_* keys.
+
+  The sort keys and the orderings are stored in a file keyed by the
+  modification times of the song files, so that the note files don't need
+  to be scanned for difficulties and switching the order needs no sorting.
+  """
+  def __init__(self, songs, cacheFileName = None):
+    """
+    @param songs:          List of L{SongInfo} instances
+    @param cacheFileName:  Song order file name or None to not store the orders
+    """
+    self.songs  = songs
+    self.orders = {}
+
+    stamps  = [self._getStamp(song) for song in songs]
+    key     = hashlib.sha1(json.dumps(stamps).encode("utf-8")).hexdigest()
+    cache   = self._load(cacheFileName) if cacheFileName else None
+    records = cache["songs"] if cache else {}
+
+    for song, stamp in zip(songs, stamps):
+      entry = records.get(song.songName)
+      if entry and entry[0] == stamp[1:]:
+        song.record = SongRecord(*entry[1])
+      else:
+        song.record = song.getRecord()
+      if not song.tutorial:
+        song._difficulties = [difficulties[d] for d in song.record.difficulties]
+
+    if cache and cache["key"] == key:
+      self.orders = dict((int(order), indices) for order, indices in cache["orders"].items())
+    else:
+      for order in SORT_ORDERS:
+        self.orders[order] = sorted(range(len(songs)), key = lambda i: songs[i].record.getSortKey(order))
+      if cacheFileName:
+        self._save(cacheFileName, key, stamps)
+
+  def _getStamp(self, song):
+    stamp = [song.songName]
+    for fileName in [song.fileName, os.path.join(os.path.dirname(song.fileName), "notes.mid")]:
+      try:
+        stamp.append(os.stat(fileName).st_mtime_ns)
+      except OSError:
+        stamp.append(0)
+    return stamp
+
+  def _load(self, cacheFileName):
+    if not os.path.isfile(cacheFileName):
+      return None
+    try:
+      with open(cacheFileName, encoding = "utf-8") as f:
+        cache = json.load(f)
+      if cache.get("version") == SONG_ORDER_VERSION:
+        return cache
+    except Exception as e:
+      Log.warn("Unable to read song order file %s: %s" % (cacheFileName, e))
+    return None
+
+  def _save(self, cacheFileName, key, stamps):
+    cache = {
+      "version": SONG_ORDER_VERSION,
+      "key":     key,
+      "songs":   dict((song.songName, [stamp[1:], song.record.toList()]) for song, stamp in zip(self.songs, stamps)),
+      "orders":  self.orders,
+    }
+    try:
+      if not os.path.isdir(os.path.dirname(cacheFileName)):
+        os.makedirs(os.path.dirname(cacheFileName))
+      tmpFileName = cacheFileName + ".tmp"
+      with open(tmpFileName, "w", encoding = "utf-8") as f:
+        json.dump(cache, f)
+      os.replace(tmpFileName, cacheFileName)
+    except Exception as e:
+      Log.warn("Unable to write song order file %s: %s" % (cacheFileName, e))
+
+  def getSongs(self, order = SORT_BY_NAME):
+    """@return: List of the songs sorted by one of the SORT_BY_* orders"""
+    return [self.songs[i] for i in self.orders[order]]
 
 class LibraryInfo(object):
   def __init__(self, libraryName, infoFileName):
@@ -503,12 +654,16 @@ class Song(object):
 
   def play(self, start = 0.0):
     self.start = start
+    # Decode the first chunk of each stem before the backing track starts
+    # so that they all start together
+    for track in [self.guitarTrack, self.rhythmTrack]:
+      if track:
+        assert start == 0.0
+        track.prepare()
     self.music.play(0, start / 1000.0)
     if self.guitarTrack:
-      assert start == 0.0
       self.guitarTrack.play()
     if self.rhythmTrack:
-      assert start == 0.0
       self.rhythmTrack.play()
     self._playing = True
 
@@ -782,22 +937,26 @@ def loadSong(engine, name, library = DEFAULT_LIBRARY, seekable = False, playback
   infoFile   = engine.resource.fileName(library, name, "song.ini", writable = True)
   scriptFile = engine.resource.fileName(library, name, "script.txt")
   
+  if not os.path.isfile(rhythmFile):
+    rhythmFile = None
+
   if seekable:
-    if os.path.isfile(guitarFile) and os.path.isfile(songFile):
-      # TODO: perform mixing here
-      songFile   = guitarFile
-      guitarFile = None
-    else:
-      songFile   = guitarFile
-      guitarFile = None
-      
+    # Only the music track can be started from any position, so the
+    # separate tracks are mixed into it
+    songFile   = guitarFile
+    guitarFile = None
+    tracks     = Mixdown.getSongTracks(engine, library, name)
+    if len(tracks) > 1:
+      try:
+        songFile   = Mixdown.getMixdown(tracks)
+        rhythmFile = None
+      except Exception as e:
+        Log.warn("Unable to mix song tracks: %s" % e)
+
   if not os.path.isfile(songFile):
     songFile   = guitarFile
     guitarFile = None
   
-  if not os.path.isfile(rhythmFile):
-    rhythmFile = None
-  
   if playbackOnly:
     noteFile = None
   
@@ -852,11 +1011,33 @@ def getDefaultLibrary(engine):
 
 def getAvailableLibraries(engine, library = DEFAULT_LIBRARY):
   # Search for libraries in both the read-write and read-only directories
-  songRoots    = [engine.resource.fileName(library),
-                  engine.resource.fileName(library, writable = True)]
+  songRoots    = [engine.resource.fileName(library, writable = True)]
   libraries    = []
   libraryRoots = []
-  
+
+  # The read-only directories are looked up through the data overlay index
+  overlay = engine.resource.overlay
+  if overlay.isdir(library):
+    for entry in overlay.listdir(library):
+      if not overlay.isdir(library, entry):
+        continue
+      for name in overlay.listdir(library, entry):
+        if overlay.isfile(library, entry, name, "song.ini") or name == "library.ini":
+          # A mod may add songs to a library whose library.ini is in another root
+          infoFile = overlay.find(library, entry, "library.ini")
+          if infoFile:
+            libraryRoot = os.path.dirname(infoFile)
+          else:
+            libraryRoot = overlay.find(library, entry)
+            infoFile    = os.path.join(libraryRoot, "library.ini")
+          if not libraryRoot in libraryRoots:
+            libName = library + os.sep + entry
+            libraries.append(LibraryInfo(libName, infoFile))
+            libraryRoots.append(libraryRoot)
+          break
+  else:
+    songRoots.insert(0, engine.resource.fileName(library))
+
   for songRoot in songRoots:
     if not os.path.isdir(songRoot):
       continue
@@ -884,10 +1065,35 @@ def getAvailableLibraries(engine, library = DEFAULT_LIBRARY):
   libraries.sort(key=lambda library: library.name)
   return libraries
 
+def getSongOrderFile(library = DEFAULT_LIBRARY, includeTutorials = False):
+  """@return: Name of the file storing the song orders of a library"""
+  name = re.sub(r"[^\w.-]", "_", library)
+  if includeTutorials:
+    name += "-tutorials"
+  return os.path.join(getWritableResourcePath(), "songcache", name + ".json")
+
 def getAvailableSongs(engine, library = DEFAULT_LIBRARY, includeTutorials = False):
+  return getSongOrders(engine, library, includeTutorials).getSongs(SORT_BY_NAME)
+
+def getSongOrders(engine, library = DEFAULT_LIBRARY, includeTutorials = False):
+  """
+  Find the songs of a library.
+
+  @return:  L{SongOrders} instance
+  """
   # Search for songs in both the read-write and read-only directories
-  songRoots = [engine.resource.fileName(library), engine.resource.fileName(library, writable = True)]
+  songRoots = [engine.resource.fileName(library, writable = True)]
   names = []
+
+  # The read-only directories are looked up through the data overlay index
+  overlay = engine.resource.overlay
+  if overlay.isdir(library):
+    for name in overlay.listdir(library):
+      if overlay.isfile(library, name, "song.ini") and not name.startswith("."):
+        names.append(name)
+  else:
+    songRoots.insert(0, engine.resource.fileName(library))
+
   for songRoot in songRoots:
     if not os.path.isdir(songRoot):
       continue
@@ -901,8 +1107,7 @@ def getAvailableSongs(engine, library = DEFAULT_LIBRARY, includeTutorials = Fals
       if not name in names:
         names.append(name)
 
-  songs = [SongInfo(engine.resource.fileName(library, name, "song.ini", writable = True)) for name in names]
+  songs = [SongInfo(engine.resource.fileName(library, name, "song.ini", writable = True)) for name in sorted(names)]
   if not includeTutorials:
     songs = [song for song in songs if not song.tutorial]
-  songs.sort(key=lambda song: song.name)
-  return songs
+  return SongOrders(songs, getSongOrderFile(library, includeTutorials))
@@ -19,8 +19,10 @@
 # MA  02110-1301, USA.                                              #
 #####################################################################
 
+import time
+
 from .Scene import SceneServer, SceneClient
-from . import Player, Dialogs, Song, Config
+from . import Player, Dialogs, Song, Config, Log
 from .Language import _
 
 # save chosen song into config file
@@ -71,6 +73,13 @@ class SongChoosingSceneClient(SongChoosingScene, SceneClient):
       # Make sure the difficulty we chose is available
       if not self.player.difficulty in info.difficulties:
         self.player.difficulty = info.difficulties[0]
+
+      # Remember when the song was played for sorting the song list
+      info.lastPlayed = time.time()
+      try:
+        info.save()
+      except Exception as e:
+        Log.warn("Unable to save song info: %s" % e)
         
       self.session.world.deleteScene(self)
       self.session.world.createScene("GuitarScene", libraryName = self.libraryName, songName = self.songName)
@@ -0,0 +1,221 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+import math
+import unicodedata
+import numpy
+
+class SongList(object):
+  """
+  Layout of the song chooser item list.
+
+  Items are stacked vertically and the selected one unfolds from its
+  collapsed height to its expanded height by turning 90 degrees. Only the
+  items whose angle is changing are animated, and the offsets of the other
+  items come from a prefix sum of the collapsed heights, so finding the
+  items in view doesn't depend on the length of the list.
+  """
+  def __init__(self, collapsed = (), expanded = ()):
+    """
+    @param collapsed:   Height of each item when not selected
+    @param expanded:    Height of each item when turned fully open
+    """
+    self.setItems(collapsed, expanded)
+
+  def setItems(self, collapsed, expanded):
+    """Replace the items, forgetting the filter and all animation."""
+    self.collapsed = numpy.asarray(collapsed, numpy.float64)
+    self.expanded  = numpy.asarray(expanded, numpy.float64)
+    self.angles    = {}
+    self.selected  = None
+    self.setFilter(None)
+
+  def setFilter(self, indices):
+    """
+    Choose the items shown in the list.
+
+    @param indices:   Item indices in display order, or None to show all items
+    """
+    if indices is None:
+      indices = numpy.arange(len(self.collapsed))
+    self.indices = numpy.asarray(indices, numpy.int64)
+    self.rows    = numpy.full(len(self.collapsed), -1, numpy.int64)
+    self.rows[self.indices] = numpy.arange(len(self.indices))
+    self.offsets = numpy.concatenate(([0.0], numpy.cumsum(self.collapsed[self.indices])))
+
+  def __len__(self):
+    return len(self.indices)
+
+  def getRow(self, index):
+    """@return: Position of an item in the shown list, or -1 if it is filtered out"""
+    return int(self.rows[index])
+
+  def getAngle(self, index):
+    """@return: Current angle of an item in degrees"""
+    return self.angles.get(index, 0.0)
+
+  def getHeight(self, index):
+    """@return: Current height of an item"""
+    angle = self.angles.get(index)
+    if not angle:
+      return self.collapsed[index]
+    c = math.sin(angle * math.pi / 180)
+    return c * self.expanded[index] + (1 - c) * self.collapsed[index]
+
+  def getOffset(self, row):
+    """@return: Distance from the top of the list to the top of a row"""
+    offset = self.offsets[row]
+    for index in self.angles:
+      if 0 <= self.rows[index] < row:
+        offset += self.getHeight(index) - self.collapsed[index]
+    return offset
+
+  def getCenter(self, index):
+    """@return: Distance from the top of the list to the middle of a shown item"""
+    return self.getOffset(self.rows[index]) + self.getHeight(index) / 2
+
+  def getVisibleRows(self, top, bottom):
+    """
+    Find the rows that may overlap a part of the list.
+
+    @param top:       Distance from the top of the list to the top of the area
+    @param bottom:    Distance from the top of the list to the bottom of the area
+    @return:          range of rows
+    """
+    # Unfolding items push the rows below them down by at most this much
+    extra = sum(self.getHeight(index) - self.collapsed[index] for index in self.angles if self.rows[index] >= 0)
+    first = numpy.searchsorted(self.offsets[1:], top - extra, side = "right")
+    last  = numpy.searchsorted(self.offsets[:-1], bottom, side = "left")
+    return range(int(first), int(max(first, last)))
+
+  def select(self, index):
+    """Start unfolding an item and folding the previously selected one."""
+    self.selected = index
+    self.angles.setdefault(index, 0.0)
+
+  def run(self, ticks):
+    """Advance the folding animation."""
+    step = ticks / 2.0
+    for index, angle in list(self.angles.items()):
+      if index == self.selected:
+        self.angles[index] = min(90, angle + step)
+      elif angle - step > 0:
+        self.angles[index] = angle - step
+      else:
+        del self.angles[index]
+
+def normalizeText(text):
+  """
+  Fold a string for searching: accents are removed and letter case is
+  ignored, so that "Beyoncé" and "beyonce" compare equal.
+  """
+  text = str(text)
+  if text.isascii():
+    return text.lower()
+  text = unicodedata.normalize("NFKD", text)
+  return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+def _trigramCodes(text):
+  """
+  Number each group of three consecutive characters of a string.
+
+  @return:  (codes, character codes) integer arrays
+  """
+  chars = numpy.frombuffer(text.encode("utf-32-le"), numpy.uint32).astype(numpy.int64)
+  return (chars[:-2] << 42) | (chars[1:-1] << 21) | chars[2:], chars
+
+class SearchIndex(object):
+  """
+  Substring search over the text fields of a list of items.
+
+  Candidates for queries of three or more characters come from a trigram
+  index. The results of the previous queries are remembered, so a query
+  that extends the previous one, such as one more typed character, only
+  has to check the items that matched before.
+  """
+  def __init__(self, texts):
+    """
+    @param texts:   List of the searchable strings of each item
+    """
+    # Queries never contain line feeds, so they can't match across fields
+    self.texts   = ["\n".join(normalizeText(text) for text in fields) for fields in texts]
+    self.history = []
+
+    # Sorted (trigram, item) pairs; the items containing a trigram are a
+    # contiguous, ascending run of the pairs
+    codes, chars = _trigramCodes("\0".join(self.texts) + "\0\0")
+    lengths = numpy.array([len(text) + 1 for text in self.texts], numpy.int64)
+    owners  = numpy.repeat(numpy.arange(len(self.texts)), lengths)
+    valid   = (chars[:-2] != 0) & (chars[1:-1] != 0) & (chars[2:] != 0)
+    codes, owners = codes[valid], owners[:len(valid)][valid]
+    order   = numpy.lexsort((owners, codes))
+    codes, owners = codes[order], owners[order]
+    unique  = numpy.ones(len(codes), bool)
+    unique[1:] = (codes[1:] != codes[:-1]) | (owners[1:] != owners[:-1])
+    self.codes  = codes[unique]
+    self.owners = owners[unique]
+
+  def __len__(self):
+    return len(self.texts)
+
+  def matches(self, index, query):
+    """@return: True if an item contains a normalized query string"""
+    return query in self.texts[index]
+
+  def _candidates(self, query):
+    if len(query) < 3:
+      return range(len(self.texts))
+    postings = []
+    for code in numpy.unique(_trigramCodes(query)[0]):
+      first, last = numpy.searchsorted(self.codes, [code, code + 1])
+      if first == last:
+        return []
+      postings.append(self.owners[first:last])
+    postings.sort(key = len)
+    candidates = postings[0]
+    for posting in postings[1:]:
+      candidates = numpy.intersect1d(candidates, posting, assume_unique = True)
+    return candidates.tolist()
+
+  def search(self, query):
+    """
+    Find the items containing a string.
+
+    @param query:   Search string
+    @return:        Array of matching item indices in ascending order, or
+                    None if the query is empty
+    """
+    query = normalizeText(query)
+    if not query:
+      self.history = []
+      return None
+
+    # Forget the queries that this one doesn't extend
+    while self.history and not query.startswith(self.history[-1][0]):
+      self.history.pop()
+    if self.history and self.history[-1][0] == query:
+      return self.history[-1][1]
+
+    candidates = self.history[-1][1].tolist() if self.history else self._candidates(query)
+    texts = self.texts
+    results = numpy.array([index for index in candidates if query in texts[index]], numpy.int64)
+    self.history.append((query, results))
+    return results
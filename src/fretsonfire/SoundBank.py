@@ -0,0 +1,157 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pygame
+
+from . import Log
+from . import Config
+from .Audio import Sound
+
+Config.define("audio", "soundbudget", int, 16)
+
+# Increment this when the sound bank file format changes
+SOUND_BANK_VERSION = 1
+
+def _decodeSound(source):
+  return pygame.sndarray.array(pygame.mixer.Sound(source))
+
+def _getSourceKey(source):
+  # Packed files are identified by their contents, loose files by their time stamp
+  if hasattr(source, "getbuffer"):
+    return (source.name, hashlib.sha1(source.getbuffer()).hexdigest())
+  info = os.stat(source)
+  return (source, info.st_mtime_ns, info.st_size)
+
+class SoundBank(object):
+  """
+  A set of short sound effects decoded into a single sample buffer.
+
+  The buffer is stored on disk and memory mapped on later runs. Mixer
+  sounds are made from it on demand and the least recently used ones are
+  dropped when their total size exceeds the budget.
+  """
+  def __init__(self, sources, cacheFileName = None, budget = None, workers = 4):
+    """
+    @param sources:        List of (name, file name or file object) pairs
+    @param cacheFileName:  Cache file name without a suffix, or None to always decode
+    @param budget:         Maximum size of the mixer sounds in bytes, or None for no limit
+    @param workers:        Number of decoding threads
+    """
+    self.format  = pygame.mixer.get_init()
+    self.budget  = budget
+    self.sounds  = OrderedDict()
+    self.size    = 0
+
+    key = hashlib.sha1(repr([SOUND_BANK_VERSION, self.format] +
+                            [(name, _getSourceKey(source)) for name, source in sources]).encode("utf-8")).hexdigest()
+    bank = self._load(cacheFileName, key) if cacheFileName else None
+    if bank is None:
+      bank = self._decode(sources, workers)
+      if cacheFileName:
+        self._save(cacheFileName, key, *bank)
+    self.samples, self.entries = bank
+    Log.debug("Sound bank has %d sounds in %.1f MB." % (len(self.entries), self.samples.nbytes / 1048576.0))
+
+  def _decode(self, sources, workers):
+    channels = self.format[2]
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+      decoded = list(executor.map(_decodeSound, [source for name, source in sources]))
+    decoded = [samples.reshape(-1, channels) for samples in decoded]
+    entries = OrderedDict()
+    offset  = 0
+    for (name, source), samples in zip(sources, decoded):
+      entries[name] = (offset, len(samples))
+      offset += len(samples)
+    dtype   = decoded[0].dtype if decoded else numpy.int16
+    samples = numpy.concatenate(decoded) if decoded else numpy.zeros((0, channels), dtype)
+    return samples, entries
+
+  def _load(self, cacheFileName, key):
+    try:
+      if not os.path.isfile(cacheFileName + ".json"):
+        return None
+      with open(cacheFileName + ".json", encoding = "utf-8") as f:
+        info = json.load(f)
+      if info["key"] != key:
+        return None
+      samples = numpy.load(cacheFileName + ".npy", mmap_mode = "r")
+      return samples, OrderedDict((name, tuple(entry)) for name, entry in info["entries"])
+    except Exception as e:
+      Log.warn("Unable to read sound bank %s: %s" % (cacheFileName, e))
+      return None
+
+  def _save(self, cacheFileName, key, samples, entries):
+    info = {"key": key, "entries": list(entries.items())}
+    try:
+      if not os.path.isdir(os.path.dirname(cacheFileName)):
+        os.makedirs(os.path.dirname(cacheFileName))
+      # The description is written last so that it only exists for complete files
+      for suffix, write in ((".npy",  lambda f: numpy.save(f, samples)),
+                            (".json", lambda f: f.write(json.dumps(info).encode("utf-8")))):
+        with open(cacheFileName + suffix + ".tmp", "wb") as f:
+          write(f)
+        os.replace(cacheFileName + suffix + ".tmp", cacheFileName + suffix)
+    except (IOError, OSError) as e:
+      Log.warn("Unable to write sound bank %s: %s" % (cacheFileName, e))
+
+  def __contains__(self, name):
+    return name in self.entries
+
+  def __len__(self):
+    return len(self.entries)
+
+  def getSamples(self, name):
+    """@return: Array of the samples of a sound, sharing memory with the bank"""
+    offset, length = self.entries[name]
+    return self.samples[offset:offset + length]
+
+  def get(self, name):
+    """
+    @param name:  Sound name
+    @return:      L{Audio.Sound} instance
+    """
+    sound = self.sounds.get(name)
+    if sound is not None:
+      self.sounds.move_to_end(name)
+      return sound
+    samples = self.getSamples(name)
+    sound   = Sound(buffer = memoryview(numpy.ascontiguousarray(samples)).cast("B"))
+    self.sounds[name] = sound
+    self.size += samples.nbytes
+    self._evict()
+    return sound
+
+  def _evict(self):
+    # Always keep the most recently used sound
+    while self.budget is not None and self.size > self.budget and len(self.sounds) > 1:
+      name, sound = self.sounds.popitem(last = False)
+      self.size -= self.getSamples(name).nbytes
+
+  def getMemoryUsage(self):
+    """@return: Size of the sample buffer and the mixer sounds made from it in bytes"""
+    return self.samples.nbytes + self.size
@@ -21,12 +21,15 @@
 
 from __future__ import annotations
 
-from io import BytesIO
+import hashlib
+import mmap
+import os
+import struct
 from math import cos, sin
 from typing import Optional, Tuple
 
+import numpy
 from OpenGL.GL import *
-from PIL import Image
 
 from . import Config, Log
 from .Texture import Texture
@@ -45,6 +48,14 @@ _RENDER_SCALE = {
 }
 
 Config.define("opengl", "svgquality", int, NORMAL_QUALITY)
+Config.define("opengl", "svgcache",   bool, True)
+
+# Raster cache file layout: magic, width, height, mipmap level count
+_CACHE_MAGIC = b"FSVC"
+_CACHE_HEADER = struct.Struct("<4sIII")
+
+# Increment this when the cache file format or the rasterized pixels change
+SVG_CACHE_VERSION = 2
 
 
 def _matrix_multiply(a: list[list[float]], b: list[list[float]]) -> list[list[float]]:
@@ -104,11 +115,141 @@ class SvgTransform:
     glMultMatrixf(gl_mult)
 
 
+class SvgCache:
+  """
+  A disk cache of rasterized SVG drawings.
+
+  Entries are keyed by the SVG content hash, the target size and the
+  rendering scale, and hold raw RGBA pixels in texture upload order so that
+  they can be uploaded straight from a memory-mapped buffer. File names also
+  carry a hash of the source file name, so that the entries of earlier
+  versions of a drawing can be removed when it changes.
+  """
+  def __init__(self, path: str, mipmaps: bool = False):
+    """
+    @param path:     Directory holding the cache files
+    @param mipmaps:  Store a precomputed mipmap chain with each entry
+    """
+    self.path = path
+    self.mipmaps = mipmaps
+    self.hits = 0
+    self.misses = 0
+    try:
+      os.makedirs(path, exist_ok=True)
+      # Forget entries written by other versions of the cache
+      suffix = "-v%d.rgba" % SVG_CACHE_VERSION
+      for name in os.listdir(path):
+        if name.endswith(".rgba") and not name.endswith(suffix):
+          os.unlink(os.path.join(path, name))
+    except OSError as e:
+      Log.warn("Unable to create SVG cache directory %s: %s" % (path, e))
+
+  def _getPrefix(self, source: Optional[str]) -> str:
+    if source is None:
+      return "inline"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+
+  def _fileName(self, digest: str, width: int, height: int, scale: float, source: Optional[str] = None) -> str:
+    return os.path.join(self.path, "%s-%s-%dx%d-%g-v%d.rgba" %
+                        (self._getPrefix(source), digest, width, height, scale, SVG_CACHE_VERSION))
+
+  def _removeStaleEntries(self, digest: str, source: Optional[str]) -> None:
+    # Forget the rasters of earlier versions of the same drawing
+    if source is None:
+      return
+    prefix = self._getPrefix(source) + "-"
+    for name in os.listdir(self.path):
+      if name.startswith(prefix) and name.endswith(".rgba") and not name.startswith(prefix + digest + "-"):
+        os.unlink(os.path.join(self.path, name))
+
+  def load(self, digest: str, width: int, height: int, scale: float, source: Optional[str] = None):
+    """
+    Look up a cached raster.
+
+    @param digest:  SVG content hash
+    @param width:   Requested width or 0 for the intrinsic size
+    @param height:  Requested height or 0 for the intrinsic size
+    @param scale:   Rendering scale
+    @param source:  Name of the SVG file or None for inline drawings
+    @return:        ((width, height), [level buffers]) or None on a miss
+    """
+    fileName = self._fileName(digest, width, height, scale, source)
+    try:
+      with open(fileName, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+      self.misses += 1
+      return None
+
+    try:
+      magic, w, h, levelCount = _CACHE_HEADER.unpack_from(data, 0)
+      if magic != _CACHE_MAGIC:
+        raise ValueError("bad magic")
+      levels = []
+      offset = _CACHE_HEADER.size
+      lw, lh = w, h
+      for level in range(levelCount):
+        length = lw * lh * 4
+        if offset + length > len(data):
+          raise ValueError("truncated entry")
+        levels.append(numpy.frombuffer(data, numpy.uint8, length, offset))
+        offset += length
+        lw, lh = max(1, lw // 2), max(1, lh // 2)
+    except (ValueError, struct.error) as e:
+      Log.warn("Discarding broken SVG cache entry %s: %s" % (fileName, e))
+      self.misses += 1
+      return None
+    self.hits += 1
+    return ((w, h), levels)
+
+  def store(self, digest: str, width: int, height: int, scale: float, size: Tuple[int, int], pixels,
+            source: Optional[str] = None) -> None:
+    """
+    Store a raster in the cache.
+
+    @param digest:  SVG content hash
+    @param width:   Requested width or 0 for the intrinsic size
+    @param height:  Requested height or 0 for the intrinsic size
+    @param scale:   Rendering scale
+    @param size:    Actual (width, height) of the raster
+    @param pixels:  RGBA pixels in texture upload order
+    @param source:  Name of the SVG file or None for inline drawings
+    """
+    w, h = size
+    levels = [numpy.frombuffer(pixels, numpy.uint8).reshape(h, w, 4)]
+    if self.mipmaps:
+      while w > 1 or h > 1:
+        levels.append(_downsample(levels[-1]))
+        h, w = levels[-1].shape[:2]
+
+    fileName = self._fileName(digest, width, height, scale, source)
+    tmpFileName = "%s.%d.tmp" % (fileName, os.getpid())
+    try:
+      self._removeStaleEntries(digest, source)
+      with open(tmpFileName, "wb") as f:
+        f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, size[0], size[1], len(levels)))
+        for level in levels:
+          f.write(level.tobytes())
+      os.replace(tmpFileName, fileName)
+    except OSError as e:
+      Log.warn("Unable to write SVG cache entry %s: %s" % (fileName, e))
+
+
+def _downsample(pixels):
+  """Halve an (h, w, 4) RGBA array with a 2x2 box filter."""
+  h, w = pixels.shape[:2]
+  h2, w2 = max(1, h // 2), max(1, w // 2)
+  p = pixels[:h2 * (h // h2), :w2 * (w // w2)].astype(numpy.uint16)
+  p = p.reshape(h2, h // h2, w2, w // w2, 4).mean(axis=(1, 3))
+  return (p + 0.5).astype(numpy.uint8)
+
+
 class SvgContext:
   def __init__(self, geometry: Tuple[int, int, int, int]):
     self.geometry = geometry
     self.transform = SvgTransform()
     self._render_quality = NORMAL_QUALITY
+    self.cache: Optional[SvgCache] = None
     self.setGeometry(geometry)
     self.setProjection(geometry)
     try:
@@ -143,6 +284,9 @@ class SvgContext:
       return
     self._render_quality = quality
 
+  def setCache(self, cache: Optional[SvgCache]) -> None:
+    self.cache = cache
+
   def getRenderingQuality(self) -> int:
     return self._render_quality
 
@@ -164,33 +308,61 @@ class SvgDrawing:
     self._dom: Optional["skia.SVGDOM"] = None
     self._intrinsic_size: Optional[Tuple[int, int]] = None
     self._source_path: Optional[str] = None
+    self._svg_bytes = None
+    self._digest: Optional[str] = None
+    self._failed = False
 
-    svg_bytes: Optional[bytes] = None
+    svg_bytes = None
     if hasattr(svg_data, "read"):
-      svg_bytes = svg_data.read()
+      name = getattr(svg_data, "name", None)
+      if isinstance(name, str) and not name.lower().endswith(".svg"):
+        # A bitmap stored in a data archive
+        self._source_path = name
+        self.texture = Texture(owner = "Svg")
+        self.texture.loadFile(svg_data)
+      else:
+        if isinstance(name, str):
+          self._source_path = name
+        if hasattr(svg_data, "getbuffer"):
+          view = svg_data.getbuffer()
+          if view.readonly:
+            # An archive member; the view keeps the archive mapped
+            svg_bytes = view
+          else:
+            # A BytesIO may change after loading, so keep a copy
+            svg_bytes = bytes(view)
+            view.release()
+        else:
+          svg_bytes = svg_data.read()
     elif isinstance(svg_data, str):
       self._source_path = svg_data
       lower = svg_data.lower()
       if lower.endswith(".png"):
-        self.texture = Texture(svg_data)
+        self.texture = Texture(svg_data, owner = "Svg")
       elif lower.endswith(".svg"):
         with open(svg_data, "rb") as handle:
           svg_bytes = handle.read()
       else:
         # Assume this is a bitmap resource that Texture can handle directly.
-        self.texture = Texture(svg_data)
+        self.texture = Texture(svg_data, owner = "Svg")
     else:
       raise RuntimeError("Unsupported SVG input type: %r" % (type(svg_data),))
 
     if svg_bytes is not None:
-      self._load_dom(svg_bytes)
+      self._svg_bytes = svg_bytes
+      if not self.context.cache:
+        self._load_dom(svg_bytes)
 
-    if not self.texture and not self._dom:
+    if not self.texture and self._svg_bytes is None:
       source = self._source_path or "inline SVG"
       raise RuntimeError(f"Unable to load texture or SVG data from {source}.")
 
-  def _load_dom(self, svg_bytes: bytes) -> None:
-    stream = skia.MemoryStream.MakeCopy(svg_bytes)
+  def _load_dom(self, svg_bytes) -> None:
+    if isinstance(svg_bytes, memoryview):
+      # Parse straight from the mapped archive without copying
+      stream = skia.MemoryStream(svg_bytes, False)
+    else:
+      stream = skia.MemoryStream.MakeCopy(svg_bytes)
     dom = skia.SVGDOM.MakeFromStream(stream)
     if dom is None:
       source = self._source_path or "inline SVG"
@@ -204,58 +376,107 @@ class SvgDrawing:
     else:
       self._intrinsic_size = None
 
+  def _get_dom(self) -> "skia.SVGDOM":
+    if self._dom is None:
+      self._load_dom(self._svg_bytes)
+    return self._dom
+
+  def _get_digest(self) -> str:
+    if self._digest is None:
+      self._digest = hashlib.sha1(self._svg_bytes).hexdigest()
+    return self._digest
+
   def _default_texture_size(self) -> Tuple[int, int]:
     if self.texture:
       return tuple(int(v) for v in self.texture.pixelSize)
+    self._get_dom()
     if self._intrinsic_size:
       return self._intrinsic_size
     _, _, w, h = self.context.geometry
     return (max(1, int(w)), max(1, int(h)))
 
-  def _render_svg_to_image(self, width: int, height: int) -> Image.Image:
-    assert self._dom is not None
+  def _rasterize(self, width: int, height: int) -> numpy.ndarray:
+    """
+    Render the drawing to RGBA pixels in the row order of
+    L{Texture.decodeImage}, top row first.
+
+    Skia does the downscaling and unpremultiplication while copying the
+    pixels into the returned array.
+
+    @return: (height, width, 4) uint8 array
+    """
+    dom = self._get_dom()
     scale = self.context._render_scale()
     render_width = max(1, int(round(width * scale)))
     render_height = max(1, int(round(height * scale)))
 
-    self._dom.setContainerSize(skia.Size(float(render_width), float(render_height)))
+    dom.setContainerSize(skia.Size(float(render_width), float(render_height)))
     surface = skia.Surface.MakeRasterN32Premul(render_width, render_height)
     if surface is None:
       raise RuntimeError("Unable to allocate Skia surface for SVG rendering")
     canvas = surface.getCanvas()
     canvas.clear(skia.Color4f(0.0, 0.0, 0.0, 0.0))
-    self._dom.render(canvas)
-    image = surface.makeImageSnapshot()
-    if image is None:
-      raise RuntimeError("Unable to snapshot rendered SVG surface")
-    data = image.encodeToData()
-    if data is None:
-      raise RuntimeError("Unable to encode rendered SVG to image data")
+    dom.render(canvas)
 
-    with BytesIO(bytes(data)) as encoded:
-      pil_image = Image.open(encoded)
-      pil_image.load()
-    if pil_image.mode != "RGBA":
-      pil_image = pil_image.convert("RGBA")
-
-    if scale != 1.0:
-      pil_image = pil_image.resize((width, height), Image.LANCZOS)
+    pixels = numpy.empty((height, width, 4), numpy.uint8)
+    info = skia.ImageInfo.Make(width, height, skia.kRGBA_8888_ColorType, skia.kUnpremul_AlphaType)
+    pixmap = skia.Pixmap(info, pixels, width * 4)
+    if (render_width, render_height) == (width, height):
+      copied = surface.readPixels(pixmap)
+    else:
+      image = surface.makeImageSnapshot()
+      copied = image is not None and image.scalePixels(pixmap, skia.SamplingOptions(skia.CubicResampler.Mitchell()))
+    if not copied:
+      raise RuntimeError("Unable to read back rendered SVG pixels")
+    return pixels
+
+  def _load_cached_texture(self, width: int, height: int) -> bool:
+    """
+    Build the texture from a cached raster or rasterize and cache it.
+
+    @param width:   Texture width or 0 for the intrinsic size
+    @param height:  Texture height or 0 for the intrinsic size
+    @return:        True if the texture was loaded
+    """
+    cache = self.context.cache
+    scale = self.context._render_scale()
+    digest = self._get_digest()
+    entry = cache.load(digest, width, height, scale, self._source_path)
+    if entry is None:
+      size = (width, height) if width and height else self._default_texture_size()
+      pixels = self._rasterize(*size)
+      cache.store(digest, width, height, scale, size, pixels, self._source_path)
+      levels = [pixels]
+    else:
+      size, levels = entry
 
-    return pil_image
+    texture = Texture(owner = "Svg")
+    if len(levels) > 1:
+      texture.loadRawLevels(size, levels, GL_RGBA, 4)
+    else:
+      texture.loadRaw(size, levels[0], GL_RGBA, 4)
+    self.texture = texture
+    return True
 
   def convertToTexture(self, width: int, height: int) -> None:
-    if self.texture and (self.texture.pixelSize == (width, height) or not self._dom):
+    if self.texture and (self.texture.pixelSize == (width, height) or self._svg_bytes is None):
       return
-    if not self._dom:
+    if self._svg_bytes is None:
       raise RuntimeError("SVG drawing does not contain vector data to render")
-    image = self._render_svg_to_image(width, height)
-    texture = Texture()
-    texture.loadImage(image)
+    if self.context.cache:
+      self._load_cached_texture(width, height)
+      return
+    pixels = self._rasterize(width, height)
+    texture = Texture(owner = "Svg")
+    texture.loadRaw((width, height), pixels, GL_RGBA, 4)
     self.texture = texture
 
   def _ensure_texture(self) -> None:
     if self.texture:
       return
+    if self.context.cache and self._svg_bytes is not None:
+      self._load_cached_texture(0, 0)
+      return
     width, height = self._default_texture_size()
     self.convertToTexture(width, height)
 
@@ -265,7 +486,16 @@ class SvgDrawing:
     return transform
 
   def draw(self, color: Tuple[float, float, float, float] = (1.0, 1.0, 1.0, 1.0)) -> None:
-    self._ensure_texture()
+    if self._failed:
+      return
+    try:
+      self._ensure_texture()
+    except RuntimeError as e:
+      # The cache defers parsing to the first draw, so report a broken
+      # drawing once instead of failing every frame
+      Log.error("Unable to draw %s: %s", self._source_path or "inline SVG", e)
+      self._failed = True
+      return
     if not self.texture:
       raise RuntimeError("SVG drawing has no texture to draw")
 
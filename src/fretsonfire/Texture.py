@@ -23,8 +23,11 @@ from __future__ import division
 
 from . import Log
 from . import Config
+from . import GLResource
 from PIL import Image
 import pygame
+import numpy
+import ctypes
 from io import BytesIO
 from PIL import PngImagePlugin
 from OpenGL import extensions as gl_extensions
@@ -37,6 +40,7 @@ from OpenGL.GL import (
   GL_LUMINANCE,
   GL_MODULATE,
   GL_NICEST,
+  GL_PACK_ALIGNMENT,
   GL_PERSPECTIVE_CORRECTION_HINT,
   GL_RGBA,
   GL_RGB,
@@ -51,19 +55,28 @@ from OpenGL.GL import (
   GL_UNPACK_ALIGNMENT,
   GL_UNSIGNED_BYTE,
   GL_VENDOR,
+  GL_VERSION,
+  GL_PIXEL_UNPACK_BUFFER,
+  GL_STREAM_DRAW,
+  GL_MAP_WRITE_BIT,
+  GL_MAP_INVALIDATE_BUFFER_BIT,
+  glBindBuffer,
   glBindTexture,
+  glBufferData,
   glCopyTexSubImage2D,
-  glDeleteBuffers,
-  glDeleteTextures,
+  glGenBuffers,
   glGenTextures,
   glGetString,
+  glGetTexImage,
   glHint,
+  glMapBufferRange,
   glPixelStorei,
   glTexEnvf,
   glTexImage2D,
   glTexParameterf,
   glTexParameteri,
   glTexSubImage2D,
+  glUnmapBuffer,
 )
 from OpenGL.GL.EXT.framebuffer_object import (
   GL_COLOR_ATTACHMENT0_EXT,
@@ -84,17 +97,13 @@ try:
   from OpenGL.GLU import gluBuild2DMipmaps
 except ImportError:  # pragma: no cover - optional dependency on some platforms
   gluBuild2DMipmaps = None  # type: ignore[assignment]
-from queue import Queue, Empty
 
 Config.define("opengl", "supportfbo", bool, False)
+Config.define("opengl", "supportnpot", bool, True)
 
 class TextureException(Exception):
   pass
 
-# A queue containing (function, args) pairs that clean up deleted OpenGL handles.
-# The functions are called in the main OpenGL thread.
-cleanupQueue = Queue()
-
 class Framebuffer:
   fboSupported = None
 
@@ -114,6 +123,9 @@ class Framebuffer:
       self.fb             = glGenFramebuffersEXT(1)[0]
       self.depthbuf       = glGenRenderbuffersEXT(1)[0]
       self.stencilbuf     = glGenRenderbuffersEXT(1)[0]
+      GLResource.registry.register(GLResource.FRAMEBUFFER,  self.fb,         "Framebuffer")
+      GLResource.registry.register(GLResource.RENDERBUFFER, self.depthbuf,   "Framebuffer", width * height * 4)
+      GLResource.registry.register(GLResource.RENDERBUFFER, self.stencilbuf, "Framebuffer", width * height)
       glBindFramebufferEXT(GL_FRAMEBUFFER_EXT, self.fb)
       self._checkError()
       
@@ -169,8 +181,11 @@ class Framebuffer:
   def __del__(self):
     # Queue the buffers to be deleted later
     try:
-      cleanupQueue.put((glDeleteBuffers, [3, [self.depthbuf, self.stencilbuf, self.fb]]))
-    except NameError:
+      if self.fb:
+        GLResource.registry.release(GLResource.FRAMEBUFFER,  self.fb)
+        GLResource.registry.release(GLResource.RENDERBUFFER, self.depthbuf)
+        GLResource.registry.release(GLResource.RENDERBUFFER, self.stencilbuf)
+    except (NameError, AttributeError):
       pass
       
   def _fboSupported(self):
@@ -221,18 +236,53 @@ class Framebuffer:
       glCopyTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, 0, 0, self.size[0], self.size[1])
       glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
       
+def _glVersion():
+  try:
+    version = glGetString(GL_VERSION)
+    if isinstance(version, bytes):
+      version = version.decode("ascii", "ignore")
+    return tuple(int(v) for v in version.split(" ")[0].split(".")[:2])
+  except Exception:
+    return (1, 0)
+
+def _isPowerOfTwo(n):
+  return n > 0 and not (n & (n - 1))
+
+def decodeImage(image):
+  """
+  Convert a PIL image into raw pixel data that can be uploaded with
+  L{Texture.loadRaw}. Does not touch OpenGL, so it can be called from
+  any thread.
+
+  @param image:   PIL image or an image file name
+  @return:        (size, string, format, components) tuple
+  """
+  if not isinstance(image, Image.Image):
+    image = Image.open(image)
+  image = image.transpose(Image.FLIP_TOP_BOTTOM)
+  if image.mode == "RGBA":
+    return image.size, image.tobytes('raw', 'RGBA', 0, -1), GL_RGBA, 4
+  elif image.mode == "RGB":
+    return image.size, image.tobytes('raw', 'RGB', 0, -1), GL_RGB, 3
+  elif image.mode == "L":
+    return image.size, image.tobytes('raw', 'L', 0, -1), GL_LUMINANCE, 1
+  raise TextureException("Unsupported image mode '%s'" % image.mode)
+
 class Texture:
   """Represents an OpenGL texture, optionally loaded from disk in any format supported by PIL"""
 
-  def __init__(self, name = None, target = GL_TEXTURE_2D):
-    # Delete all pending textures
-    try:
-      func, args = cleanupQueue.get_nowait()
-      func(*args)
-    except Empty:
-      pass
-    
+  # Driver capabilities, detected on first use
+  npotSupported    = None
+  pboSupported     = None
+  generateMipmap   = None
+
+  # Pixel unpack buffer shared by all texture uploads
+  uploadBuffer     = 0
+  uploadBufferSize = 0
+
+  def __init__(self, name = None, target = GL_TEXTURE_2D, owner = "Texture"):
     self.texture = glGenTextures(1)
+    GLResource.registry.register(GLResource.TEXTURE, self.texture, owner)
     self.texEnv = GL_MODULATE
     self.glTarget = target
     self.framebuffer = None
@@ -250,23 +300,13 @@ class Texture:
 
   def loadImage(self, image):
     """Load the texture from a PIL image"""
-    image = image.transpose(Image.FLIP_TOP_BOTTOM)
-    if image.mode == "RGBA":
-      string = image.tobytes('raw', 'RGBA', 0, -1)
-      self.loadRaw(image.size, string, GL_RGBA, 4)
-    elif image.mode == "RGB":
-      string = image.tobytes('raw', 'RGB', 0, -1)
-      self.loadRaw(image.size, string, GL_RGB, 3)
-    elif image.mode == "L":
-      string = image.tobytes('raw', 'L', 0, -1)
-      self.loadRaw(image.size, string, GL_LUMINANCE, 1)
-    else:
-      raise TextureException("Unsupported image mode '%s'" % image.mode)
+    self.loadRaw(*decodeImage(image))
 
   def prepareRenderTarget(self, width, height, generateMipmap = True):
     self.framebuffer = Framebuffer(self.texture, width, height, generateMipmap)
     self.pixelSize   = (width, height)
     self.size        = (1.0, 1.0)
+    self._setStorageSize(width * height * 4)
 
   def setAsRenderTarget(self):
     assert self.framebuffer
@@ -282,12 +322,69 @@ class Texture:
       m <<= 1
     return m
 
+  def _checkCapabilities(self):
+    if Texture.npotSupported is not None:
+      return
+    version = _glVersion()
+    Texture.npotSupported = Config.get("opengl", "supportnpot") and \
+                            (version >= (2, 0) or gl_extensions.hasGLExtension("GL_ARB_texture_non_power_of_two"))
+    Texture.pboSupported  = version >= (3, 0) or \
+                            (gl_extensions.hasGLExtension("GL_ARB_pixel_buffer_object") and \
+                             gl_extensions.hasGLExtension("GL_ARB_map_buffer_range"))
+    if version >= (3, 0) or gl_extensions.hasGLExtension("GL_ARB_framebuffer_object"):
+      from OpenGL.GL import glGenerateMipmap
+      Texture.generateMipmap = glGenerateMipmap
+    elif gl_extensions.hasGLExtension("GL_EXT_framebuffer_object"):
+      Texture.generateMipmap = glGenerateMipmapEXT
+    else:
+      Texture.generateMipmap = False
+    Log.debug("Texture uploads: non-power-of-two %s, pixel buffers %s, GPU mipmaps %s." % \
+              (Texture.npotSupported, Texture.pboSupported, bool(Texture.generateMipmap)))
+
+  def _uploadLevel0(self, w, h, string, format, components):
+    """
+    Allocate the texture and upload the base level.
+
+    If pixel buffers are supported, the pixels are copied into a mapped
+    pixel unpack buffer and the texture is filled from it, so the driver
+    transfers them to the GPU without stalling the caller. Otherwise, or if
+    the buffer can't be mapped, the pixels are uploaded directly.
+    """
+    if Texture.pboSupported:
+      data = numpy.frombuffer(string, numpy.uint8)
+      if not Texture.uploadBuffer:
+        Texture.uploadBuffer = glGenBuffers(1)
+        GLResource.registry.register(GLResource.BUFFER, Texture.uploadBuffer, "Texture uploads")
+      glBindBuffer(GL_PIXEL_UNPACK_BUFFER, Texture.uploadBuffer)
+      try:
+        if data.nbytes > Texture.uploadBufferSize:
+          glBufferData(GL_PIXEL_UNPACK_BUFFER, data.nbytes, None, GL_STREAM_DRAW)
+          Texture.uploadBufferSize = data.nbytes
+          GLResource.registry.resize(GLResource.BUFFER, Texture.uploadBuffer, data.nbytes)
+        # Invalidating the buffer lets the driver hand out fresh memory
+        # instead of waiting for the previous upload to finish
+        pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, data.nbytes,
+                                   GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        if pointer:
+          ctypes.memmove(pointer, data.ctypes.data, data.nbytes)
+          # The contents are lost if the buffer was corrupted while mapped
+          if glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER):
+            glTexImage2D(self.glTarget, 0, components, w, h, 0, format, GL_UNSIGNED_BYTE, None)
+            return
+      finally:
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    glTexImage2D(self.glTarget, 0, components, w, h, 0, format, GL_UNSIGNED_BYTE, string)
+
   def loadSurface(self, surface, monochrome = False, alphaChannel = False):
     """Load the texture from a pygame surface"""
+    self._checkCapabilities()
 
-    # make it a power of two
+    # make it a power of two unless the driver can handle any size
     self.pixelSize = w, h = surface.get_size()
-    w2, h2 = [self.nextPowerOfTwo(x) for x in [w, h]]
+    if Texture.npotSupported:
+      w2, h2 = w, h
+    else:
+      w2, h2 = [self.nextPowerOfTwo(x) for x in [w, h]]
     if w != w2 or h != h2:
       s = pygame.Surface((w2, h2), pygame.SRCALPHA, 32)
       s.blit(surface, (0, h2 - h))
@@ -336,11 +433,19 @@ class Texture:
     self.format = format
     self.components = components
     (w, h) = size
+    self._checkCapabilities()
     Texture.bind(self)
     glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-    if bool(gluBuild2DMipmaps):
+    if Texture.generateMipmap and (Texture.npotSupported or (_isPowerOfTwo(w) and _isPowerOfTwo(h))):
+      # Upload the base level once and let the GPU build the mipmaps
+      self._uploadLevel0(w, h, string, format, components)
+      Texture.generateMipmap(self.glTarget)
+      self._setStorageSize(w * h * self._bytesPerPixel(components) * 4 // 3)
+    elif bool(gluBuild2DMipmaps):
       gluBuild2DMipmaps(self.glTarget, components, w, h, format, GL_UNSIGNED_BYTE, string)
+      self._setStorageSize(w * h * self._bytesPerPixel(components) * 4 // 3)
     else:
+      self._setStorageSize(w * h * self._bytesPerPixel(components))
       glTexImage2D(
         self.glTarget,
         0,
@@ -354,6 +459,25 @@ class Texture:
       )
       glTexParameteri(self.glTarget, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
 
+  def loadRawLevels(self, size, levels, format, components):
+    """Load a raw image together with a precomputed mipmap chain. 'levels'
+       is a list of buffers starting from the full size image, each level
+       half the size of the previous one.
+       """
+    self.pixelSize = size
+    self.size = (1.0, 1.0)
+    self.format = format
+    self.components = components
+    (w, h) = size
+    Texture.bind(self)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    size = 0
+    for level, string in enumerate(levels):
+      glTexImage2D(self.glTarget, level, components, w, h, 0, format, GL_UNSIGNED_BYTE, string)
+      size += w * h * self._bytesPerPixel(components)
+      w, h = max(1, w // 2), max(1, h // 2)
+    self._setStorageSize(size)
+
   def loadSubRaw(self, size, position, string, format):
     Texture.bind(self)
     glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
@@ -366,6 +490,16 @@ class Texture:
     Texture.bind(self)
     glTexImage2D(GL_TEXTURE_2D, 0, format, size[0], size[1], 0,
                  format, GL_UNSIGNED_BYTE, "\x00" * (size[0] * size[1] * 4))
+    self._setStorageSize(size[0] * size[1] * 4)
+
+  def _bytesPerPixel(self, components):
+    # 'components' is either a component count or an internal format constant
+    if components in (1, 2, 3, 4):
+      return components
+    return {GL_INTENSITY8: 1, GL_LUMINANCE: 1, GL_RGB: 3}.get(components, 4)
+
+  def _setStorageSize(self, size):
+    GLResource.registry.resize(GLResource.TEXTURE, self.texture, size)
 
   def setDefaults(self):
     """Set the default OpenGL options for this texture"""
@@ -386,8 +520,8 @@ class Texture:
   def __del__(self):
     # Queue this texture to be deleted later
     try:
-      cleanupQueue.put((glDeleteTextures, [self.texture]))
-    except NameError:
+      GLResource.registry.release(GLResource.TEXTURE, self.texture)
+    except (NameError, AttributeError):
       pass
 
   def bind(self, glTarget = None):
@@ -405,44 +539,237 @@ TEXTURE_ATLAS_SIZE = 1024
 class TextureAtlasFullException(Exception):
   pass
 
-class TextureAtlas(object):
-  def __init__(self, size = TEXTURE_ATLAS_SIZE):
-    self.texture      = Texture()
-    self.cursor       = (0, 0)
-    self.rowHeight    = 0
-    self.surfaceCount = 0
-    self.texture.loadEmpty((size, size), GL_RGBA)
+class SkylinePacker(object):
+  """
+  Packs rectangles into an area using the skyline bottom-left heuristic.
+
+  The skyline is a list of [x, y, width] segments describing the top edge
+  of the packed rectangles. A new rectangle is placed on the segment run
+  where its top edge ends up lowest, which keeps the slack between rows
+  available for later rectangles.
+  """
+  def __init__(self, width, height):
+    self.width     = width
+    self.height    = height
+    self.skyline   = [[0, 0, width]]
+    self.usedArea  = 0
+    self.rectCount = 0
+
+  def _fit(self, index, w, h):
+    """@return: The y coordinate for a w by h rectangle at segment index, or None."""
+    x = self.skyline[index][0]
+    if x + w > self.width:
+      return None
+    y = 0
+    remaining = w
+    while remaining > 0:
+      sx, sy, sw = self.skyline[index]
+      y = max(y, sy)
+      if y + h > self.height:
+        return None
+      remaining -= sw
+      index += 1
+    return y
+
+  def insert(self, w, h):
+    """
+    Find room for a rectangle.
+
+    @param w:   Rectangle width
+    @param h:   Rectangle height
+    @return:    (x, y) position of the rectangle or None if it doesn't fit
+    """
+    best = None
+    for i, (x, y, sw) in enumerate(self.skyline):
+      fy = self._fit(i, w, h)
+      if fy is not None and (best is None or (fy + h, sw) < (best[1] + h, best[2])):
+        best = (i, fy, sw)
+    if best is None:
+      return None
+
+    i, y, sw = best
+    x = self.skyline[i][0]
+    self.skyline.insert(i, [x, y + h, w])
+
+    # Cut the segments covered by the new one
+    j = i + 1
+    while j < len(self.skyline):
+      seg = self.skyline[j]
+      overlap = x + w - seg[0]
+      if overlap <= 0:
+        break
+      if overlap < seg[2]:
+        seg[0] += overlap
+        seg[2] -= overlap
+        break
+      del self.skyline[j]
+
+    # Merge neighbours at the same height
+    j = 0
+    while j < len(self.skyline) - 1:
+      if self.skyline[j][1] == self.skyline[j + 1][1]:
+        self.skyline[j][2] += self.skyline[j + 1][2]
+        del self.skyline[j + 1]
+      else:
+        j += 1
+
+    self.usedArea  += w * h
+    self.rectCount += 1
+    return (x, y)
+
+  def grow(self, width, height):
+    """Enlarge the packing area. Existing rectangles keep their positions."""
+    assert width >= self.width and height >= self.height
+    if width > self.width:
+      if self.skyline[-1][1] == 0:
+        self.skyline[-1][2] += width - self.width
+      else:
+        self.skyline.append([self.width, 0, width - self.width])
+    self.width, self.height = width, height
 
-  def add(self, surface, margin = 0):
-    w, h = surface.get_size()
-    x, y = self.cursor
+  def getOccupancy(self):
+    """@return: Fraction of the area covered by rectangles"""
+    return self.usedArea / float(self.width * self.height)
+
+class TextureAtlas(object):
+  """
+  A texture holding many small images. The page starts at the given size
+  and doubles up to maxSize when it runs out of room.
+
+  Growing the page changes the texture coordinates of the images in it.
+  The coordinate lists returned by L{add} are updated in place, and
+  L{TextureAtlas.generation} is incremented so that users can invalidate
+  anything derived from the old coordinates.
+  """
+
+  # Incremented every time any atlas page grows
+  generation = 0
+
+  def __init__(self, size = TEXTURE_ATLAS_SIZE, owner = "TextureAtlas", maxSize = None):
+    self.owner        = owner
+    self.maxSize      = max(size, maxSize or size)
+    self.packer       = SkylinePacker(size, size)
+    self.coordinates  = []
+    self.texture      = self._createTexture(size)
+
+  def _createTexture(self, size):
+    texture = Texture(owner = self.owner)
+    texture.loadEmpty((size, size), GL_RGBA)
+    texture.setFilter(GL_LINEAR, GL_LINEAR)
+    texture.setRepeat(GL_CLAMP, GL_CLAMP)
+    return texture
+
+  def _grow(self):
+    oldSize = self.texture.pixelSize[0]
+    size    = oldSize * 2
+    if size > self.maxSize:
+      return False
 
-    w += margin
-    h += margin
+    # Copy the old page into the corner of a bigger one
+    self.texture.bind()
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    pixels = glGetTexImage(GL_TEXTURE_2D, 0, GL_RGBA, GL_UNSIGNED_BYTE)
+    self.texture = self._createTexture(size)
+    self.texture.loadSubRaw((oldSize, oldSize), (0, 0), pixels, GL_RGBA)
+    self.packer.grow(size, size)
+
+    scale = oldSize / float(size)
+    for c in self.coordinates:
+      c[:] = [v * scale for v in c]
+    TextureAtlas.generation += 1
+    Log.debug("Texture atlas grown to %dx%d." % (size, size))
+    return True
 
-    if w > self.texture.pixelSize[0] or h > self.texture.pixelSize[1]:
+  def _allocate(self, w, h):
+    if w > self.maxSize or h > self.maxSize:
       raise ValueError("Surface is too big to fit into atlas.")
+    while True:
+      position = self.packer.insert(w, h)
+      if position is not None:
+        return position
+      if not self._grow():
+        Log.debug("Texture atlas %s full after %d surfaces, %.0f%% used." % \
+                  (self.texture.pixelSize, self.packer.rectCount, 100 * self.packer.getOccupancy()))
+        raise TextureAtlasFullException()
+
+  def _coordinates(self, x, y, w, h):
+    W, H = self.texture.pixelSize
+    c = [x / float(W), y / float(H), (x + w) / float(W), (y + h) / float(H)]
+    self.coordinates.append(c)
+    return c
 
-    if x + w >= self.texture.pixelSize[0]:
-      x = 0
-      y += self.rowHeight
-      self.rowHeight = 0
-
-    if y + h >= self.texture.pixelSize[1]:
-      Log.debug("Texture atlas %s full after %d surfaces." % (self.texture.pixelSize, self.surfaceCount))
-      raise TextureAtlasFullException()
+  def add(self, surface, margin = 0):
+    """
+    Add a pygame surface to the atlas.
 
+    @param surface:   Surface with an alpha channel
+    @param margin:    Number of empty pixels to leave around the image
+    @return:          Mutable [x1, y1, x2, y2] list of texture coordinates
+    """
+    w, h = surface.get_size()
+    x, y = self._allocate(w + margin, h + margin)
     self.texture.loadSubsurface(surface, position = (x, y), alphaChannel = True)
-
-    self.surfaceCount += 1
-    self.rowHeight = max(self.rowHeight, h)
-    self.cursor = (x + w, y + h)
-
-    # Return the coordinates for the uploaded texture patch
-    w -= margin
-    h -= margin
-    return  x      / float(self.texture.pixelSize[0]),  y      / float(self.texture.pixelSize[1]), \
-           (x + w) / float(self.texture.pixelSize[0]), (y + h) / float(self.texture.pixelSize[1])
+    return self._coordinates(x, y, w, h)
+
+  def addRaw(self, size, string, margin = 0):
+    """
+    Add raw RGBA pixels to the atlas.
+
+    @param size:      (width, height) of the image
+    @param string:    Pixel data, bottom row first
+    @param margin:    Number of empty pixels to leave around the image
+    @return:          Mutable [x1, y1, x2, y2] list of texture coordinates
+    """
+    w, h = size
+    x, y = self._allocate(w + margin, h + margin)
+    self.texture.loadSubRaw((w, h), (x, y), string, GL_RGBA)
+    return self._coordinates(x, y, w, h)
+
+  def addImages(self, images, margin = 0):
+    """
+    Add several images to the atlas with a single texture upload.
+
+    @param images:    List of ((width, height), pixels) pairs with RGBA
+                      pixels, bottom row first
+    @param margin:    Number of empty pixels to leave around each image
+    @return:          Coordinate lists of the images that fit, in order.
+                      The list is shorter than L{images} if the page filled up.
+    """
+    placed = []
+    for (w, h), pixels in images:
+      try:
+        x, y = self._allocate(w + margin, h + margin)
+      except TextureAtlasFullException:
+        break
+      placed.append((x, y, w, h, pixels))
+    if not placed:
+      return []
+
+    # Compose the affected rows of the page in memory and upload them at once.
+    # Rows that already hold images are read back so they aren't overwritten.
+    W, H   = self.texture.pixelSize
+    top    = min(y for x, y, w, h, pixels in placed)
+    bottom = max(y + h for x, y, w, h, pixels in placed)
+    if self.packer.rectCount > len(placed):
+      self.texture.bind()
+      glPixelStorei(GL_PACK_ALIGNMENT, 1)
+      page  = numpy.frombuffer(glGetTexImage(GL_TEXTURE_2D, 0, GL_RGBA, GL_UNSIGNED_BYTE), numpy.uint8)
+      band  = page.reshape(H, W, 4)[top:bottom].copy()
+    else:
+      band  = numpy.zeros((bottom - top, W, 4), numpy.uint8)
+    for x, y, w, h, pixels in placed:
+      band[y - top:y - top + h, x:x + w] = numpy.frombuffer(pixels, numpy.uint8).reshape(h, w, 4)
+    self.texture.loadSubRaw((W, bottom - top), (0, top), band, GL_RGBA)
+    return [self._coordinates(x, y, w, h) for x, y, w, h, pixels in placed]
+
+  def getStatistics(self):
+    """@return: Dictionary describing the page size and how well it is packed"""
+    return {
+      "size":      self.texture.pixelSize,
+      "images":    self.packer.rectCount,
+      "usedArea":  self.packer.usedArea,
+      "occupancy": self.packer.getOccupancy(),
+    }
 
   def bind(self):
     self.texture.bind()
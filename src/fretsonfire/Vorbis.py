@@ -0,0 +1,145 @@
+#####################################################################
+#                                                                   #
+# Frets on Fire                                                     #
+# Copyright (C) 2006 Sami Kyöstilä                                  #
+#                                                                   #
+# This program is free software; you can redistribute it and/or     #
+# modify it under the terms of the GNU General Public License       #
+# as published by the Free Software Foundation; either version 2    #
+# of the License, or (at your option) any later version.            #
+#                                                                   #
+# This program is distributed in the hope that it will be useful,   #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of    #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the     #
+# GNU General Public License for more details.                      #
+#                                                                   #
+# You should have received a copy of the GNU General Public License #
+# along with this program; if not, write to the Free Software       #
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,        #
+# MA  02110-1301, USA.                                              #
+#####################################################################
+
+"""Incremental Ogg Vorbis decoding through libvorbisfile."""
+
+import os
+import glob
+import ctypes
+import ctypes.util
+
+import numpy
+
+from . import Log
+
+# Generous upper bound for sizeof(OggVorbis_File), which is opaque to us
+OGG_VORBIS_FILE_SIZE = 4096
+
+# Return value of ov_read for interrupted data
+OV_HOLE = -3
+
+class _VorbisInfo(ctypes.Structure):
+  _fields_ = [
+    ("version",  ctypes.c_int),
+    ("channels", ctypes.c_int),
+    ("rate",     ctypes.c_long),
+  ]
+
+def _findLibrary():
+  candidates = []
+  name = ctypes.util.find_library("vorbisfile")
+  if name:
+    candidates.append(name)
+  # PyGame bundles the library with SDL_mixer on most platforms
+  try:
+    import pygame
+    root = os.path.dirname(pygame.__file__)
+    for pattern in [os.path.join(root, "*vorbisfile*"),
+                    os.path.join(root, ".dylibs", "*vorbisfile*"),
+                    os.path.join(root, os.pardir, "pygame.libs", "*vorbisfile*")]:
+      candidates += sorted(glob.glob(pattern))
+  except ImportError:
+    pass
+
+  for candidate in candidates:
+    try:
+      lib = ctypes.CDLL(candidate)
+    except OSError:
+      continue
+    lib.ov_fopen.argtypes    = [ctypes.c_char_p, ctypes.c_void_p]
+    lib.ov_fopen.restype     = ctypes.c_int
+    lib.ov_info.argtypes     = [ctypes.c_void_p, ctypes.c_int]
+    lib.ov_info.restype      = ctypes.POINTER(_VorbisInfo)
+    lib.ov_read.argtypes     = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_int,
+                                ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+    lib.ov_read.restype      = ctypes.c_long
+    lib.ov_pcm_seek.argtypes = [ctypes.c_void_p, ctypes.c_int64]
+    lib.ov_pcm_seek.restype  = ctypes.c_int
+    lib.ov_pcm_total.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.ov_pcm_total.restype = ctypes.c_int64
+    lib.ov_clear.argtypes    = [ctypes.c_void_p]
+    lib.ov_clear.restype     = ctypes.c_int
+    return lib
+  return None
+
+_lib = _findLibrary()
+if not _lib:
+  Log.warn("libvorbisfile not found. Ogg files will be fully decoded before playing.")
+
+def isAvailable():
+  """@return: True if Ogg Vorbis files can be decoded incrementally"""
+  return _lib is not None
+
+class VorbisFile(object):
+  """An Ogg Vorbis file decoded a piece at a time into 16 bit samples."""
+  def __init__(self, fileName):
+    """
+    @param fileName:  Ogg Vorbis file name
+    """
+    if not _lib:
+      raise IOError("libvorbisfile is not available")
+    self.handle = ctypes.create_string_buffer(OGG_VORBIS_FILE_SIZE)
+    if _lib.ov_fopen(os.fsencode(fileName), self.handle) != 0:
+      self.handle = None
+      raise IOError("Unable to open Ogg Vorbis file %s" % fileName)
+    info = _lib.ov_info(self.handle, -1).contents
+    self.channels  = info.channels
+    self.frequency = info.rate
+    self.bitstream = ctypes.c_int()
+
+  def getLength(self):
+    """@return: Length of the stream in samples per channel"""
+    return _lib.ov_pcm_total(self.handle, -1)
+
+  def seek(self, sample):
+    """Move to the given sample of the stream."""
+    if _lib.ov_pcm_seek(self.handle, sample) != 0:
+      raise IOError("Unable to seek to sample %d" % sample)
+
+  def read(self, samples):
+    """
+    Decode the next samples of the stream.
+
+    @param samples:   Maximum number of samples per channel to decode
+    @return:          int16 array with one column per channel, empty at the end of the stream
+    """
+    data = numpy.empty(samples * self.channels, numpy.int16)
+    size = data.nbytes
+    done = 0
+    while done < size:
+      n = _lib.ov_read(self.handle, data.ctypes.data + done, size - done, 0, 2, 1, ctypes.byref(self.bitstream))
+      if n == 0:
+        break
+      # Skip over holes in the stream
+      if n == OV_HOLE:
+        continue
+      if n < 0:
+        raise IOError("Ogg Vorbis decoding error %d" % n)
+      done += n
+    return data[:done // 2 // self.channels * self.channels].reshape(-1, self.channels)
+
+  def close(self):
+    if self.handle is not None:
+      _lib.ov_clear(self.handle)
+      self.handle = None
+
+  def __del__(self):
+    self.close()
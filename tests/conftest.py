@@ -1,7 +1,10 @@
 """Pytest configuration for Frets on Fire tests."""
 import os
 import warnings
+import wave
 
+import numpy
+import pygame
 import pytest
 
 from src.fretsonfire import Log
@@ -26,3 +29,40 @@ warnings.filterwarnings(
 def configure_logging(tmp_path):
     Log.configure(log_path=tmp_path / "fretsonfire.log", quiet=True, console=False)
     yield
+
+
+# Mixer frequency used by the audio tests
+FREQUENCY = 22050
+
+
+@pytest.fixture
+def mixer():
+    pygame.mixer.init(FREQUENCY, -16, 2, 1024)
+    try:
+        yield pygame.mixer.get_init()
+    finally:
+        pygame.mixer.quit()
+
+
+def write_wave(path, samples, frequency=FREQUENCY):
+    """Write a (frames, channels) int16 array to a wave file."""
+    f = wave.open(str(path), "wb")
+    f.setnchannels(samples.shape[1])
+    f.setsampwidth(2)
+    f.setframerate(frequency)
+    f.writeframes(samples.astype(numpy.int16).tobytes())
+    f.close()
+    return str(path)
+
+
+def write_constant_wave(path, value, frames):
+    """Write a stereo wave file whose samples all equal C{value}."""
+    return write_wave(path, numpy.full((frames, 2), value, numpy.int16))
+
+
+def read_wave(path):
+    """Read a wave file into a (frames, channels) int16 array."""
+    f = wave.open(str(path), "rb")
+    samples = numpy.frombuffer(f.readframes(f.getnframes()), numpy.int16).reshape(-1, f.getnchannels())
+    f.close()
+    return samples
@@ -1,7 +1,15 @@
 """Audio subsystem smoke tests."""
+import time
+from pathlib import Path
+
+import numpy
+import pygame
 import pytest
 
+from src.fretsonfire import Audio as AudioModule
+from src.fretsonfire import Vorbis
 from src.fretsonfire.Audio import Audio
+from tests.conftest import FREQUENCY, write_constant_wave, write_wave
 
 
 @pytest.fixture
@@ -17,3 +25,89 @@ def test_audio_open_and_close(audio):
     """Audio mixer should open with the default configuration."""
     assert audio.open()
 
+
+
+GUITAR_OGG = Path(__file__).resolve().parents[1] / "src" / "fretsonfire" / "data" / "songs" / "defy" / "guitar.ogg"
+
+
+class DummyConfig:
+    def get(self, section, option):
+        return {"streamchunksize": 1024, "streamdepth": 3}[option]
+
+
+class DummyEngine:
+    def __init__(self):
+        self.config = DummyConfig()
+        self.tasks = []
+
+    def addTask(self, task, synchronized=True):
+        self.tasks.append(task)
+
+    def removeTask(self, task):
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+
+def test_resampling_in_pieces_matches_whole_stream():
+    ramp = numpy.arange(0, 4000, dtype=numpy.int16).reshape(-1, 1) * 2
+    resampler = AudioModule.Resampler(44100, 22050)
+    pieces = [resampler(ramp[i:i + 333]) for i in range(0, len(ramp), 333)]
+    result = numpy.concatenate(pieces)[:, 0]
+    assert numpy.array_equal(result, ramp[:-1:2, 0])
+
+
+def test_streaming_sound_plays_to_the_end(audio, tmp_path):
+    audio.open(FREQUENCY, 16, True, 1024)
+    samples = (numpy.arange(FREQUENCY // 2 * 2, dtype=numpy.int16) % 100).reshape(-1, 2)
+    path = write_wave(tmp_path / "stem.wav", samples)
+
+    engine = DummyEngine()
+    sound = AudioModule.StreamingSound(engine, audio.getChannel(1), path)
+    assert isinstance(sound.decoder, AudioModule.WaveFile)
+    sound.play()
+    assert engine.tasks == [sound]
+
+    deadline = time.time() + 5
+    while sound.playing and time.time() < deadline:
+        assert sound.chunks.qsize() <= 3
+        sound.run(10)
+        time.sleep(0.005)
+    assert not sound.playing
+    # A finished stream removes itself from the engine
+    assert engine.tasks == []
+    sound.stop()
+    assert sound.thread is None
+
+
+def test_prepared_streaming_sound_plays_the_decoded_chunk(audio, tmp_path):
+    audio.open(FREQUENCY, 16, True, 1024)
+    path = write_constant_wave(tmp_path / "stem.wav", 100, FREQUENCY)
+
+    engine = DummyEngine()
+    sound = AudioModule.StreamingSound(engine, audio.getChannel(1), path)
+    sound.prepare()
+    assert sound.firstChunk is not None
+    assert engine.tasks == []
+
+    # Playing doesn't restart the decoder or wait for it
+    thread = sound.thread
+    sound.play()
+    assert sound.thread is thread
+    assert sound.firstChunk is None
+    assert engine.tasks == [sound]
+    sound.stop()
+    assert not sound.prepared
+
+
+@pytest.mark.skipif(not Vorbis.isAvailable(), reason="libvorbisfile not available")
+def test_vorbis_file_matches_full_decode(audio):
+    audio.open(44100, 16, True, 1024)
+    expected = pygame.sndarray.array(pygame.mixer.Sound(str(GUITAR_OGG)))
+    stream = Vorbis.VorbisFile(str(GUITAR_OGG))
+    assert (stream.frequency, stream.channels) == (44100, 2)
+    assert stream.getLength() == len(expected)
+
+    stream.seek(44100 * 10)
+    pieces = numpy.concatenate([stream.read(1000) for i in range(5)])
+    stream.close()
+    assert numpy.array_equal(pieces, expected[44100 * 10:44100 * 10 + 5000])
@@ -0,0 +1,116 @@
+"""A/V delay calibration tests with the dummy audio driver."""
+import numpy
+import pygame
+import pytest
+
+from src.fretsonfire import Calibration
+from src.fretsonfire.Audio import Audio
+from tests.conftest import FREQUENCY
+
+
+def test_click_track_has_a_click_at_each_click_time(mixer):
+    samples, clicks = Calibration.makeClickTrack(mixer, count = 4, period = 500, start = 100)
+    assert clicks == [100, 600, 1100, 1600]
+    assert samples.shape == (2100 * FREQUENCY // 1000, 2)
+    loud = numpy.flatnonzero(numpy.abs(samples[:, 0]) > 1000) * 1000 // FREQUENCY
+    assert sorted(set(int(t) // 500 * 500 + 100 for t in loud)) == clicks
+
+
+def test_latency_is_estimated_despite_outliers():
+    rng = numpy.random.RandomState(1)
+    clicks = [1000 + n * 750 for n in range(24)]
+    presses = [t + 180 + rng.normal(0, 8) for t in clicks[2:]]
+    # A late start, a double press and two stray presses
+    presses += [clicks[1] + 400, clicks[5] + 190, clicks[9] - 300, clicks[15] + 330]
+    latency, deviation, used = Calibration.estimateLatency(clicks, presses)
+    assert latency == pytest.approx(180, abs = 5)
+    assert deviation < 15
+    assert used == 22
+
+
+def test_too_few_presses_give_no_estimate():
+    clicks = [1000 + n * 750 for n in range(24)]
+    assert Calibration.estimateLatency(clicks, [clicks[0] + 50, clicks[1] + 60]) is None
+
+
+def test_calibration_records_presses_on_its_clock(mixer):
+    now = [5000.0]
+    calibration = Calibration.LatencyCalibration(count = 10, period = 500, clock = lambda: now[0])
+    calibration.start()
+    for clickTime in calibration.clickTimes:
+        now[0] = 5000.0 + clickTime + 120
+        calibration.press()
+    assert not calibration.isDone()
+    now[0] = 5000.0 + calibration.length
+    assert calibration.isDone()
+    calibration.press()
+    calibration.stop()
+    assert len(calibration.presses) == 10
+    assert calibration.getLatency()[0] == pytest.approx(120)
+
+
+def test_latencies_are_stored_per_device(tmp_path):
+    fileName = str(tmp_path / "latency.json")
+    assert Calibration.getLatency("dummy/a", fileName) is None
+    Calibration.setLatency("dummy/a", 123.4, fileName)
+    Calibration.setLatency("dummy/b", 45, fileName)
+    assert Calibration.getLatency("dummy/a", fileName) == 123
+    assert Calibration.getLatency("dummy/b", fileName) == 45
+
+
+class FakeConfig(object):
+    def get(self, section, option):
+        assert (section, option) == ("audio", "delay")
+        return 100
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.audio = Audio()
+        self.config = FakeConfig()
+
+
+def test_calibrated_latency_replaces_the_configured_delay(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    engine = FakeEngine()
+    engine.audio.open(FREQUENCY, 16, True, 1024)
+    try:
+        key = engine.audio.getDeviceKey()
+        assert key.endswith("/%d/2/1024" % FREQUENCY)
+        assert Calibration.getDelay(engine) == 100
+        Calibration.setLatency(key, 42)
+        assert Calibration.getDelay(engine) == 42
+    finally:
+        pygame.mixer.quit()
+
+
+def test_calibration_can_be_cleared(tmp_path):
+    fileName = str(tmp_path / "latency.json")
+    Calibration.setLatency("dummy/a", 80, fileName)
+    Calibration.setLatency("dummy/b", 90, fileName)
+    Calibration.clearLatency("dummy/a", fileName)
+    assert Calibration.getLatency("dummy/a", fileName) is None
+    assert Calibration.getLatency("dummy/b", fileName) == 90
+
+
+def test_choosing_a_delay_by_hand_replaces_the_calibration(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    from src.fretsonfire import GameEngine, Config
+    from src.fretsonfire.Settings import DelayConfigChoice
+
+    engine = FakeEngine()
+    engine.config = Config.Config(Config.prototype, str(tmp_path / "fretsonfire.ini"))
+    engine.audio.open(FREQUENCY, 16, True, 1024)
+    try:
+        key = engine.audio.getDeviceKey()
+        Calibration.setLatency(key, 142.4)
+        choice = DelayConfigChoice(engine, engine.config, "audio", "delay")
+        assert choice.values[choice.valueIndex] == 142
+
+        choice.selectNextValue()
+        choice.apply()
+        assert engine.config.get("audio", "delay") == 143
+        assert Calibration.getLatency(key) is None
+        assert Calibration.getDelay(engine) == 143
+    finally:
+        pygame.mixer.quit()
@@ -0,0 +1,74 @@
+"""COLLADA parsing tests using small in-memory documents."""
+import io
+
+import numpy
+import pytest
+
+from src.fretsonfire import Collada
+
+DOCUMENT = """<?xml version="1.0"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.0">
+  <library_geometries>
+    <geometry id="Shape" name="Shape">
+      <mesh>
+        <source id="Shape-Position">
+          <float_array id="Shape-Position-array" count="15">0 0 0  1 0 0
+            1 1 0  0 1 0  2 0 0</float_array>
+          <technique_common><accessor source="#Shape-Position-array" count="5" stride="3"/></technique_common>
+        </source>
+        <source id="Shape-UV">
+          <float_array id="Shape-UV-array" count="6">0 0 1  1 0 1</float_array>
+          <technique_common><accessor source="#Shape-UV-array" count="2" stride="3"/></technique_common>
+        </source>
+        <vertices id="Shape-Vertex"><input semantic="POSITION" source="#Shape-Position"/></vertices>
+        <polylist count="2">
+          <input offset="0" semantic="VERTEX" source="#Shape-Vertex"/>
+          <input offset="1" semantic="TEXCOORD" source="#Shape-UV"/>
+          <vcount>4 3</vcount>
+          <p>0 0 1 1 2 0 3 1  1 1 4 0 2 1</p>
+        </polylist>
+        <polygons count="2">
+          <input offset="0" semantic="VERTEX" source="#Shape-Vertex"/>
+          <p>0 1 2</p>
+          <p>
+            1 4 2 3
+          </p>
+        </polygons>
+      </mesh>
+    </geometry>
+  </library_geometries>
+</COLLADA>
+"""
+
+
+def load():
+    doc = Collada.DaeDocument()
+    doc.LoadDocumentFromFile(io.BytesIO(DOCUMENT.encode("utf-8")))
+    return doc.geometriesLibrary.FindObject("Shape").data
+
+
+def test_sources_respect_the_accessor_stride():
+    mesh = load()
+    uv = mesh.sources["Shape-UV"].GetArray(2)
+    assert uv.dtype == numpy.float32
+    assert uv.tolist() == [[0, 0], [1, 0]]
+    assert mesh.sources["Shape-Position"].GetArray().shape == (5, 3)
+
+
+def test_sources_reject_a_stride_smaller_than_requested():
+    with pytest.raises(ValueError, match="Shape-UV"):
+        load().sources["Shape-UV"].GetArray(4)
+
+
+def test_polylists_are_triangulated_as_fans():
+    polylist, polygons = load().primitives[1], load().primitives[0]
+    assert polylist.vcount.tolist() == [4, 3]
+    assert polylist.Triangulate().tolist() == [
+        [0, 0], [1, 1], [2, 0],
+        [0, 0], [2, 0], [3, 1],
+        [1, 1], [4, 0], [2, 1],
+    ]
+    assert [p.tolist() for p in polylist.polygons] == [[0, 0, 1, 1, 2, 0, 3, 1], [1, 1, 4, 0, 2, 1]]
+
+    assert polygons.vcount.tolist() == [3, 4]
+    assert polygons.Triangulate()[:, 0].tolist() == [0, 1, 2, 1, 4, 2, 1, 2, 3]
@@ -0,0 +1,199 @@
+"""Font geometry cache, text batch and distance field tests that avoid OpenGL dependencies."""
+import numpy
+
+from src.fretsonfire import Font as Font_module
+from src.fretsonfire.Font import GeometryArena, StringCache, distanceField
+
+
+def run(count, value):
+    vertices = numpy.full((count, 2), value, numpy.float32)
+    return ("page", count, vertices, vertices + 1)
+
+
+def test_arena_reuses_released_ranges():
+    arena = GeometryArena(16)
+    a = arena.allocate(8)
+    b = arena.allocate(8)
+    assert (a, b) == (0, 8)
+    assert arena.allocate(1) is None
+    arena.release(a, 8)
+    arena.release(b, 8)
+    assert arena.free == [[0, 16]]
+    assert arena.allocate(16) == 0
+
+
+def test_string_cache_evicts_least_recently_used():
+    # Room for 32 vertices
+    cache = StringCache(32 * 16)
+    cache.put("a", [run(12, 1.0)])
+    cache.put("b", [run(12, 2.0)])
+    assert cache.get("a") is not None
+    cache.put("c", [run(12, 3.0)])
+
+    assert cache.get("b") is None
+    texture, count, vertices, texCoords = cache.get("a")[0]
+    assert count == 12 and vertices[0, 0] == 1.0 and texCoords[0, 0] == 2.0
+    assert cache.get("c")[0][2][0, 0] == 3.0
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.used == 24 * 16
+
+
+def test_distance_field_is_signed_around_the_outline():
+    coverage = numpy.zeros((40, 30))
+    coverage[5:35, 5:25] = 1.0
+    coverage[5:35, 4] = 0.5
+    field = distanceField(coverage, spread=4)
+
+    assert field.shape == (48, 38)
+    row = field[4 + 20]
+    assert row[4 + 4] == 128
+    assert row[4 + 15] == 255
+    assert row[0] == 0
+    # Values fall off monotonically moving away from the glyph
+    assert list(row[:4 + 4]) == sorted(row[:4 + 4])
+
+
+def old_wrap(font, text, width, scale, hide=0, hidestring=""):
+    # Word placement of the original per-frame Dialogs.wrapText loop
+    x, y = 0.0, 0.0
+    words = []
+    space = font.getStringSize(" ", scale=scale)[0]
+    hidew = font.getStringSize(hidestring, scale=scale)[0]
+    width = width - hidew
+    for n, word in enumerate(text.split(" ")):
+        w, h = font.getStringSize(word, scale=scale)
+        if x + w > width and hide:
+            word = hidestring
+        if (x + w > width and not hide) or word == "\n":
+            x = 0.0
+            y += h
+        if word == "\n":
+            continue
+        words.append((n, word, x, y))
+        if x + w > width and hide:
+            x += hidew + space
+            break
+        x += w + space
+    return words, (x - space, y)
+
+
+def test_text_layout_matches_word_by_word_wrapping():
+    from src.fretsonfire.Font import Font
+    font = Font("src/fretsonfire/data/default.ttf", 22)
+    texts = [
+        "Frets on Fire is a game of musical skill and fast fingers  with  double spaces ",
+        "First line \n second line \n \n after an empty line",
+        "Ünïcödé wörds and ☃ snowmen mixed in",
+        "",
+    ]
+    for text in texts:
+        for width, hide in [(0.8, 0), (0.3, 0), (0.3, 1), (0.01, 0)]:
+            layout = font.layoutText(text, width, scale=0.002, hide=hide, hideString="...")
+            words, end = old_wrap(font, text, width, 0.002, hide, "...")
+            assert layout.words == words
+            assert layout.end == end
+            assert font.layoutText(text, width, scale=0.002, hide=hide, hideString="...") is layout
+
+    long = "The quick brown fox jumps over the lazy dog " * 3
+    w, h = font.getStringSize(long)
+    assert abs(w - sum(font.getStringSize(ch)[0] for ch in long)) < 1e-9
+    assert h == max(font.getStringSize(ch)[1] for ch in long)
+
+
+class FakePage(object):
+    def __init__(self, name):
+        self.name = name
+
+    def bind(self):
+        FakeGL.current.calls.append(("bind", self.name))
+
+
+class FakeGL(object):
+    """Records the GL calls made while drawing text."""
+    current = None
+    NAMES = ["glGenBuffers", "glBindBuffer", "glBufferData", "glPushAttrib", "glPopAttrib",
+             "glPushClientAttrib", "glPopClientAttrib", "glMatrixMode", "glPushMatrix", "glPopMatrix",
+             "glLoadIdentity", "glTranslatef", "glEnable", "glDisable", "glEnableClientState",
+             "glDisableClientState", "glVertexPointer", "glTexCoordPointer", "glColorPointer",
+             "glColor4f", "glDrawArrays"]
+
+    def __init__(self, monkeypatch):
+        self.calls = []
+        FakeGL.current = self
+        for name in self.NAMES:
+            monkeypatch.setattr(Font_module, name, self._recorder(name))
+        monkeypatch.setattr(Font_module, "glGetFloatv", self.glGetFloatv)
+        monkeypatch.setattr(Font_module.TextBatch, "buffer", 0)
+
+    def _recorder(self, name):
+        def call(*args):
+            self.calls.append((name,) + args)
+            return 1
+        return call
+
+    def glGetFloatv(self, name):
+        if name == Font_module.GL_MODELVIEW_MATRIX:
+            # Translated by (10, 20)
+            matrix = numpy.identity(4, numpy.float32)
+            matrix[3, 0:2] = (10, 20)
+            return matrix
+        return numpy.array([1, .5, .25, 1], numpy.float32)
+
+    def draws(self):
+        return [call for call in self.calls if call[0] in ("bind", "glDrawArrays")]
+
+
+class FakeFont(object):
+    """Lays out each character as a unit quad on page a, or page b for digits."""
+    pages = {"a": FakePage("a"), "b": FakePage("b")}
+
+    def _layoutString(self, text, direction, scale):
+        runs = []
+        for i, ch in enumerate(text):
+            page = self.pages["b" if ch.isdigit() else "a"]
+            vertices = numpy.array([(i, 0), (i + 1, 0), (i + 1, 1), (i, 1)], numpy.float32) * scale
+            runs.append((page, 4, vertices, numpy.zeros((4, 2), numpy.float32)))
+        return runs
+
+
+def test_batch_queues_transformed_geometry_per_page(monkeypatch):
+    FakeGL(monkeypatch)
+    batch = Font_module.TextBatch()
+    batch.add(FakeFont(), "a1", (1, 2), (1, 0), 1.0, (1, 0, 0, 1), outlineColor=(0, 0, 0, 1), outlineOffset=(.5, .5))
+
+    a, b = FakeFont.pages["a"], FakeFont.pages["b"]
+    assert list(batch.pages) == [a, b]
+    outline, text = batch.pages[a]
+    assert outline[0].tolist() == [11.5, 22.5, 0, 0, 0, 0, 0, 0, 1]
+    assert text[:, 0:3].tolist() == [[11, 22, 0], [12, 22, 0], [12, 23, 0], [11, 23, 0]]
+    assert (text[:, 5:9] == (1, 0, 0, 1)).all()
+    assert batch.pages[b][1][0, 0:2].tolist() == [12, 22]
+
+
+def test_batch_draws_each_page_once(monkeypatch):
+    gl = FakeGL(monkeypatch)
+    font = FakeFont()
+    with Font_module.TextBatch() as batch:
+        batch.add(font, "ab1", (0, 0), (1, 0), 1.0, (1, 1, 1, 1))
+        batch.add(font, "2c", (0, 1), (1, 0), 1.0, (1, 1, 1, 1))
+        assert gl.draws() == []
+
+    quads = Font_module.GL_QUADS
+    assert gl.draws() == [("bind", "a"), ("glDrawArrays", quads, 0, 12),
+                          ("bind", "b"), ("glDrawArrays", quads, 12, 8)]
+    assert batch.pages == {}
+
+
+def test_single_strings_are_drawn_without_a_batch(monkeypatch):
+    gl = FakeGL(monkeypatch)
+    font = Font_module.Font.__new__(Font_module.Font)
+    font.reversed = False
+    font.outline = False
+    font.scale = 1.0
+    font._layoutString = FakeFont()._layoutString
+
+    font.render("a1", (0, 0))
+    assert not any(call[0] == "glBufferData" for call in gl.calls)
+    quads = Font_module.GL_QUADS
+    assert gl.draws() == [("bind", "a"), ("glDrawArrays", quads, 0, 4),
+                          ("bind", "b"), ("glDrawArrays", quads, 0, 4)]
@@ -0,0 +1,36 @@
+"""GL resource registry tests using fake deleters instead of OpenGL."""
+from src.fretsonfire import GLResource
+
+
+def make_registry(deleted):
+    deleters = {
+        GLResource.TEXTURE: lambda handle: deleted.append(("texture", handle)),
+        GLResource.LIST: lambda handle: deleted.append(("list", handle)),
+    }
+    return GLResource.GLResourceRegistry(deleters)
+
+
+def test_usage_is_reported_per_owner():
+    registry = make_registry([])
+    registry.register(GLResource.TEXTURE, 1, "Font", 4096)
+    registry.register(GLResource.TEXTURE, 2, "Svg", 100)
+    registry.register(GLResource.LIST, 1, "Mesh", 64)
+    registry.resize(GLResource.TEXTURE, 2, 8192)
+
+    assert registry.usage() == [("Svg", 1, 8192), ("Font", 1, 4096), ("Mesh", 1, 64)]
+    assert registry.totalSize() == 8192 + 4096 + 64
+
+
+def test_drain_respects_budget():
+    deleted = []
+    registry = make_registry(deleted)
+    for handle in range(5):
+        registry.register(GLResource.TEXTURE, handle, "Texture", 16)
+        registry.release(GLResource.TEXTURE, handle)
+    registry.release(GLResource.TEXTURE, 3)
+
+    assert registry.usage() == []
+    assert registry.drain(2) == 2
+    assert registry.pendingCount() == 3
+    assert registry.drain() == 3
+    assert deleted == [("texture", handle) for handle in range(5)]
@@ -0,0 +1,46 @@
+"""Label texture cache tests with fake decoding and uploads."""
+import time
+
+from src.fretsonfire.LabelCache import LabelCache
+
+
+def decode(fileName):
+    if fileName == "missing.png":
+        return None
+    return (4, 4), b"\0" * 64, 0, 4
+
+
+def run_until_idle(cache):
+    deadline = time.time() + 5
+    while cache.pending and time.time() < deadline:
+        cache.run()
+        time.sleep(0.001)
+
+
+def test_labels_are_decoded_and_uploaded_in_background():
+    uploads = []
+    cache = LabelCache(1024, uploadsPerFrame=1, decode=decode, upload=lambda d: uploads.append(d) or len(uploads))
+
+    assert cache.get("a.png") is None
+    cache.prefetch(["b.png", "missing.png"])
+    run_until_idle(cache)
+
+    assert cache.get("a.png") is not None
+    assert cache.get("b.png") is not None
+    assert cache.get("missing.png") is None
+    assert len(uploads) == 2
+    cache.close()
+
+
+def test_least_recently_used_labels_are_evicted():
+    # Each label takes 4 * 4 * 4 * 4 // 3 = 85 bytes
+    cache = LabelCache(200, uploadsPerFrame=10, decode=decode, upload=lambda d: object())
+    cache.prefetch(["a.png", "b.png"])
+    run_until_idle(cache)
+    cache.get("a.png")
+    cache.prefetch(["c.png"])
+    run_until_idle(cache)
+
+    assert list(cache.entries) == ["a.png", "c.png"]
+    assert cache.size == 170
+    cache.close()
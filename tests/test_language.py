@@ -0,0 +1,20 @@
+"""Translation helper tests."""
+from src.fretsonfire import Language
+
+
+class FakeCatalog:
+    _catalog = {"": "Content-Type: text/plain", "Yes": "Kyllä", "No": "Ei"}
+
+
+def test_catalog_characters(monkeypatch):
+    monkeypatch.setattr(Language, "language", "Suomi")
+    monkeypatch.setattr(Language, "catalog", FakeCatalog(), raising=False)
+    characters = Language.getCatalogCharacters()
+    assert "ä" in characters and "K" in characters
+    assert "C" not in characters
+    assert len(characters) == len(set(characters))
+
+
+def test_no_catalog_characters_without_language(monkeypatch):
+    monkeypatch.setattr(Language, "language", None)
+    assert Language.getCatalogCharacters() == ""
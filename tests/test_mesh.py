@@ -0,0 +1,76 @@
+"""Compiled mesh and transformation tests that avoid OpenGL rendering."""
+import io
+import os
+
+import numpy
+
+from src.fretsonfire import Collada
+from src.fretsonfire.Mesh import MeshData, loadMeshData, transformMatrix
+
+CUBE = "src/fretsonfire/data/cube.dae"
+
+
+def test_polygons_are_flattened_into_triangles():
+    doc = Collada.DaeDocument()
+    doc.LoadDocumentFromFile(CUBE)
+    data = MeshData.fromDocument(doc)
+
+    vertices, normals, texcoords = data.geometries["Cube"]
+    # Six quads make twelve triangles
+    assert vertices.shape == (36, 3)
+    assert normals.shape == (36, 3)
+    assert numpy.allclose(numpy.abs(vertices), 1.0)
+    assert numpy.allclose((normals ** 2).sum(axis=1), 1.0, atol=1e-4)
+    assert texcoords.shape == (36, 2)
+    assert [name for name, transforms, geoms in data.nodes if geoms] == ["Cube"]
+
+
+def test_compiled_meshes_are_reused(tmp_path):
+    cacheFileName = str(tmp_path / "cube")
+    first = loadMeshData(CUBE, cacheFileName)
+    assert (tmp_path / "cube.json").exists()
+
+    with open(CUBE, "rb") as f:
+        second = loadMeshData(io.BytesIO(f.read()), cacheFileName)
+    assert isinstance(second.geometries["Cube"][0], numpy.memmap)
+    for a, b in zip(first.geometries["Cube"], second.geometries["Cube"]):
+        assert (a is None and b is None) or numpy.array_equal(a, b)
+    assert second.nodes == first.nodes
+    assert second.lights == first.lights
+
+
+def test_stale_compiled_meshes_are_removed(tmp_path, monkeypatch):
+    from src.fretsonfire import Mesh
+    monkeypatch.setattr(Mesh, "getWritableResourcePath", lambda: str(tmp_path))
+    prefix = os.path.basename(Mesh.getMeshCacheFile(CUBE, b"")).rsplit("-", 1)[0]
+    (tmp_path / "meshcache").mkdir()
+    (tmp_path / "meshcache" / (prefix + "-0123456789abcdef.json")).write_text("{}")
+    (tmp_path / "meshcache" / "other.dae_01234567-0123456789abcdef.json").write_text("{}")
+    loadMeshData(CUBE)
+
+    names = sorted(p.name for p in (tmp_path / "meshcache").iterdir())
+    assert len(names) == 3 and "other.dae_01234567-0123456789abcdef.json" in names
+    assert prefix + "-0123456789abcdef.json" not in names
+
+
+def test_meshes_with_the_same_name_keep_their_own_files(tmp_path, monkeypatch):
+    from src.fretsonfire import Mesh
+    monkeypatch.setattr(Mesh, "getWritableResourcePath", lambda: str(tmp_path / "cache"))
+    with open(CUBE, "rb") as f:
+        contents = f.read()
+    for directory in ["data", "mod"]:
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "cube.dae").write_bytes(contents + b"<!-- " + directory.encode("ascii") + b" -->")
+    loadMeshData(str(tmp_path / "data" / "cube.dae"))
+    loadMeshData(str(tmp_path / "mod" / "cube.dae"))
+
+    assert len(list((tmp_path / "cache" / "meshcache").glob("*.json"))) == 2
+
+
+def test_node_transformations_are_combined_like_opengl():
+    assert transformMatrix([("rotate", [0, 0, 1, 0]), ("scale", [1, 1, 1])]) is None
+
+    matrix = transformMatrix([("translate", [1, 2, 3]), ("rotate", [0, 0, 2, 90]), ("scale", [2, 2, 2])])
+    m = numpy.array(list(matrix)).reshape(4, 4).T
+    # Scaled, then rotated a quarter turn around z, then translated
+    assert numpy.allclose(m.dot([1, 0, 0, 1]), [1, 4, 3, 1])
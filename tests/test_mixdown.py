@@ -0,0 +1,31 @@
+"""Song track mixdown tests with the dummy audio driver."""
+import os
+
+from src.fretsonfire import Mixdown
+from tests.conftest import FREQUENCY, read_wave, write_constant_wave
+
+
+def test_tracks_are_mixed_into_a_cached_file(mixer, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    song_dir = tmp_path / "song"
+    song_dir.mkdir()
+    song = write_constant_wave(song_dir / "song.wav", 4000, FREQUENCY)
+    guitar = write_constant_wave(song_dir / "guitar.wav", 30000, FREQUENCY * 2)
+    tracks = [(song, 1.0), (guitar, 0.5)]
+
+    mixed = Mixdown.getMixdown(tracks)
+    samples = read_wave(mixed)
+    assert samples.shape == (FREQUENCY * 2, 2)
+    assert samples[0, 0] == 19000
+    assert samples[-1, 1] == 15000
+
+    # Full volume overflows and is clipped
+    loud = Mixdown.getMixdown([(song, 1.0), (guitar, 1.0)])
+    assert read_wave(loud)[0, 0] == 32767
+
+    # The mix is reused until a track changes
+    assert Mixdown.getMixdown(tracks) == mixed
+    os.utime(guitar, ns=(0, os.stat(guitar).st_mtime_ns + 1))
+    remixed = Mixdown.getMixdown(tracks)
+    assert remixed != mixed
+    assert os.listdir(os.path.dirname(mixed)) == [os.path.basename(remixed)]
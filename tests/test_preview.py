@@ -0,0 +1,70 @@
+"""Preview clip rendering tests with the dummy audio driver."""
+import numpy
+import pytest
+
+from src.fretsonfire import Audio
+from src.fretsonfire.Preview import PreviewClip, PreviewCache, renderPreview
+from tests.conftest import FREQUENCY, read_wave, write_constant_wave, write_wave
+
+
+def test_stems_are_mixed_with_their_volumes(mixer, tmp_path):
+    song = write_constant_wave(tmp_path / "song.wav", 1000, FREQUENCY * 6)
+    guitar = write_constant_wave(tmp_path / "guitar.wav", 2000, FREQUENCY * 3)
+    clip = PreviewClip([(song, 1.0), (guitar, 0.5)], 1000, 4000)
+    renderPreview(clip, str(tmp_path / "clip.wav"), mixer)
+
+    samples = read_wave(tmp_path / "clip.wav")
+    assert samples.shape == (FREQUENCY * 4, 2)
+    # The guitar stem ends halfway through the clip
+    assert samples[FREQUENCY * 3 // 2, 0] == 2000
+    assert samples[FREQUENCY * 5 // 2, 0] == 1000
+    # The ends fade in and out
+    assert samples[0, 0] == 0 and samples[-1, 0] == 0
+
+
+def test_only_the_clip_window_is_decoded(mixer, tmp_path, monkeypatch):
+    # A stem at twice the mixer rate whose samples count the seconds
+    seconds = numpy.repeat(numpy.arange(10, dtype=numpy.int16) * 100, FREQUENCY * 2)
+    song = write_wave(tmp_path / "song.wav", numpy.stack([seconds, seconds], axis=1), FREQUENCY * 2)
+    reads = []
+    openDecoder = Audio.openDecoder
+
+    def record(fileName):
+        decoder = openDecoder(fileName)
+        read = decoder.read
+        decoder.read = lambda samples: reads.append(samples) or read(samples)
+        return decoder
+    monkeypatch.setattr(Audio, "openDecoder", record)
+
+    renderPreview(PreviewClip([(song, 1.0)], 4000, 3000), str(tmp_path / "clip.wav"), mixer)
+    assert sum(reads) <= FREQUENCY * 6 + 2
+    samples = read_wave(tmp_path / "clip.wav")
+    assert samples.shape == (FREQUENCY * 3, 2)
+    # Away from the fades the clip holds the fifth and sixth second
+    assert samples[FREQUENCY // 2, 0] == 400
+    assert samples[FREQUENCY * 3 // 2, 0] == 500
+
+
+def test_clips_are_rendered_once(mixer, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    song = write_constant_wave(tmp_path / "song.wav", 1000, FREQUENCY * 2)
+    renders = []
+
+    def render(clip, fileName, format):
+        renders.append(fileName)
+        renderPreview(clip, fileName, format)
+
+    cache = PreviewCache(render = render)
+    clip = PreviewClip([(song, 1.0)], 0, 1000)
+    cache.prefetch([clip])
+    sound = cache.load(clip)
+    assert sound.sound.get_length() == pytest.approx(1.0)
+    cache.load(clip)
+    assert len(renders) == 1
+
+    # Changing the clip replaces the old file
+    other = PreviewClip([(song, 1.0)], 0, 500)
+    cache.load(other)
+    assert len(renders) == 2
+    assert not (tmp_path / renders[0]).exists()
+    cache.close()
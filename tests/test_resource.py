@@ -1,8 +1,10 @@
 """Resource loader tests that avoid OpenGL dependencies."""
+import os
+
 import pytest
 
 from src.fretsonfire.Engine import Engine
-from src.fretsonfire.Resource import Resource
+from src.fretsonfire.Resource import ArchiveMember, DataArchive, DataOverlay, Resource, createDataArchive
 
 
 def _run_until(engine, condition, limit=1000):
@@ -81,3 +83,113 @@ def test_onload_callback(engine, resource):
     _run_until(engine, lambda: holder.fuuba is not None)
     assert holder.fuuba == holder.quux == 0xDADA
 
+
+
+def test_data_overlay_priority_and_listing(tmp_path):
+    base = tmp_path / "data"
+    mod = tmp_path / "mod"
+    (base / "songs" / "a").mkdir(parents=True)
+    (mod / "songs" / "b").mkdir(parents=True)
+    (base / "theme.ini").write_text("base")
+    (mod / "theme.ini").write_text("mod")
+    (base / "songs" / "a" / "song.ini").write_text("")
+    (mod / "songs" / "b" / "song.ini").write_text("")
+
+    overlay = DataOverlay([str(mod), str(base)])
+
+    assert overlay.find("theme.ini") == str(mod / "theme.ini")
+    assert overlay.listdir("songs") == ["a", "b"]
+    assert overlay.isfile("songs", "a", "song.ini")
+    assert overlay.isdir("songs", "b")
+    assert overlay.find("missing.ini") is None
+    with overlay.open("theme.ini") as f:
+        assert f.read() == b"mod"
+
+
+def test_data_overlay_manifest_is_reused_until_root_changes(tmp_path, monkeypatch):
+    root = tmp_path / "data"
+    root.mkdir()
+    (root / "a.txt").write_text("")
+    manifest = str(tmp_path / "overlay.json")
+
+    DataOverlay([str(root)], manifest)
+
+    scans = []
+    original = DataOverlay._scanRoot
+    monkeypatch.setattr(DataOverlay, "_scanRoot", lambda self, r: scans.append(r) or original(self, r))
+
+    overlay = DataOverlay([str(root)], manifest)
+    assert scans == []
+    assert overlay.isfile("a.txt")
+
+    (root / "b.txt").write_text("")
+    os.utime(root, ns=(0, 0))
+    overlay = DataOverlay([str(root)], manifest)
+    assert scans == [str(root)]
+    assert overlay.isfile("b.txt")
+
+
+def test_data_archive_round_trip(tmp_path):
+    root = tmp_path / "data"
+    (root / "songs" / "a").mkdir(parents=True)
+    (root / "star.svg").write_bytes(b"<svg/>")
+    (root / "in.ogg").write_bytes(b"OggS" * 10)
+    (root / "theme.ini").write_text("")
+    (root / "songs" / "a" / "song.ogg").write_bytes(b"song")
+
+    archive_path = tmp_path / "data.pak"
+    assert createDataArchive(str(root), str(archive_path)) == 2
+
+    archive = DataArchive(str(archive_path))
+    assert sorted(archive.names()) == ["in.ogg", "star.svg"]
+    buffer = archive.getBuffer("star.svg")
+    assert isinstance(buffer, memoryview)
+    assert bytes(buffer) == b"<svg/>"
+
+    member = archive.open("in.ogg")
+    assert member.read(4) == b"OggS"
+    member.seek(-4, os.SEEK_END)
+    assert member.read() == b"OggS"
+
+
+def test_resource_prefers_archive_over_loose_files_next_to_it(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    root = tmp_path / "data"
+    mod = tmp_path / "mod"
+    root.mkdir()
+    mod.mkdir()
+    (root / "a.svg").write_bytes(b"packed")
+    (root / "b.svg").write_bytes(b"packed")
+    createDataArchive(str(root), str(root / "data.pak"))
+    (root / "a.svg").write_bytes(b"loose")
+    (root / "c.svg").write_bytes(b"loose")
+
+    resource = Resource(str(root))
+    assert isinstance(resource.dataSource("a.svg"), ArchiveMember)
+    assert bytes(resource.getData("a.svg")) == b"packed"
+    assert resource.dataSource("c.svg") == str(root / "c.svg")
+    assert bytes(resource.getData("c.svg")) == b"loose"
+
+    # Mods still override the archive
+    (mod / "b.svg").write_bytes(b"mod")
+    resource.addDataPath(str(mod))
+    assert resource.dataSource("b.svg") == str(mod / "b.svg")
+    assert bytes(resource.getData("b.svg")) == b"mod"
+    assert bytes(resource.getData("a.svg")) == b"packed"
+
+
+def test_resource_forgets_files_removed_after_indexing(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    mod = tmp_path / "mod"
+    base = tmp_path / "data"
+    mod.mkdir()
+    base.mkdir()
+    (mod / "theme.ini").write_text("mod")
+    (base / "theme.ini").write_text("base")
+
+    resource = Resource(str(base))
+    resource.addDataPath(str(mod))
+    assert resource.fileName("theme.ini") == str(mod / "theme.ini")
+
+    (mod / "theme.ini").unlink()
+    assert resource.fileName("theme.ini") == str(base / "theme.ini")
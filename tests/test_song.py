@@ -48,6 +48,9 @@ class DummyStreamingSound(DummyMusic):
         super().__init__(filename)
         self.channel = channel
 
+    def prepare(self):
+        return None
+
 
 class DummyChannel:
     def __init__(self, index):
@@ -134,3 +137,72 @@ def test_song_save_preserves_notes(song_module, tmp_path):
         assert abs(time1 - time2) < 2
         assert abs(note1.length - note2.length) < 2
         assert note1.number == note2.number
+
+
+def write_song_info(song_dir: Path, name, artist, last_played=0, notes=False):
+    song_dir.mkdir(parents=True)
+    (song_dir / "song.ini").write_text(
+        "[song]\nname = %s\nartist = %s\nlastplayed = %d\n" % (name, artist, last_played))
+    if notes:
+        (song_dir / "notes.mid").write_bytes((SONG_DIR / "notes.mid").read_bytes())
+    return str(song_dir / "song.ini")
+
+
+def test_song_orders_are_cached(song_module, tmp_path, monkeypatch):
+    files = [
+        write_song_info(tmp_path / "a", "Zebra", "Abba", last_played=10),
+        write_song_info(tmp_path / "b", "apple", "Queen", last_played=30),
+        write_song_info(tmp_path / "c", "Mango", "Beatles", notes=True),
+    ]
+    cache = str(tmp_path / "cache" / "songs.json")
+
+    def names(orders, order):
+        return [song.name for song in orders.getSongs(order)]
+
+    orders = song_module.SongOrders([song_module.SongInfo(f) for f in files], cache)
+    assert names(orders, song_module.SORT_BY_NAME) == ["apple", "Mango", "Zebra"]
+    assert names(orders, song_module.SORT_BY_ARTIST) == ["Zebra", "Mango", "apple"]
+    assert names(orders, song_module.SORT_BY_RECENT) == ["apple", "Zebra", "Mango"]
+    # Songs without notes offer every difficulty
+    assert names(orders, song_module.SORT_BY_DIFFICULTIES)[-1] == "Mango"
+    difficulties = [song.difficulties for song in orders.songs]
+
+    # The note files aren't scanned again while the songs don't change
+    def fail(self):
+        raise AssertionError("song was read again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(song_module.SongInfo, "getRecord", fail)
+        cached = song_module.SongOrders([song_module.SongInfo(f) for f in files], cache)
+    assert cached.orders == orders.orders
+    assert [song.difficulties for song in cached.songs] == difficulties
+
+    # Only the changed song is read again
+    info = song_module.SongInfo(files[2])
+    info.lastPlayed = 50
+    info.save()
+    os.utime(files[2], ns=(0, os.stat(files[2]).st_mtime_ns + 1))
+    read = []
+    getRecord = song_module.SongInfo.getRecord
+    monkeypatch.setattr(song_module.SongInfo, "getRecord", lambda self: read.append(self.name) or getRecord(self))
+    updated = song_module.SongOrders([song_module.SongInfo(f) for f in files], cache)
+    assert read == ["Mango"]
+    assert names(updated, song_module.SORT_BY_RECENT) == ["Mango", "apple", "Zebra"]
+
+
+def test_library_info_comes_from_the_root_that_has_it(song_module, tmp_path):
+    from src.fretsonfire.Resource import Resource
+
+    base = tmp_path / "data"
+    mod = tmp_path / "mod"
+    write_song_info(base / "songs" / "rock" / "a", "A", "Abba")
+    (base / "songs" / "rock" / "library.ini").write_text("[library]\nname = Classic Rock\n")
+    write_song_info(mod / "songs" / "rock" / "b", "B", "Queen")
+
+    class Engine:
+        resource = Resource(str(base))
+    Engine.resource.addDataPath(str(mod))
+
+    libraries = song_module.getAvailableLibraries(Engine())
+    assert [library.name for library in libraries] == ["Classic Rock"]
+    assert libraries[0].fileName == str(base / "songs" / "rock" / "library.ini")
@@ -0,0 +1,71 @@
+"""Song chooser list layout and search tests."""
+import math
+import random
+
+from src.fretsonfire.SongList import SearchIndex, SongList
+
+
+def naive_centers(songList, collapsed, expanded):
+    # Walk every shown item like the original per-frame layout loop
+    y, centers = 0.0, {}
+    for i in songList.indices:
+        c = math.sin(songList.getAngle(i) * math.pi / 180)
+        h = c * expanded[i] + (1 - c) * collapsed[i]
+        centers[int(i)] = y + h / 2
+        y += h
+    return centers
+
+
+def test_offsets_and_visible_rows_match_a_full_walk():
+    random.seed(3)
+    collapsed = [random.choice([.8, 1.2]) for i in range(500)]
+    expanded = [4.0] * 500
+    songList = SongList(collapsed, expanded)
+    songList.setFilter([i for i in range(500) if i % 3])
+
+    for selected in (10, 11, 250, 499, 253):
+        songList.select(selected)
+        songList.run(60)
+        centers = naive_centers(songList, collapsed, expanded)
+        for i in (selected, 1, 497):
+            assert abs(songList.getCenter(i) - centers[i]) < 1e-9
+
+        camera = centers[selected]
+        rows = songList.getVisibleRows(camera - 7.2, camera + 7.2)
+        shown = set(int(songList.indices[row]) for row in rows)
+        assert set(i for i, c in centers.items() if abs(c - camera) < 7.2) <= shown
+        assert len(shown) < 30
+
+
+def test_only_animating_items_are_tracked():
+    songList = SongList([1.0] * 1000, [4.0] * 1000)
+    songList.select(5)
+    songList.run(200)
+    assert songList.getAngle(5) == 90
+    songList.select(6)
+    songList.run(100)
+    assert set(songList.angles) == {5, 6}
+    songList.run(100)
+    assert set(songList.angles) == {6}
+    assert songList.getRow(6) == 6
+    songList.setFilter([6, 2])
+    assert songList.getRow(2) == 1 and songList.getRow(5) == -1
+
+
+def test_search_ignores_case_and_accents():
+    index = SearchIndex([["Crazy In Love", "Beyoncé"], ["Déjà Vu", "Beyonce"], ["Songs"]])
+    assert index.search("BEYONCE").tolist() == [0, 1]
+    assert index.search("deja").tolist() == [1]
+    assert index.search("ng").tolist() == [2]
+    assert index.search("") is None
+
+
+def test_typing_narrows_previous_results():
+    random.seed(5)
+    names = ["".join(random.choice("abcde ") for i in range(12)) for j in range(300)]
+    index = SearchIndex([[name, "artist"] for name in names])
+
+    for query in ("a", "ab", "abc", "abcd", "ab", "abe", "ea", "art"):
+        expected = [i for i, name in enumerate(names) if query in name or query in "artist"]
+        assert index.search(query).tolist() == expected
+    assert [q for q, results in index.history] == ["art"]
@@ -0,0 +1,36 @@
+"""Sound bank tests with the dummy audio driver."""
+import numpy
+import pytest
+
+from src.fretsonfire.SoundBank import SoundBank
+from tests.conftest import FREQUENCY, write_constant_wave
+
+
+def test_effects_share_one_cached_buffer(mixer, tmp_path, monkeypatch):
+    sources = [("a", write_constant_wave(tmp_path / "a.wav", 1, 1000)),
+               ("b", write_constant_wave(tmp_path / "b.wav", 2, 3000))]
+    cache = str(tmp_path / "cache" / "effects")
+    bank = SoundBank(sources, cache)
+    assert bank.samples.shape == (4000, 2)
+    assert numpy.all(bank.getSamples("b") == 2)
+    assert bank.get("a").sound.get_length() == pytest.approx(1000.0 / FREQUENCY)
+
+    # The second bank is read from the cache without decoding
+    monkeypatch.setattr("src.fretsonfire.SoundBank._decodeSound", None)
+    cached = SoundBank(sources, cache)
+    assert isinstance(cached.samples, numpy.memmap)
+    assert list(cached.entries.items()) == list(bank.entries.items())
+    assert numpy.shares_memory(cached.getSamples("b"), cached.samples)
+
+
+def test_least_recently_used_sounds_are_dropped(mixer, tmp_path):
+    sources = [(name, write_constant_wave(tmp_path / (name + ".wav"), 0, 1000)) for name in "abc"]
+    # Each sound takes 1000 * 2 * 2 = 4000 bytes
+    bank = SoundBank(sources, budget=9000)
+    first = bank.get("a")
+    bank.get("b")
+    assert bank.get("a") is first
+    bank.get("c")
+    assert list(bank.sounds) == ["a", "c"]
+    assert bank.size == 8000
+    assert bank.getMemoryUsage() == 12000 + 8000
@@ -0,0 +1,164 @@
+"""SVG raster cache tests that avoid OpenGL dependencies."""
+import hashlib
+
+import numpy
+
+from src.fretsonfire.Svg import SvgCache, SVG_CACHE_VERSION
+
+
+def test_cache_round_trip(tmp_path):
+    cache = SvgCache(str(tmp_path))
+    pixels = bytes(range(256)) * 4
+
+    assert cache.load("abc", 16, 16, 1.0) is None
+    cache.store("abc", 16, 16, 1.0, (16, 16), pixels)
+
+    size, levels = cache.load("abc", 16, 16, 1.0)
+    assert size == (16, 16)
+    assert len(levels) == 1
+    assert levels[0].tobytes() == pixels
+    assert cache.load("abc", 16, 16, 2.0) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_stores_mipmap_chain(tmp_path):
+    cache = SvgCache(str(tmp_path), mipmaps=True)
+    pixels = numpy.full((8, 4, 4), 200, numpy.uint8)
+
+    cache.store("def", 0, 0, 1.0, (4, 8), pixels.tobytes())
+
+    size, levels = cache.load("def", 0, 0, 1.0)
+    assert size == (4, 8)
+    assert [len(level) for level in levels] == [4 * 8 * 4, 2 * 4 * 4, 1 * 2 * 4, 1 * 1 * 4]
+    assert all((level == 200).all() for level in levels)
+
+
+def test_cache_ignores_truncated_entries(tmp_path):
+    cache = SvgCache(str(tmp_path))
+    cache.store("ghi", 4, 4, 1.0, (4, 4), bytes(64))
+    with open(cache._fileName("ghi", 4, 4, 1.0), "r+b") as entry:
+        entry.truncate(entry.seek(0, 2) - 1)
+
+    assert cache.load("ghi", 4, 4, 1.0) is None
+
+
+def test_cache_removes_earlier_versions_of_a_drawing(tmp_path):
+    cache = SvgCache(str(tmp_path))
+    cache.store("old", 4, 4, 1.0, (4, 4), bytes(64), "star.svg")
+    cache.store("old", 8, 8, 1.0, (8, 8), bytes(256), "star.svg")
+    cache.store("other", 4, 4, 1.0, (4, 4), bytes(64), "key.svg")
+    assert cache.load("old", 8, 8, 1.0, "star.svg") is not None
+
+    cache.store("new", 4, 4, 1.0, (4, 4), bytes(64), "star.svg")
+    assert cache.load("old", 4, 4, 1.0, "star.svg") is None
+    assert cache.load("old", 8, 8, 1.0, "star.svg") is None
+    assert cache.load("new", 4, 4, 1.0, "star.svg") is not None
+    assert cache.load("other", 4, 4, 1.0, "key.svg") is not None
+
+
+def test_cache_removes_entries_of_other_versions(tmp_path):
+    path = tmp_path / "svgcache"
+    path.mkdir()
+    (path / "abc-4x4-1.rgba").write_bytes(b"")
+    (path / ("inline-abc-4x4-1-v%d.rgba" % (SVG_CACHE_VERSION + 1))).write_bytes(b"")
+    cache = SvgCache(str(path))
+    cache.store("abc", 4, 4, 1.0, (4, 4), bytes(64))
+    assert sorted(p.name for p in path.iterdir()) == ["inline-abc-4x4-1-v%d.rgba" % SVG_CACHE_VERSION]
+
+
+class CachingContext(object):
+    cache = True
+
+
+def test_drawing_does_not_hold_a_view_of_its_source():
+    import io
+    from src.fretsonfire.Svg import SvgDrawing
+
+    source = io.BytesIO(b'<svg xmlns="http://www.w3.org/2000/svg" width="8" height="8"/>')
+    drawing = SvgDrawing(CachingContext(), source)
+    source.write(b" " * 4096)
+    assert drawing._svg_bytes.startswith(b"<svg")
+
+
+def test_drawing_parses_archived_svg_without_copying(tmp_path, monkeypatch):
+    import skia
+    from src.fretsonfire.Resource import DataArchive, createDataArchive
+    from src.fretsonfire.Svg import SvgDrawing
+
+    root = tmp_path / "data"
+    root.mkdir()
+    (root / "star.svg").write_bytes(b'<svg xmlns="http://www.w3.org/2000/svg" width="8" height="8"/>')
+    createDataArchive(str(root), str(tmp_path / "data.pak"))
+    archive = DataArchive(str(tmp_path / "data.pak"))
+
+    def copy(data):
+        raise AssertionError("archived SVG data was copied")
+    monkeypatch.setattr(skia.MemoryStream, "MakeCopy", copy)
+    drawing = SvgDrawing(RenderContext(1.0), archive.open("star.svg"))
+    assert isinstance(drawing._svg_bytes, memoryview)
+    assert drawing._intrinsic_size == (8, 8)
+    assert drawing._get_digest() == hashlib.sha1(archive.getBuffer("star.svg")).hexdigest()
+
+
+def test_malformed_cached_drawing_is_skipped_when_drawn(tmp_path):
+    import io
+    from src.fretsonfire.Svg import SvgDrawing
+
+    class Context(object):
+        cache = SvgCache(str(tmp_path / "svgcache"))
+
+        def _render_scale(self):
+            return 1.0
+
+    drawing = SvgDrawing(Context(), io.BytesIO(b"<svg"))
+    drawing.draw()
+    drawing.draw()
+    assert drawing.texture is None
+    assert drawing._failed
+
+
+class RenderContext(object):
+    cache = None
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def _render_scale(self):
+        return self.scale
+
+
+BAND_SVG = (b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 8 8">'
+            b'<rect x="0" y="0" width="8" height="2" fill="#ff0000"/></svg>')
+
+
+def render_with_pil(size):
+    """Rasterize like the original PNG encode and Texture.decodeImage path."""
+    import io
+    import skia
+    from PIL import Image
+    from src.fretsonfire.Texture import decodeImage
+
+    dom = skia.SVGDOM.MakeFromStream(skia.MemoryStream.MakeCopy(BAND_SVG))
+    dom.setContainerSize(skia.Size(float(size), float(size)))
+    surface = skia.Surface.MakeRasterN32Premul(size, size)
+    canvas = surface.getCanvas()
+    canvas.clear(skia.Color4f(0.0, 0.0, 0.0, 0.0))
+    dom.render(canvas)
+    image = Image.open(io.BytesIO(bytes(surface.makeImageSnapshot().encodeToData())))
+    return decodeImage(image.convert("RGBA"))[1]
+
+
+def test_rasterized_rows_match_the_pil_path():
+    import io
+    from src.fretsonfire.Svg import SvgDrawing
+
+    drawing = SvgDrawing(RenderContext(1.0), io.BytesIO(BAND_SVG))
+    pixels = drawing._rasterize(8, 8)
+    assert pixels.tobytes() == render_with_pil(8)
+    assert (pixels[0] == [255, 0, 0, 255]).all()
+    assert (pixels[7] == 0).all()
+
+    drawing = SvgDrawing(RenderContext(2.0), io.BytesIO(BAND_SVG))
+    pixels = drawing._rasterize(8, 8)
+    assert (pixels[0] == [255, 0, 0, 255]).all()
+    assert (pixels[7] == 0).all()
@@ -0,0 +1,124 @@
+"""Texture atlas packing and upload tests that avoid OpenGL dependencies."""
+import ctypes
+import random
+
+from src.fretsonfire import Texture as Texture_module
+from src.fretsonfire.Texture import SkylinePacker, Texture
+
+
+def overlaps(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def test_packed_rectangles_do_not_overlap():
+    random.seed(1)
+    packer = SkylinePacker(256, 256)
+    placed = []
+    for i in range(200):
+        w, h = random.randint(4, 40), random.randint(4, 40)
+        position = packer.insert(w, h)
+        if position is None:
+            continue
+        rect = (position[0], position[1], w, h)
+        assert rect[0] + w <= 256 and rect[1] + h <= 256
+        assert not any(overlaps(rect, other) for other in placed)
+        placed.append(rect)
+
+    assert packer.rectCount == len(placed)
+    assert packer.getOccupancy() > 0.6
+
+
+def test_row_slack_is_reused():
+    packer = SkylinePacker(100, 100)
+    assert packer.insert(50, 40) == (0, 0)
+    assert packer.insert(50, 10) == (50, 0)
+    # Fits on top of the short rectangle instead of starting a new row
+    assert packer.insert(50, 30) == (50, 10)
+    assert packer.insert(100, 70) is None
+
+
+def test_grow_keeps_existing_rectangles():
+    packer = SkylinePacker(32, 32)
+    assert packer.insert(32, 32) == (0, 0)
+    assert packer.insert(16, 16) is None
+    packer.grow(64, 64)
+    assert packer.insert(32, 32) == (32, 0)
+    assert packer.insert(64, 32) == (0, 32)
+
+
+class FakeGL(object):
+    """Records the pixel upload calls made by Texture."""
+    def __init__(self, monkeypatch, mapped=True, unmapped=True):
+        self.calls = []
+        self.memory = ctypes.create_string_buffer(1024)
+        self.mapped = mapped
+        self.unmapped = unmapped
+        for name in ["glGenBuffers", "glBindBuffer", "glBufferData", "glMapBufferRange",
+                     "glUnmapBuffer", "glTexImage2D"]:
+            monkeypatch.setattr(Texture_module, name, getattr(self, name))
+        monkeypatch.setattr(Texture, "uploadBuffer", 0)
+        monkeypatch.setattr(Texture, "uploadBufferSize", 0)
+
+    def glGenBuffers(self, n):
+        return 7
+
+    def glBindBuffer(self, target, buffer):
+        self.calls.append(("bind", buffer))
+
+    def glBufferData(self, target, size, data, usage):
+        self.calls.append(("allocate", size))
+
+    def glMapBufferRange(self, target, offset, length, access):
+        self.calls.append(("map", length))
+        return ctypes.addressof(self.memory) if self.mapped else None
+
+    def glUnmapBuffer(self, target):
+        self.calls.append(("unmap",))
+        return self.unmapped
+
+    def glTexImage2D(self, target, level, components, w, h, border, format, type, data):
+        self.calls.append(("upload", None if data is None else bytes(data)))
+
+
+def make_texture():
+    texture = Texture.__new__(Texture)
+    texture.glTarget = Texture_module.GL_TEXTURE_2D
+    return texture
+
+
+def test_pixels_are_uploaded_through_a_mapped_buffer(monkeypatch):
+    gl = FakeGL(monkeypatch)
+    monkeypatch.setattr(Texture, "pboSupported", True)
+    pixels = bytes(range(64))
+
+    make_texture()._uploadLevel0(4, 4, pixels, Texture_module.GL_RGBA, 4)
+    make_texture()._uploadLevel0(2, 2, pixels[:16], Texture_module.GL_RGBA, 4)
+
+    assert gl.calls == [("bind", 7), ("allocate", 64), ("map", 64), ("unmap",), ("upload", None), ("bind", 0),
+                        ("bind", 7), ("map", 16), ("unmap",), ("upload", None), ("bind", 0)]
+    assert gl.memory.raw[:16] == pixels[:16]
+
+
+def test_upload_falls_back_to_direct_transfer(monkeypatch):
+    pixels = bytes(range(16))
+    for pboSupported, mapped, unmapped in [(False, True, True), (True, False, True), (True, True, False)]:
+        with monkeypatch.context() as m:
+            gl = FakeGL(m, mapped, unmapped)
+            m.setattr(Texture, "pboSupported", pboSupported)
+            make_texture()._uploadLevel0(2, 2, pixels, Texture_module.GL_RGBA, 4)
+            assert gl.calls[-1] == ("upload", pixels)
+            assert ("bind", 7) not in gl.calls or gl.calls[-2] == ("bind", 0)
+
+
+def test_old_drivers_do_not_use_pixel_buffers(monkeypatch):
+    monkeypatch.setattr(Texture, "npotSupported", None)
+    monkeypatch.setattr(Texture, "pboSupported", None)
+    monkeypatch.setattr(Texture, "generateMipmap", None)
+    monkeypatch.setattr(Texture_module, "_glVersion", lambda: (2, 1))
+    monkeypatch.setattr(Texture_module.gl_extensions, "hasGLExtension",
+                        lambda name: name == "GL_ARB_pixel_buffer_object")
+    monkeypatch.setattr(Texture_module.Config, "get", lambda section, option: True)
+
+    make_texture()._checkCapabilities()
+    assert Texture.pboSupported is False
+    assert Texture.generateMipmap is False
@@ -0,0 +1,60 @@
+"""Pack the Frets on Fire data directory into a memory-mapped archive."""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from fretsonfire import Log, Version
+from fretsonfire.Resource import ARCHIVE_FILE_NAME, ARCHIVE_PATTERNS, createDataArchive
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Pack the data files that are loaded at startup into a single "
+            "archive that the game maps into memory instead of opening each "
+            "file separately."
+        )
+    )
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=Path(Version.dataPath()),
+        help="Data directory to pack (default: the installed data directory)",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help=f"Archive to write (default: DATA/{ARCHIVE_FILE_NAME})",
+    )
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        default=None,
+        help="File name pattern to pack; may be repeated (default: %s)" % " ".join(ARCHIVE_PATTERNS),
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    Log.set_quiet(True)
+
+    output = args.output or args.data / ARCHIVE_FILE_NAME
+    patterns = args.pattern or ARCHIVE_PATTERNS
+
+    try:
+        count = createDataArchive(os.fspath(args.data), os.fspath(output), patterns)
+    except OSError as exc:
+        print(f"Failed to pack data: {exc}", file=sys.stderr)
+        return 1
+
+    print(f"Packed {count} files into {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())